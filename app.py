@@ -9,11 +9,38 @@ import streamlit as st
 import re
 from datetime import datetime, date
 from modules import display_my_custom_component, display_post, display_genai_advice, display_activity_summary, display_recent_workouts, display_sensor_data, display_user_profile, friend_request_ui, create_leaderboard_ui, goal_creation_ui, goal_plan_display_ui, goal_progress_tracking_ui
-from data_fetcher import get_user_posts, get_genai_advice, get_user_profile, get_user_sensor_data, get_user_workouts, add_post_to_database, get_friend_data, send_friend_request, remove_friend, get_leaderboard_data, leaderboard_scoring_logic, save_goal, ai_call_for_planner, mark_task, get_progress_data
+from data_fetcher import get_user_posts, get_feed, get_genai_advice, get_user_profile, get_user_sensor_frame, get_user_workouts_frame, get_pending_requests, add_post_to_database, get_friend_data, send_friend_request, remove_friend, get_leaderboard_data, get_windowed_leaderboard, leaderboard_scoring_logic, save_goal, ai_call_for_planner, mark_task, get_progress_data
 
 # New imports
 from datetime import datetime
 from google.cloud import bigquery
+import os
+import uuid
+from data_context import DataContext
+from write_queue import write_queue
+from image_validation import validate_images
+from thumbnails import thumbnail, thumbnail_cache
+from llm_gateway import llm
+from plan_stream import plan_stream_metrics
+from blob_store import get_blob_store
+
+def _new_click(button):
+    """on_click handler giving every click of a share button its own token."""
+    st.session_state[f"{button}_click"] = uuid.uuid4().hex
+
+
+def share_button(label, key, user_id, post_content, success_message="Post shared successfully!"):
+    """Shows a share button that posts post_content when clicked.
+
+    The post is deduplicated per click rather than per content, so a rerun
+    of the same click posts once while sharing the same text again posts again.
+    """
+    if st.button(label, key=key, on_click=_new_click, args=(key,)):
+        click = st.session_state[f"{key}_click"]
+        if add_post_to_database(user_id, post_content, idempotency_key=f"post:{user_id}:{click}"):
+            st.success(success_message)
+        else:
+            st.error("Your post couldn't be shared, please try again.")
 
 # Created tabs and display post code by Copilot using the following prompt: "create a streamlit app that showcases a post. that post will have a timestamp, post_image, username, content (of the post), and user_image."
 def display_app_page():
@@ -23,6 +50,26 @@ def display_app_page():
     tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10 = st.tabs(["Home", "GenAI Advice", "Activity Summary", "Recent Workouts", "Sensor Data", "Community", "Activity Page", "User Profile", "Friends-Only Leaderboard", "Planner"])
     userId = None # Example data
 
+    # Every read of this run goes through ctx, so each one happens once
+    ctx = DataContext()
+
+    # Start every independent read of this page at once; each tab then waits
+    # only for its own data, and a slow query only degrades its own tab
+    ctx.prefetch(
+        (get_user_posts, ('user3',)),
+        (get_genai_advice, ('user3',), 30),
+        (get_user_workouts_frame, ('user1',)),
+        (get_user_sensor_frame, ('user1', 'workout1')),
+        (get_user_posts, ('user1',)),
+        (get_genai_advice, ('user1',), 30),
+        (get_user_profile, ('user1',)),
+        (get_windowed_leaderboard, ('user1', 'all')),
+        (get_pending_requests, ('user1',)),
+    )
+    # The feed's first page is only needed until the session holds it
+    if st.session_state.get('feed') is None:
+        ctx.prefetch((get_feed, ('user1',)))
+
     with tab1:
         # An example of displaying a custom component called "my_custom_component"
         value = st.text_input('Enter your name')
@@ -30,35 +77,47 @@ def display_app_page():
 
         # Get data
         userId = 'user3'
-        posts = get_user_posts(userId)  # Fetch a list of posts
+        posts = ctx.fetch(get_user_posts, 'user3', default=[])  # Fetch a list of posts
+        validate_images(post["image"] for post in posts)  # Check every post image at once
         for post in posts: # Show every post
             display_post(post["username"], post["user_image"], post["timestamp"], post["content"], post["image"])
         
     with tab2:
-        advice = get_genai_advice(userId)
+        advice = ctx.fetch(get_genai_advice, 'user3')
         #call method in modules that displays the genAI advice
-        display_genai_advice(advice['timestamp'], advice['content'], advice['image'])
+        if advice:
+            display_genai_advice(advice['timestamp'], advice['content'], advice['image'])
+        else:
+            st.warning("GenAI advice is unavailable right now.")
     
     with tab3:
         # Fetch user workouts and display activity summary
         userId = 'user1'
-        workouts = get_user_workouts(userId)  # Fetch workouts for the user
-        display_activity_summary(workouts)  # Pass workouts to display activity summary
+        workouts = ctx.fetch(get_user_workouts_frame, 'user1')  # Fetch workouts for the user
+        if workouts is not None:
+            display_activity_summary(workouts)  # Pass workouts to display activity summary
+        else:
+            st.warning("Workouts are unavailable right now.")
 
     with tab4:
         userId = 'user1'
-        workouts = get_user_workouts(userId)
+        workouts = ctx.fetch(get_user_workouts_frame, 'user1')
         display_recent_workouts(workouts)
 
     with tab5:
         userId = 'user1'
-        sensor_data = get_user_sensor_data(userId, 'workout1')
+        sensor_data = ctx.fetch(get_user_sensor_frame, 'user1', 'workout1')
         display_sensor_data(sensor_data)
 
     with tab6:
         def display_all_posts():
 
-            posts = get_user_posts(userId)
+            # The feed is kept in the session so "Load more" only fetches the next page
+            feed = st.session_state.setdefault('feed', {'posts': None, 'cursor': None})
+            if feed['posts'] is None or st.button("🔄 Refresh feed"):
+                feed['posts'], feed['cursor'] = ctx.fetch(get_feed, 'user1', default=([], None))
+
+            posts = feed['posts']
             if posts:
                 for post in posts:
                     user_id = post.get('user_id', 'Unknown')
@@ -70,30 +129,34 @@ def display_app_page():
 
                     if image_url and isinstance(image_url, str) and image_url.startswith("http"):
                         try:
-                            st.image(image_url, width=150)
+                            st.image(thumbnail(image_url, 150), width=150)
                         except Exception as e:
                             st.error(f"Error displaying image from URL: {e}")
                     else:
                         st.write("Image not available.")
+                if feed['cursor'] is not None and st.button("Load more"):
+                    more, feed['cursor'] = get_feed('user1', feed['cursor'])
+                    feed['posts'] = posts + more
+                    st.rerun()
             else:
                 st.write("No posts available.")
 
  
         def display_community_page(user_id):
              
-             genai_advice = get_genai_advice(user_id)
-             user_profile = get_user_profile(user_id)
+             genai_advice = ctx.fetch(get_genai_advice, 'user1')
+             user_profile = ctx.fetch(get_user_profile, 'user1', default={})
  
              if user_profile:
                  st.write(f"User Profile: {user_profile['full_name']} (@{user_profile['username']})")
-                 st.image(user_profile['profile_image'], width=100)
+                 st.image(thumbnail(user_profile['profile_image'], 100), width=100)
                  st.write("News Feed:")
                  display_all_posts()
                  st.write("\nAdvice & Encouragement:")
                  if genai_advice:
                      st.write(f"Advice: {genai_advice['content']}")
                      if genai_advice['image']:
-                        st.image(genai_advice['image'], width=150)
+                        st.image(thumbnail(genai_advice['image'], 150), width=150)
                  else:
                      st.write("No GenAI advice found.")
              else:
@@ -104,23 +167,22 @@ def display_app_page():
     with tab7:
         # New User Activity tab that integrates all required components
         userId = 'user1'
-        workouts = get_user_workouts(userId)
+        workouts = ctx.fetch(get_user_workouts_frame, 'user1')
+        has_workouts = workouts is not None and not workouts.empty
        
         # Display user activity page
         st.header("Your Activity Dashboard")
        
         # Display recent 3 workouts
-        if workouts:
-            # Sort workouts by start time (most recent first)
-            workouts.sort(key=lambda x: x['StartTimestamp'], reverse=True)
-            # Get only the 3 most recent workouts
-            recent_workouts = workouts[:3]
+        if has_workouts:
+            # Workouts arrive sorted most recent first; show only the 3 most recent
+            recent_workouts = workouts.head(3)
             display_recent_workouts(recent_workouts)
         else:
             st.write("No recent workouts. Let's get started!")
        
         # Display activity summary
-        if workouts:
+        if has_workouts:
             display_activity_summary(workouts)
         else:
             st.write("No activity data available yet.")
@@ -129,48 +191,41 @@ def display_app_page():
         st.header("Share Your Achievement")
        
         # Calculate stats to share (if workouts exist)
-        if workouts:
-            total_steps = sum(workout.get('steps', 0) for workout in workouts)
-            total_distance = sum(workout.get('distance', 0) for workout in workouts)
-            total_calories = sum(workout.get('calories_burned', 0) for workout in workouts)
+        if has_workouts:
+            total_steps = workouts['steps'].sum()
+            total_distance = workouts['distance'].sum()
+            total_calories = workouts['calories_burned'].sum()
            
             # Create columns for share buttons
             col1, col2, col3 = st.columns(3)
            
             with col1:
-                if st.button(f"Share Steps: {total_steps}"):
-                    post_content = f"I've taken {total_steps} steps in my fitness journey! #FitnessGoals"
-                    add_post_to_database(userId, post_content)
-                    st.success("Post shared successfully!")
+                share_button(f"Share Steps: {total_steps}", "share_steps", userId,
+                             f"I've taken {total_steps} steps in my fitness journey! #FitnessGoals")
            
             with col2:
-                if st.button(f"Share Distance: {total_distance:.2f} km"):
-                    post_content = f"I've covered {total_distance:.2f} km so far! #ActiveLifestyle"
-                    add_post_to_database(userId, post_content)
-                    st.success("Post shared successfully!")
+                share_button(f"Share Distance: {total_distance:.2f} km", "share_distance", userId,
+                             f"I've covered {total_distance:.2f} km so far! #ActiveLifestyle")
            
             with col3:
-                if st.button(f"Share Calories: {total_calories} burned"):
-                    post_content = f"I've burned {total_calories} calories through my workouts! #HealthyLiving"
-                    add_post_to_database(userId, post_content)
-                    st.success("Post shared successfully!")
+                share_button(f"Share Calories: {total_calories} burned", "share_calories", userId,
+                             f"I've burned {total_calories} calories through my workouts! #HealthyLiving")
                    
             # Option to share latest workout
-            latest_workout = workouts[0]  # First workout is the most recent after sorting
-            if st.button("Share Latest Workout"):
-                latest_steps = latest_workout.get('Steps', 0)
-                latest_distance = latest_workout.get('Distance (km)', 0)
-                latest_calories = latest_workout.get('Calories Burned', 0)
-                post_content = f"Just completed a workout! {latest_steps} steps, {latest_distance:.2f} km, and burned {latest_calories} calories! #WorkoutComplete"
-                add_post_to_database(userId, post_content)
-                st.success("Latest workout shared!")
+            latest_workout = workouts.iloc[0]  # First workout is the most recent
+            latest_steps = latest_workout['steps']
+            latest_distance = latest_workout['distance']
+            latest_calories = latest_workout['calories_burned']
+            share_button("Share Latest Workout", "share_latest_workout", userId,
+                         f"Just completed a workout! {latest_steps} steps, {latest_distance:.2f} km, and burned {latest_calories} calories! #WorkoutComplete",
+                         "Latest workout shared!")
         else:
             st.write("Complete workouts to unlock sharing!")
     
     with tab8:
         # Display user profile
         userId = 'user1'  # You can use the current logged-in user's ID here
-        display_user_profile(userId)  # Call the profile display function
+        display_user_profile(userId, ctx=ctx)  # Call the profile display function
     
     # Tab of Friends-Only Leaderboard
     with tab9:
@@ -178,10 +233,10 @@ def display_app_page():
         # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Friends-Only Leaderboard UI (Ariana) ===
             # Call create_leaderboard_ui from modules.py 
         user_id = 'user1'
-        create_leaderboard_ui(user_id)
+        create_leaderboard_ui(user_id, ctx=ctx)
         # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Friend Request Functionality (Kei) ===
             # Call friend_request_ui from modules.py
-        friend_request_ui(userId)
+        friend_request_ui(userId, ctx=ctx)
     
     # Tab of AI Planner
     with tab10:    
@@ -191,6 +246,16 @@ def display_app_page():
             # Call goal_progress_tracking_ui from modules.py 
         pass
 
+    # Set BYTEME_DEBUG=1 to see how many backend reads this render made
+    if os.environ.get("BYTEME_DEBUG"):
+        st.sidebar.write(f"Backend calls this render: {ctx.backend_calls}")
+        st.sidebar.write(dict(ctx.calls))
+        st.sidebar.write("Write queue:", write_queue.metrics())
+        st.sidebar.write("Thumbnails:", thumbnail_cache.metrics())
+        st.sidebar.write("Model calls:", llm.metrics())
+        st.sidebar.write("Plan streaming:", plan_stream_metrics.metrics())
+        st.sidebar.write("Blob store:", get_blob_store().metrics())
+
         
 
 # This is the starting point for your app. You do not need to change these lines
@@ -0,0 +1,480 @@
+#############################################################################
+# backends.py
+#
+# This file contains the storage backends data_fetcher.py can read from and
+# write to. Every backend hands out a client with the subset of the
+# bigquery.Client API the fetchers use (query() and insert_rows_json()), so
+# the fetchers work unchanged against either one:
+#
+#   BigQueryBackend - the live keishlyanysanabriatechx25.bytemeproject dataset
+#   LocalBackend    - an embedded SQLite database with the same tables
+#
+# The backend is picked with the BYTEME_BACKEND environment variable
+# ("bigquery", the default, or "local"). BYTEME_LOCAL_DB sets the SQLite file
+# of the local backend (":memory:" keeps it in memory).
+#
+# The local database starts out empty. To use it as a read replica of the
+# live dataset, copy the tables into it with sync_from_bigquery, e.g. from a
+# scheduled job running `python backends.py sync`. Every sync replaces each
+# table with BigQuery's current rows. Writes made through the local backend
+# stay local and are overwritten by the next sync.
+#############################################################################
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Users (
+    UserId TEXT PRIMARY KEY,
+    Name TEXT,
+    Username TEXT,
+    ImageUrl TEXT,
+    DateOfBirth DATE
+);
+CREATE UNIQUE INDEX IF NOT EXISTS Users_Username ON Users (Username);
+
+CREATE TABLE IF NOT EXISTS Friends (
+    UserId1 TEXT NOT NULL,
+    UserId2 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS Friends_UserId1 ON Friends (UserId1, UserId2);
+CREATE INDEX IF NOT EXISTS Friends_UserId2 ON Friends (UserId2, UserId1);
+
+CREATE TABLE IF NOT EXISTS FriendRequests (
+    RequesterId TEXT NOT NULL,
+    ReceiverId TEXT NOT NULL,
+    RequestedAt TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS FriendRequests_RequesterId_ReceiverId ON FriendRequests (RequesterId, ReceiverId);
+CREATE INDEX IF NOT EXISTS FriendRequests_ReceiverId ON FriendRequests (ReceiverId);
+
+CREATE TABLE IF NOT EXISTS Workouts (
+    WorkoutId TEXT PRIMARY KEY,
+    UserId TEXT NOT NULL,
+    StartTimestamp TIMESTAMP,
+    EndTimestamp TIMESTAMP,
+    StartLocationLat REAL,
+    StartLocationLong REAL,
+    EndLocationLat REAL,
+    EndLocationLong REAL,
+    TotalDistance REAL,
+    TotalSteps INTEGER,
+    CaloriesBurned REAL
+);
+CREATE INDEX IF NOT EXISTS Workouts_UserId ON Workouts (UserId, StartTimestamp);
+
+CREATE TABLE IF NOT EXISTS WorkoutDailyRollup (
+    UserId TEXT NOT NULL,
+    Day DATE NOT NULL,
+    Steps INTEGER,
+    Distance REAL,
+    Calories REAL,
+    WorkoutCount INTEGER,
+    PRIMARY KEY (UserId, Day)
+);
+
+CREATE TABLE IF NOT EXISTS SensorTypes (
+    SensorId TEXT PRIMARY KEY,
+    Name TEXT,
+    Units TEXT
+);
+
+CREATE TABLE IF NOT EXISTS SensorData (
+    SensorId TEXT,
+    WorkoutID TEXT NOT NULL,
+    Timestamp TIMESTAMP,
+    SensorValue REAL
+);
+CREATE INDEX IF NOT EXISTS SensorData_WorkoutId ON SensorData (WorkoutID, Timestamp);
+
+CREATE TABLE IF NOT EXISTS Posts (
+    PostId TEXT PRIMARY KEY,
+    AuthorId TEXT NOT NULL,
+    Timestamp TIMESTAMP,
+    Content TEXT,
+    ImageUrl TEXT
+);
+CREATE INDEX IF NOT EXISTS Posts_AuthorId ON Posts (AuthorId, Timestamp);
+
+CREATE TABLE IF NOT EXISTS UserTaskPlans (
+    task_id TEXT,
+    user_id TEXT,
+    content TEXT,
+    general_tip TEXT
+);
+CREATE INDEX IF NOT EXISTS UserTaskPlans_UserId ON UserTaskPlans (user_id, task_id);
+
+CREATE TABLE IF NOT EXISTS UserTaskCompletion (
+    user_id TEXT,
+    task_id TEXT,
+    date_str TEXT,
+    task_index INTEGER,
+    completed BOOLEAN
+);
+CREATE INDEX IF NOT EXISTS UserTaskCompletion_UserId ON UserTaskCompletion (user_id, task_id);
+"""
+
+# Tables sync_from_bigquery copies, in the order they are copied
+REPLICATED_TABLES = ("Users", "Friends", "FriendRequests", "Workouts", "WorkoutDailyRollup",
+                     "SensorTypes", "SensorData", "Posts", "UserTaskPlans", "UserTaskCompletion")
+
+# Rows fetched from BigQuery per page while syncing
+SYNC_PAGE_SIZE = 10000
+
+# ARRAY_AGG results travel through SQLite as JSON text tagged with this prefix
+_ARRAY_PREFIX = "\x00array:"
+
+
+def _parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value.decode().replace("Z", "+00:00"))
+
+
+def _format_timestamp(value):
+    # Stored as naive UTC text so timestamps compare correctly as strings
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat(" ")
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value.decode()[:10])
+
+
+sqlite3.register_converter("TIMESTAMP", _parse_timestamp)
+sqlite3.register_converter("DATE", _parse_date)
+sqlite3.register_converter("BOOLEAN", lambda value: bool(int(value)))
+sqlite3.register_adapter(datetime.datetime, _format_timestamp)
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+
+
+class _ArrayAgg:
+    """SQLite version of ARRAY_AGG(... IGNORE NULLS)."""
+
+    def __init__(self):
+        self.items = []
+
+    def step(self, value):
+        if value is not None:
+            self.items.append(value)
+
+    def finalize(self):
+        return _ARRAY_PREFIX + json.dumps(self.items)
+
+
+def translate(query):
+    """Rewrites the BigQuery SQL used in data_fetcher.py into SQLite SQL.
+
+    Handles the constructs the fetchers use: backtick-quoted, project-qualified
+    table names, @named parameters, IN UNNEST(@array), CURRENT_TIMESTAMP(),
+    UNION DISTINCT and ARRAY_AGG(... IGNORE NULLS).
+    """
+    query = query.replace("`", "")
+    query = re.sub(r"\b(?:[\w-]+\.)?bytemeproject\.", "", query)
+    query = re.sub(r"\bUNNEST\(\s*@(\w+)\s*\)", r"(SELECT value FROM json_each(:\1))", query)
+    query = re.sub(r"@(\w+)", r":\1", query)
+    query = re.sub(r"\bCURRENT_TIMESTAMP\(\)", "CURRENT_TIMESTAMP", query)
+    query = re.sub(r"\bUNION DISTINCT\b", "UNION", query)
+    query = re.sub(r"\bARRAY_AGG\(", "array_agg(", query)
+    query = re.sub(r"\s+IGNORE NULLS\s*\)", ")", query)
+    return query
+
+
+def _split_statements(script):
+    """Splits a script into its statements."""
+    statements, current = [], ""
+    for part in script.split(";"):
+        current += part + ";"
+        if sqlite3.complete_statement(current):
+            if current.strip(" \n\t;"):
+                statements.append(current)
+            current = ""
+    if current.strip(" \n\t;"):
+        statements.append(current)
+    return statements or [script]
+
+
+def _parameters(job_config):
+    """Turns bigquery query parameters into a dict for sqlite3."""
+    params = {}
+    for param in getattr(job_config, "query_parameters", None) or []:
+        if hasattr(param, "values"):
+            params[param.name] = json.dumps(list(param.values), default=str)
+        else:
+            params[param.name] = param.value
+    return params
+
+
+def _value(value):
+    if isinstance(value, str) and value.startswith(_ARRAY_PREFIX):
+        return json.loads(value[len(_ARRAY_PREFIX):])
+    return value
+
+
+class LocalRow:
+    """One result row, readable like a bigquery.Row (row.Name, row['Name'], row.items())."""
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return self._values[self._index[key]]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def keys(self):
+        return list(self._index)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return [(name, self._values[i]) for name, i in self._index.items()]
+
+    def get(self, key, default=None):
+        return self._values[self._index[key]] if key in self._index else default
+
+
+class LocalRowIterator:
+    """The rows of a finished query, like bigquery's RowIterator."""
+
+    def __init__(self, rows, columns, page_size=None):
+        self._rows = rows
+        self._iter = iter(rows)
+        self.schema = columns
+        self.total_rows = len(rows)
+        self.page_size = page_size or max(len(rows), 1)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iter)
+
+    @property
+    def pages(self):
+        """Yields the rows in lists of at most page_size rows."""
+        for i in range(0, len(self._rows), self.page_size):
+            yield self._rows[i:i + self.page_size]
+
+    def to_dataframe_iterable(self, bqstorage_client=None, **kwargs):
+        import pandas as pd
+        for page in self.pages:
+            yield pd.DataFrame.from_records([row.values() for row in page], columns=self.schema)
+
+    def to_arrow_iterable(self, bqstorage_client=None, **kwargs):
+        for page in self.pages:
+            yield from self._arrow(page).to_batches()
+
+    def to_arrow(self, bqstorage_client=None, **kwargs):
+        return self._arrow(self._rows)
+
+    def _arrow(self, rows):
+        import pyarrow as pa
+        columns = zip(*(row.values() for row in rows)) if rows else [()] * len(self.schema)
+        return pa.table({name: list(values) for name, values in zip(self.schema, columns)})
+
+
+class LocalQueryJob:
+    """A query that already ran. Iterating it, or its result(), yields LocalRows."""
+
+    def __init__(self, rows, columns, affected_rows):
+        index = {name: i for i, name in enumerate(columns)}
+        self._rows = [LocalRow(tuple(_value(v) for v in row), index) for row in rows]
+        self._columns = columns
+        self.num_dml_affected_rows = affected_rows
+
+    def result(self, page_size=None, **kwargs):
+        return LocalRowIterator(self._rows, self._columns, page_size)
+
+    def __iter__(self):
+        return self.result()
+
+
+class LocalClient:
+    """Client for a SQLite database, exposing the parts of bigquery.Client data_fetcher uses."""
+
+    dialect = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._conn.create_aggregate("array_agg", 1, _ArrayAgg)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def query(self, query, job_config=None, **kwargs):
+        """Runs a query or a multi-statement script.
+
+        Like a BigQuery script, the rows of the last statement that returns
+        rows are the result, and temporary tables are dropped when it ends.
+        BEGIN/COMMIT TRANSACTION statements run as SQLite transactions.
+        """
+        statements = _split_statements(translate(query))
+        params = _parameters(job_config)
+        columns, rows = [], []
+        with self._lock:
+            try:
+                with self._conn:
+                    for statement in statements:
+                        cursor = self._conn.execute(statement, params)
+                        if cursor.description:
+                            columns = [col[0] for col in cursor.description]
+                            rows = cursor.fetchall()
+            finally:
+                if len(statements) > 1:
+                    self._drop_temp_tables()
+        return LocalQueryJob(rows, columns, cursor.rowcount)
+
+    def _drop_temp_tables(self):
+        names = [row[0] for row in self._conn.execute("SELECT name FROM sqlite_temp_master WHERE type = 'table'")]
+        for name in names:
+            self._conn.execute(f"DROP TABLE temp.{name}")
+
+    def insert_rows_json(self, table, json_rows, row_ids=None, **kwargs):
+        """Inserts rows like bigquery's streaming insert and returns a list of errors."""
+        table = translate(str(table))
+        errors = []
+        with self._lock, self._conn:
+            for index, row in enumerate(json_rows):
+                columns = ", ".join(row)
+                placeholders = ", ".join(f":{name}" for name in row)
+                try:
+                    self._conn.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", row)
+                except sqlite3.Error as e:
+                    errors.append({"index": index, "errors": [{"message": str(e)}]})
+        return errors
+
+    def replace_rows(self, table, rows):
+        """Replaces every row of table with rows in one transaction. Returns how many were written.
+
+        Columns the local schema doesn't have are dropped, and repeated or
+        record values are stored as JSON text.
+        """
+        table = translate(str(table))
+        with self._lock:
+            columns = [info[1] for info in self._conn.execute(f"PRAGMA table_info({table})")]
+            insert = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                      f"VALUES ({', '.join(':' + name for name in columns)})")
+
+            def values():
+                for row in rows:
+                    row = dict(row)
+                    yield {name: json.dumps(row[name], default=str) if isinstance(row.get(name), (list, dict))
+                           else row.get(name) for name in columns}
+
+            with self._conn:
+                self._conn.execute(f"DELETE FROM {table}")
+                return self._conn.executemany(insert, values()).rowcount
+
+    def close(self):
+        self._conn.close()
+
+
+class BigQueryBackend:
+    """The live BigQuery dataset, reached through the pooled clients in clients.py."""
+
+    name = "bigquery"
+
+    def client(self, project=None):
+        from clients import get_bigquery_client
+        return get_bigquery_client(project)
+
+
+class LocalBackend:
+    """An embedded SQLite copy of the bytemeproject schema."""
+
+    name = "local"
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("BYTEME_LOCAL_DB", "bytemeproject.db")
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self, project=None):
+        # One database serves every project name the fetchers pass in
+        with self._lock:
+            if self._client is None:
+                self._client = LocalClient(self.path)
+            return self._client
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns the configured backend, reading BYTEME_BACKEND on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.environ.get("BYTEME_BACKEND", "bigquery").lower()
+            if name == "local":
+                _backend = LocalBackend()
+            elif name == "bigquery":
+                _backend = BigQueryBackend()
+            else:
+                raise ValueError(f"Unknown BYTEME_BACKEND '{name}', expected 'bigquery' or 'local'")
+        return _backend
+
+
+def set_backend(backend):
+    """Replaces the configured backend, e.g. with a LocalBackend in tests and benchmarks."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def get_client(project=None):
+    """Returns a client of the configured backend for the fetchers to use."""
+    return get_backend().client(project)
+
+
+def sync_from_bigquery(local, source=None, tables=REPLICATED_TABLES):
+    """Copies tables from the live dataset into a local database.
+
+    Args:
+        local (LocalClient): The database to fill.
+        source (optional): Client to read from. None uses BigQuery.
+        tables (iterable): Names of the tables to copy.
+
+    Returns:
+        dict: How many rows each table now has.
+    """
+    if source is None:
+        source = BigQueryBackend().client()
+    counts = {}
+    for table in tables:
+        rows = source.query(f"SELECT * FROM `keishlyanysanabriatechx25.bytemeproject.{table}`").result(
+            page_size=SYNC_PAGE_SIZE)
+        counts[table] = local.replace_rows(table, (row.items() for row in rows))
+        print(f"Synced {counts[table]} rows of {table}")
+    return counts
+
+
+if __name__ == "__main__":
+    # python backends.py sync [database file]: refreshes the local replica from BigQuery
+    import sys
+    if sys.argv[1:2] != ["sync"]:
+        sys.exit("usage: python backends.py sync [database file]")
+    replica = LocalClient(sys.argv[2] if len(sys.argv) > 2 else LocalBackend().path)
+    sync_from_bigquery(replica)
+    replica.close()
@@ -0,0 +1,156 @@
+#############################################################################
+# backends_test.py
+#
+# This file contains tests for backends.py.
+#############################################################################
+import datetime
+import unittest
+from types import SimpleNamespace
+
+from unittest.mock import patch
+
+from backends import LocalClient, sync_from_bigquery, translate
+
+
+def job_config(**params):
+    """Builds a stand-in for bigquery.QueryJobConfig with scalar or array parameters."""
+    query_parameters = []
+    for name, value in params.items():
+        if isinstance(value, list):
+            query_parameters.append(SimpleNamespace(name=name, values=value))
+        else:
+            query_parameters.append(SimpleNamespace(name=name, value=value))
+    return SimpleNamespace(query_parameters=query_parameters)
+
+
+class TestTranslate(unittest.TestCase):
+
+    def test_table_names_and_parameters(self):
+        query = translate("SELECT UserId FROM `keishlyanysanabriatechx25.bytemeproject.Users` WHERE Username = @friend_username")
+        self.assertEqual(query, "SELECT UserId FROM Users WHERE Username = :friend_username")
+
+    def test_unnest_and_array_agg(self):
+        query = translate("SELECT ARRAY_AGG(x IGNORE NULLS) FROM t WHERE id IN UNNEST(@ids)")
+        self.assertEqual(query, "SELECT array_agg(x) FROM t WHERE id IN (SELECT value FROM json_each(:ids))")
+
+
+class TestLocalClient(unittest.TestCase):
+
+    def setUp(self):
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("keishlyanysanabriatechx25.bytemeproject.Users", [
+            {'UserId': 'user1', 'Name': 'Remi', 'Username': 'remi_the_rems', 'DateOfBirth': '1990-01-01'},
+            {'UserId': 'user2', 'Name': 'Blake', 'Username': 'blake', 'DateOfBirth': '1990-01-01'},
+            {'UserId': 'user3', 'Name': 'Jordan', 'Username': 'jordanjordanjordan', 'DateOfBirth': '1990-01-01'},
+        ])
+        self.client.insert_rows_json("keishlyanysanabriatechx25.bytemeproject.Friends", [
+            {'UserId1': 'user1', 'UserId2': 'user2'},
+            {'UserId1': 'user3', 'UserId2': 'user1'},
+        ])
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_profile_query_with_friends(self):
+        query = """
+            SELECT u.UserId, u.Name, u.DateOfBirth,
+            ARRAY_AGG(CASE
+                WHEN f.UserId1 = u.UserId THEN f.UserId2
+                WHEN f.UserId2 = u.UserId THEN f.UserId1
+                ELSE NULL
+            END IGNORE NULLS) AS friends
+            FROM keishlyanysanabriatechx25.bytemeproject.Users u
+            LEFT JOIN keishlyanysanabriatechx25.bytemeproject.Friends f ON u.UserId = f.UserId1 OR u.UserId = f.UserId2
+            WHERE u.UserId IN UNNEST(@ids)
+            GROUP BY u.UserId, u.Name, u.DateOfBirth
+            ORDER BY u.UserId
+        """
+        rows = list(self.client.query(query, job_config=job_config(ids=['user1', 'user2'])).result())
+
+        self.assertEqual([row.UserId for row in rows], ['user1', 'user2'])
+        self.assertEqual(sorted(rows[0].friends), ['user2', 'user3'])
+        self.assertEqual(rows[1]['friends'], ['user1'])
+        self.assertEqual(rows[0].DateOfBirth, datetime.date(1990, 1, 1))
+
+    def test_script_returns_last_rows_and_rolls_back(self):
+        script = """
+            BEGIN TRANSACTION;
+            CREATE TEMP TABLE picked AS SELECT UserId FROM Users WHERE UserId != @user_id;
+            DELETE FROM Friends WHERE UserId2 IN (SELECT UserId FROM picked);
+            COMMIT TRANSACTION;
+            SELECT UserId FROM picked ORDER BY UserId;
+        """
+        rows = list(self.client.query(script, job_config=job_config(user_id='user1')))
+
+        self.assertEqual([row.UserId for row in rows], ['user2', 'user3'])
+        self.assertEqual(len(list(self.client.query("SELECT * FROM Friends"))), 1)
+        self.assertEqual(list(self.client.query("SELECT name FROM sqlite_temp_master")), [])
+
+        with self.assertRaises(Exception):
+            self.client.query("BEGIN TRANSACTION; DELETE FROM Friends; SELECT * FROM Missing; COMMIT TRANSACTION;")
+        self.assertEqual(len(list(self.client.query("SELECT * FROM Friends"))), 1)
+
+    def test_result_supports_next_and_total_rows(self):
+        result = self.client.query("SELECT * FROM `keishlyanysanabriatechx25.bytemeproject.Users` WHERE UserId = @user_id",
+                                   job_config=job_config(user_id='user2')).result()
+
+        self.assertEqual(result.total_rows, 1)
+        self.assertEqual(dict(next(result).items())['Name'], 'Blake')
+        self.assertIsNone(next(result, None))
+
+    def test_dml_and_timestamps(self):
+        self.client.query("""
+            INSERT INTO `keishlyanysanabriatechx25.bytemeproject.FriendRequests` (RequesterId, ReceiverId, RequestedAt)
+            VALUES (@user_id, @friend_id, CURRENT_TIMESTAMP())
+        """, job_config=job_config(user_id='user2', friend_id='user3'))
+
+        row = next(self.client.query("SELECT RequestedAt FROM FriendRequests").result())
+        self.assertIsInstance(row.RequestedAt, datetime.datetime)
+
+    def test_insert_errors_are_returned(self):
+        errors = self.client.insert_rows_json("bytemeproject.Users", [{'UserId': 'user1', 'Name': 'Duplicate'}])
+        self.assertEqual(len(errors), 1)
+
+
+class TestSyncFromBigQuery(unittest.TestCase):
+    """Syncs from a second local database standing in for BigQuery."""
+
+    def setUp(self):
+        self.source = LocalClient(":memory:")
+        self.source.insert_rows_json("Users", [
+            {'UserId': 'user1', 'Name': 'Remi', 'Username': 'remi_the_rems', 'DateOfBirth': '1990-01-01'},
+            {'UserId': 'user2', 'Name': 'Blake', 'Username': 'blake'},
+        ])
+        self.source.insert_rows_json("Workouts", [
+            {'WorkoutId': 'workout1', 'UserId': 'user1', 'StartTimestamp': '2024-07-29 07:00:00', 'TotalSteps': 8000},
+        ])
+        self.replica = LocalClient(":memory:")
+
+    def tearDown(self):
+        self.source.close()
+        self.replica.close()
+
+    def test_tables_are_copied_and_replaced(self):
+        self.replica.insert_rows_json("Users", [{'UserId': 'gone', 'Username': 'deleted_upstream'}])
+
+        with patch('builtins.print'):
+            counts = sync_from_bigquery(self.replica, self.source, tables=("Users", "Workouts", "Friends"))
+
+        self.assertEqual(counts, {'Users': 2, 'Workouts': 1, 'Friends': 0})
+        users = sorted(row.UserId for row in self.replica.query("SELECT UserId FROM Users").result())
+        self.assertEqual(users, ['user1', 'user2'])
+        workout = next(self.replica.query("SELECT StartTimestamp, TotalSteps FROM Workouts").result())
+        self.assertEqual(workout.StartTimestamp, datetime.datetime(2024, 7, 29, 7, 0))
+        self.assertEqual(workout.TotalSteps, 8000)
+
+    def test_unknown_columns_are_dropped_and_records_stored_as_json(self):
+        self.replica.replace_rows("UserTaskPlans", [
+            {'task_id': 't1', 'user_id': 'user1', 'content': {'Day 1': []}, 'general_tip': 'Rest', 'Extra': 1},
+        ])
+
+        row = next(self.replica.query("SELECT content FROM UserTaskPlans").result())
+        self.assertEqual(row.content, '{"Day 1": []}')
+
+
+if __name__ == "__main__":
+    unittest.main()
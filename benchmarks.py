@@ -0,0 +1,404 @@
+#############################################################################
+# benchmarks.py
+#
+# This file contains micro-benchmarks for the app's data paths. They run
+# against local fakes, so no cloud project is needed:
+#
+#   python benchmarks.py              # run every benchmark
+#   python benchmarks.py client_pool  # run a single benchmark
+#############################################################################
+
+import json
+import sys
+import time
+from unittest.mock import patch
+
+import requests
+
+
+def _timeit(fn, repeat):
+    """Runs fn repeat times and returns the mean wall-clock time in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+class FakeTransport(requests.Session):
+    """HTTP session that answers every BigQuery API call locally.
+
+    The first request on a session sleeps for setup_latency to stand in for
+    the DNS lookup and TLS handshake a fresh connection pays; later requests
+    on the same session are answered immediately.
+    """
+
+    # Read by google-cloud-core when it picks the API endpoint
+    is_mtls = False
+
+    def __init__(self, setup_latency=0.05):
+        super().__init__()
+        self.setup_latency = setup_latency
+        self.connected = False
+
+    def request(self, method, url, **kwargs):
+        if not self.connected:
+            time.sleep(self.setup_latency)
+            self.connected = True
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps({
+            "kind": "bigquery#dataset",
+            "id": "bench:bytemeproject",
+            "datasetReference": {"projectId": "bench", "datasetId": "bytemeproject"},
+        }).encode()
+        return response
+
+
+def bench_client_pool(repeat=20, setup_latency=0.05):
+    """Compares building a client per call against borrowing the pooled client."""
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import bigquery
+    import clients
+
+    def make_client(project, pool_size=None):
+        return bigquery.Client(project="bench", credentials=AnonymousCredentials(),
+                               _http=FakeTransport(setup_latency))
+
+    def per_call():
+        make_client("bench").get_dataset("bench.bytemeproject")
+
+    def pooled():
+        clients.get_bigquery_client("bench").get_dataset("bench.bytemeproject")
+
+    clients.reset_clients()
+    with patch.object(clients, "_create_client", make_client):
+        per_call_ms = _timeit(per_call, repeat)
+        pooled_ms = _timeit(pooled, repeat)
+    clients.reset_clients()
+
+    print(f"client_pool: per-call client {per_call_ms:.2f} ms/call, "
+          f"pooled client {pooled_ms:.2f} ms/call ({per_call_ms / pooled_ms:.1f}x)")
+
+
+class FakeRows:
+    """Result of a FakeJob: iterable, and paged like a bigquery RowIterator."""
+
+    def __init__(self, rows, page_size=None):
+        self.rows = rows
+        self.page_size = page_size or max(1, len(rows))
+        self._iter = iter(rows)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iter)
+
+    @property
+    def pages(self):
+        for start in range(0, max(1, len(self.rows)), self.page_size):
+            yield self.rows[start:start + self.page_size]
+
+
+class FakeJob:
+    """Query job returned by FakeClient. Iterating it or its result yields rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.total_rows = len(rows)
+
+    def result(self, page_size=None, **kwargs):
+        return FakeRows(self.rows, page_size)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeClient:
+    """Stands in for bigquery.Client, sleeping latency seconds per query."""
+
+    def __init__(self, latency=0.1, rows=()):
+        self.latency = latency
+        self.rows = list(rows)
+        self.queries = 0
+
+    def query(self, query, job_config=None):
+        self.queries += 1
+        time.sleep(self.latency)
+        return FakeJob(self.rows)
+
+
+def bench_prefetch(latency=0.2):
+    """Compares running display_app_page's reads one after another against prefetch()."""
+    from data_fetcher import (get_user_posts, get_user_workouts, get_user_sensor_data,
+                              get_user_profile, get_leaderboard_data, get_pending_requests)
+    from prefetch import prefetch
+
+    client = FakeClient(latency)
+    fetches = {
+        'home_posts': (get_user_posts, ('user3', client)),
+        'workouts': (get_user_workouts, ('user1', client)),
+        'sensor_data': (get_user_sensor_data, ('user1', 'workout1', client)),
+        'community_posts': (get_user_posts, ('user1', client)),
+        'profile': (get_user_profile, ('user1', client)),
+        'leaderboard': (get_leaderboard_data, ('user1', client)),
+        'pending_requests': (get_pending_requests, ('user1', client)),
+    }
+
+    def sequential():
+        for func, args in fetches.values():
+            func(*args)
+
+    def prefetched():
+        data = prefetch(fetches)
+        for name in fetches:
+            data.get(name)
+
+    sequential_ms = _timeit(sequential, 1)
+    prefetched_ms = _timeit(prefetched, 1)
+    print(f"prefetch: {len(fetches)} fetches at {latency * 1000:.0f} ms each, "
+          f"sequential {sequential_ms:.0f} ms, prefetched {prefetched_ms:.0f} ms")
+
+
+def _local_client_with_workouts(workouts, friends=10, days=365):
+    """Builds an in-memory LocalClient holding `workouts` workouts spread over friends and days."""
+    import datetime
+    import random
+    from backends import LocalClient
+
+    client = LocalClient(":memory:")
+    client.insert_rows_json("Users", [{'UserId': f'user{i}', 'Name': f'User {i}', 'Username': f'user{i}'}
+                                      for i in range(friends)])
+    client.insert_rows_json("Friends", [{'UserId1': 'user0', 'UserId2': f'user{i}'} for i in range(1, friends)])
+
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time(7))
+    client.insert_rows_json("Workouts", [{
+        'WorkoutId': f'workout{i}',
+        'UserId': f'user{i % friends}',
+        'StartTimestamp': (today - datetime.timedelta(days=random.randrange(days))).isoformat(" "),
+        'TotalDistance': random.uniform(1, 10),
+        'TotalSteps': random.randrange(1000, 15000),
+        'CaloriesBurned': random.randrange(100, 900),
+    } for i in range(workouts)])
+    return client
+
+
+def bench_rollup_leaderboard(histories=(1000, 10000, 100000), repeat=20):
+    """Shows windowed leaderboard latency staying flat as workout history grows."""
+    from data_fetcher import get_leaderboard_data, get_windowed_leaderboard, refresh_daily_rollups
+
+    for workouts in histories:
+        client = _local_client_with_workouts(workouts)
+        refresh_daily_rollups(client=client)
+
+        raw_ms = _timeit(lambda: get_leaderboard_data('user0', client=client), repeat)
+        week_ms = _timeit(lambda: get_windowed_leaderboard('user0', '7d', client=client), repeat)
+        all_ms = _timeit(lambda: get_windowed_leaderboard('user0', 'all', client=client), repeat)
+        print(f"rollup_leaderboard: {workouts} workouts, raw aggregate {raw_ms:.2f} ms, "
+              f"rollup 7d {week_ms:.2f} ms, rollup all-time {all_ms:.2f} ms")
+        client.close()
+
+
+def bench_downsampling(points=1000000, max_points=1000, repeat=5):
+    """Times LTTB and min/max downsampling of one sensor series of `points` readings."""
+    import numpy as np
+    from downsampling import lttb, minmax
+
+    x = np.arange(points, dtype=np.int64) * 1000000000
+    y = np.sin(np.arange(points) / 5000.0) + np.random.default_rng(0).normal(0, 0.1, points)
+
+    lttb_ms = _timeit(lambda: lttb(x, y, max_points), repeat)
+    minmax_ms = _timeit(lambda: minmax(x, y, max_points), repeat)
+    print(f"downsampling: {points} points to {max_points}, lttb {lttb_ms:.1f} ms, minmax {minmax_ms:.1f} ms")
+
+
+def bench_workout_frame(workouts=50000, repeat=5):
+    """Compares the list-of-dicts workout path against the columnar frame for one user.
+
+    Besides the fetch, it times what one render did with the result: the
+    Activity Summary, Recent Workouts and profile Activity views each built
+    their own DataFrame from the list and re-sorted it, while the frame is
+    fetched once, already sorted, and shared by all three.
+    """
+    import pandas as pd
+    from data_fetcher import get_user_workouts, get_user_workouts_frame
+
+    client = _local_client_with_workouts(workouts, friends=1)
+
+    def list_fetch():
+        return get_user_workouts('user0', client=client)
+
+    def list_render():
+        rows = list_fetch()
+        for _ in range(3):
+            rows.sort(key=lambda x: x['StartTimestamp'], reverse=True)
+            pd.DataFrame(rows)
+
+    def frame_render():
+        frame = get_user_workouts_frame('user0', client=client)
+        for _ in range(3):
+            frame.head(5)
+
+    list_fetch_ms = _timeit(list_fetch, repeat)
+    frame_fetch_ms = _timeit(lambda: get_user_workouts_frame('user0', client=client), repeat)
+    list_ms = _timeit(list_render, repeat)
+    frame_ms = _timeit(frame_render, repeat)
+    print(f"workout_frame: {workouts} workouts, fetch: list of dicts {list_fetch_ms:.0f} ms, "
+          f"columnar frame {frame_fetch_ms:.0f} ms ({list_fetch_ms / frame_fetch_ms:.1f}x); "
+          f"render of 3 views: {list_ms:.0f} ms vs {frame_ms:.0f} ms ({list_ms / frame_ms:.1f}x)")
+    client.close()
+
+
+def bench_username_index(users=100000, repeat=1000):
+    """Compares resolving a username with a point query against the in-memory index."""
+    from backends import LocalClient
+    from username_index import UsernameIndex, query_user_id
+
+    client = LocalClient(":memory:")
+    client.insert_rows_json("Users", [{'UserId': f'user{i}', 'Username': f'runner_{i}'} for i in range(users)])
+    index = UsernameIndex()
+    index.load(client)
+
+    query_ms = _timeit(lambda: query_user_id('runner_4242', client), repeat)
+    with patch("username_index.get_client", return_value=client):
+        lookup_us = _timeit(lambda: index.lookup('runner_4242'), repeat) * 1000
+        suggest_us = _timeit(lambda: index.suggest('runner_424'), repeat) * 1000
+    print(f"username_index: {users} users, point query {query_ms:.3f} ms, "
+          f"index lookup {lookup_us:.2f} us, prefix suggest {suggest_us:.2f} us")
+    client.close()
+
+
+def bench_friend_graph(users=10000, friendships=100000, repeat=1000):
+    """Compares a Friends table friendship check against the in-memory friend graph."""
+    import random
+    from backends import LocalClient
+    from friend_graph import FriendGraph
+
+    client = LocalClient(":memory:")
+    client.insert_rows_json("Friends", [{'UserId1': f'user{random.randrange(users)}',
+                                         'UserId2': f'user{random.randrange(users)}'}
+                                        for _ in range(friendships)])
+    graph = FriendGraph()
+    load_ms = _timeit(lambda: graph.load(client), 1)
+
+    check = """
+        SELECT 1 FROM Friends
+        WHERE (UserId1 = 'user1' AND UserId2 = 'user2') OR (UserId1 = 'user2' AND UserId2 = 'user1')
+    """
+    query_ms = _timeit(lambda: list(client.query(check)), repeat)
+    check_us = _timeit(lambda: graph.are_friends('user1', 'user2'), repeat) * 1000
+    suggest_ms = _timeit(lambda: graph.suggestions('user1'), repeat)
+    print(f"friend_graph: {friendships} friendships, load {load_ms:.0f} ms, table check {query_ms:.3f} ms, "
+          f"graph check {check_us:.2f} us, friends-of-friends suggestions {suggest_ms:.3f} ms")
+    client.close()
+
+
+def bench_thumbnails(posts=20, friends=8, photo_size=(1600, 1200)):
+    """Compares the image bytes one page sends the browser with and without thumbnails."""
+    import io
+    import shutil
+    import tempfile
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from PIL import Image
+    from thumbnails import ThumbnailCache
+
+    def photo(seed):
+        image = Image.effect_noise(photo_size, 32 + seed % 16).convert("RGB")
+        image = image.resize((photo_size[0] // 4, photo_size[1] // 4)).resize(photo_size)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=90)
+        return buffer.getvalue()
+
+    images = {f"/{i}.jpg": photo(i) for i in range(posts + friends + 1)}
+
+    class Host(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = images[self.path]
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # (image, display width): a feed of posts with avatars, the profile picture and a friends grid
+    page = [(f"{base}/{i}.jpg", 640) for i in range(posts)]
+    page += [(f"{base}/{posts + friends}.jpg", 50)] * posts + [(f"{base}/{posts + friends}.jpg", 200)]
+    page += [(f"{base}/{posts + i}.jpg", 100) for i in range(friends)]
+
+    directory = tempfile.mkdtemp()
+    try:
+        cache = ThumbnailCache(directory)
+        before = sum(len(images[url[len(base):]]) for url, _ in page)
+        # What the page helpers do: a miss shows the original while the thumbnail is built
+        cold_ms = _timeit(lambda: [cache.get(url, width, block=False) for url, width in page], 1)
+        ready_ms = _timeit(cache.wait, 1) + cold_ms
+        warm_ms = _timeit(lambda: [cache.get(url, width, block=False) for url, width in page], 1)
+        after = sum(len(cache.get(url, width)) for url, width in page)
+        metrics = cache.metrics()
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"thumbnails: page of {len(page)} images, originals {before / 1024:.0f} KiB, "
+          f"thumbnails {after / 1024:.0f} KiB ({before / after:.0f}x smaller), "
+          f"first render {cold_ms:.1f} ms (thumbnails ready after {ready_ms:.0f} ms), "
+          f"cached render {warm_ms:.1f} ms, hit ratio {metrics['hit_ratio']:.2f}")
+
+
+def bench_prompt_summary(histories=(10, 100, 1000), repeat=5):
+    """Compares planner prompt size with the raw workout list against the workout summary."""
+    import datetime
+    import random
+    from llm_gateway import estimate_tokens
+    from workout_summary import format_summary, summarize_workouts
+
+    template = ("Based on the goal: 'Run a 5k' and your knowledge of the user's past workouts: {}, "
+                "please generate a fitness plan.")
+    now = datetime.datetime(2025, 4, 30, tzinfo=datetime.timezone.utc)
+    for count in histories:
+        workouts = []
+        for i in range(count):
+            start = now - datetime.timedelta(days=i * 2, minutes=random.randrange(600))
+            workouts.append({
+                'WorkoutId': f'workout{i}',
+                'StartTimestamp': start.isoformat(),
+                'end_timestamp': (start + datetime.timedelta(minutes=random.randrange(20, 90))).isoformat(),
+                'start_lat_lng': (round(random.uniform(-90, 90), 6), round(random.uniform(-180, 180), 6)),
+                'end_lat_lng': (round(random.uniform(-90, 90), 6), round(random.uniform(-180, 180), 6)),
+                'distance': round(random.uniform(1, 20), 2),
+                'steps': random.randrange(1000, 20000),
+                'calories_burned': random.randrange(50, 1200),
+            })
+        raw = estimate_tokens(template.format(workouts))
+        summarized = estimate_tokens(template.format(format_summary(summarize_workouts(workouts, now=now))))
+        summary_ms = _timeit(lambda: summarize_workouts(workouts, now=now), repeat)
+        print(f"prompt_summary: {count} workouts, raw list {raw} prompt tokens, "
+              f"summary {summarized} prompt tokens ({raw / summarized:.0f}x fewer), summarized in {summary_ms:.1f} ms")
+
+
+BENCHMARKS = {
+    "client_pool": bench_client_pool,
+    "prefetch": bench_prefetch,
+    "rollup_leaderboard": bench_rollup_leaderboard,
+    "downsampling": bench_downsampling,
+    "workout_frame": bench_workout_frame,
+    "username_index": bench_username_index,
+    "friend_graph": bench_friend_graph,
+    "thumbnails": bench_thumbnails,
+    "prompt_summary": bench_prompt_summary,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
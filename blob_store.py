@@ -0,0 +1,343 @@
+#############################################################################
+# blob_store.py
+#
+# This file contains the blob stores behind the plan and task completion
+# blobs. data_fetcher.py and task_log.py used to build a new storage.Client
+# for every read and write and call blob.exists() before every download.
+# Instead, every store offers the same small API:
+#
+#   read / read_json    - one request; (None, None) when the blob is missing
+#   write / write_json  - with an optional if_generation_match precondition
+#   delete, list        - remove one blob, list blob names under a prefix
+#
+# and keeps the blobs it has read or written in a bounded in-memory cache
+# keyed by object generation. A cached blob is revalidated rather than
+# downloaded again: GCSBlobStore asks for it with if_generation_not_match
+# and gets an empty 304 when it hasn't changed, LocalBlobStore compares the
+# file's modification time.
+#
+#   GCSBlobStore   - the byte-me-user-tasks bucket, through one pooled client
+#   LocalBlobStore - files under a local directory, one per blob name
+#
+# The store is picked with the BYTEME_BLOB_STORE environment variable
+# ("gcs", the default, or "local"). BYTEME_BLOB_DIR sets the directory of
+# the local store.
+#############################################################################
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from google.api_core.exceptions import NotFound, NotModified, PreconditionFailed
+
+BUCKET = 'byte-me-user-tasks'
+
+LOCAL_DIR = os.environ.get("BYTEME_BLOB_DIR", "task_completion_status")
+
+# Blobs kept in the generation-validated cache of each store
+CACHE_ENTRIES = int(os.environ.get("BLOB_CACHE_ENTRIES", "1024"))
+
+# Maximum number of pooled HTTP connections kept open by the storage client
+POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", "32"))
+
+
+class BlobStore:
+    """The shared API and generation-validated cache of every store."""
+
+    name = None
+
+    def __init__(self, cache_entries=CACHE_ENTRIES):
+        self.cache_entries = cache_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.hits = 0
+        self.not_found = 0
+        self.writes = 0
+        self.conflicts = 0
+
+    def read(self, name):
+        """Returns (data, generation) of a blob, or (None, None) if it doesn't exist."""
+        with self._lock:
+            self.reads += 1
+            cached = self._cache.get(name)
+        try:
+            result = self._read(name, cached[1] if cached else None)
+        except NotFound:
+            with self._lock:
+                self.not_found += 1
+                self._cache.pop(name, None)
+            return None, None
+        if result is None:
+            # Unchanged since it was cached
+            with self._lock:
+                self.hits += 1
+                if name in self._cache:
+                    self._cache.move_to_end(name)
+            return cached
+        self._remember(name, *result)
+        return result
+
+    def read_json(self, name):
+        """Returns (value, generation) of a JSON blob, or (None, None) if it doesn't exist."""
+        data, generation = self.read(name)
+        return (None, None) if data is None else (json.loads(data), generation)
+
+    def write(self, name, data, content_type='application/octet-stream', if_generation_match=None):
+        """Writes a blob and returns its new generation.
+
+        Args:
+            name (str): The blob name.
+            data (bytes or str): The content.
+            content_type (str): The content type.
+            if_generation_match (int, optional): Only write if the blob's
+                current generation is this one; 0 means only if it doesn't exist.
+
+        Raises:
+            PreconditionFailed: If if_generation_match didn't hold.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        try:
+            generation = self._write(name, data, content_type, if_generation_match)
+        except PreconditionFailed:
+            with self._lock:
+                self.conflicts += 1
+                # Whatever is cached may be what just won, or older; read it again next time
+                self._cache.pop(name, None)
+            raise
+        with self._lock:
+            self.writes += 1
+        self._remember(name, data, generation)
+        return generation
+
+    def write_json(self, name, value, if_generation_match=None):
+        """Writes value as a JSON blob and returns its new generation."""
+        return self.write(name, json.dumps(value), content_type='application/json',
+                          if_generation_match=if_generation_match)
+
+    def delete(self, name):
+        """Deletes a blob. Returns False if it didn't exist."""
+        with self._lock:
+            self._cache.pop(name, None)
+        try:
+            self._delete(name)
+        except NotFound:
+            return False
+        return True
+
+    def list(self, prefix):
+        """Returns the names of the blobs under prefix, sorted."""
+        return sorted(self._list(prefix))
+
+    def _remember(self, name, data, generation):
+        with self._lock:
+            self._cache[name] = (data, generation)
+            self._cache.move_to_end(name)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def metrics(self):
+        """Returns read, cache and write counters."""
+        with self._lock:
+            return {
+                'store': self.name,
+                'reads': self.reads,
+                'hits': self.hits,
+                'hit_ratio': self.hits / self.reads if self.reads else 0.0,
+                'not_found': self.not_found,
+                'writes': self.writes,
+                'conflicts': self.conflicts,
+                'cached': len(self._cache),
+            }
+
+    def clear(self):
+        """Forgets the cached blobs and counters. Mainly useful in tests."""
+        with self._lock:
+            self._cache.clear()
+            self.reads = self.hits = self.not_found = self.writes = self.conflicts = 0
+
+    # Implemented by each store. _read returns None when the blob still has
+    # cached_generation, and every method raises NotFound for a missing blob.
+
+    def _read(self, name, cached_generation):
+        raise NotImplementedError
+
+    def _write(self, name, data, content_type, if_generation_match):
+        raise NotImplementedError
+
+    def _delete(self, name):
+        raise NotImplementedError
+
+    def _list(self, prefix):
+        raise NotImplementedError
+
+
+class GCSBlobStore(BlobStore):
+    """A Cloud Storage bucket, reached through one long-lived client."""
+
+    name = "gcs"
+
+    def __init__(self, bucket=BUCKET, pool_size=POOL_SIZE, cache_entries=CACHE_ENTRIES):
+        super().__init__(cache_entries)
+        self.bucket_name = bucket
+        self.pool_size = pool_size
+        self._bucket = None
+        self._bucket_lock = threading.Lock()
+
+    def bucket(self):
+        """Returns the bucket handle, creating the pooled client on first use."""
+        if self._bucket is None:
+            with self._bucket_lock:
+                if self._bucket is None:
+                    import google.auth
+                    import requests
+                    from google.auth.transport.requests import AuthorizedSession
+                    from google.cloud import storage
+
+                    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+                    session = AuthorizedSession(credentials)
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                            pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    client = storage.Client(project=project, credentials=credentials, _http=session)
+                    self._bucket = client.bucket(self.bucket_name)
+        return self._bucket
+
+    def _read(self, name, cached_generation):
+        blob = self.bucket().blob(name)
+        try:
+            data = blob.download_as_bytes(if_generation_not_match=cached_generation)
+        except NotModified:
+            return None
+        return data, blob.generation
+
+    def _write(self, name, data, content_type, if_generation_match):
+        blob = self.bucket().blob(name)
+        blob.upload_from_string(data, content_type=content_type, if_generation_match=if_generation_match)
+        return blob.generation
+
+    def _delete(self, name):
+        self.bucket().blob(name).delete()
+
+    def _list(self, prefix):
+        return [blob.name for blob in self.bucket().list_blobs(prefix=prefix)]
+
+
+class LocalBlobStore(BlobStore):
+    """Files under a local directory, for running offline and in tests.
+
+    A blob's generation is its file's modification time in nanoseconds,
+    bumped on every write so it always increases. Preconditions hold
+    between the threads of one process; create-only writes also hold
+    between processes.
+    """
+
+    name = "local"
+
+    def __init__(self, directory=LOCAL_DIR, cache_entries=CACHE_ENTRIES):
+        super().__init__(cache_entries)
+        self.directory = directory
+        self._write_lock = threading.Lock()
+
+    def _path(self, name):
+        parts = name.split('/')
+        if not name or name.startswith('/') or any(part in ('', '.', '..') for part in parts):
+            raise ValueError(f"Invalid blob name '{name}'")
+        return os.path.join(self.directory, *parts)
+
+    def _generation(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            raise NotFound(path) from None
+
+    def _read(self, name, cached_generation):
+        path = self._path(name)
+        if cached_generation is not None and self._generation(path) == cached_generation:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                generation = os.fstat(f.fileno()).st_mtime_ns
+                return f.read(), generation
+        except FileNotFoundError:
+            raise NotFound(path) from None
+
+    def _write(self, name, data, content_type, if_generation_match):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = os.path.join(os.path.dirname(path), f".tmp-{uuid.uuid4().hex}")
+        with open(temp, 'wb') as f:
+            f.write(data)
+        try:
+            with self._write_lock:
+                try:
+                    current = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    current = 0
+                if if_generation_match is not None and if_generation_match != current:
+                    raise PreconditionFailed(f"{name} is at generation {current}, not {if_generation_match}")
+                generation = max(time.time_ns(), current + 1)
+                os.utime(temp, ns=(generation, generation))
+                if if_generation_match == 0:
+                    # Linking fails if another process created the file meanwhile
+                    try:
+                        os.link(temp, path)
+                    except FileExistsError:
+                        raise PreconditionFailed(f"{name} already exists") from None
+                else:
+                    os.replace(temp, path)
+                return generation
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def _delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            raise NotFound(name) from None
+
+    def _list(self, prefix):
+        # Only walk the directory the prefix points into
+        base = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        top = os.path.join(self.directory, *base.split('/')) if base else self.directory
+        names = []
+        for root, _, files in os.walk(top):
+            relative = os.path.relpath(root, self.directory).replace(os.sep, '/')
+            for file in files:
+                if file.startswith('.tmp-'):
+                    continue
+                name = file if relative == '.' else f"{relative}/{file}"
+                if name.startswith(prefix):
+                    names.append(name)
+        return names
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Returns the configured store, reading BYTEME_BLOB_STORE on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            name = os.environ.get("BYTEME_BLOB_STORE", "gcs").lower()
+            if name == "local":
+                _store = LocalBlobStore()
+            elif name == "gcs":
+                _store = GCSBlobStore()
+            else:
+                raise ValueError(f"Unknown BYTEME_BLOB_STORE '{name}', expected 'gcs' or 'local'")
+        return _store
+
+
+def set_blob_store(store):
+    """Replaces the configured store, e.g. with a LocalBlobStore in tests and benchmarks."""
+    global _store
+    with _store_lock:
+        _store = store
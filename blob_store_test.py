@@ -0,0 +1,160 @@
+#############################################################################
+# blob_store_test.py
+#
+# This file contains tests for blob_store.py.
+#############################################################################
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from google.api_core.exceptions import NotFound, NotModified, PreconditionFailed
+
+import blob_store
+from blob_store import GCSBlobStore, LocalBlobStore, get_blob_store, set_blob_store
+
+
+class TestLocalBlobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = LocalBlobStore(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_missing_blob(self):
+        self.assertEqual(self.store.read('plans/none.json'), (None, None))
+        self.assertEqual(self.store.read_json('plans/none.json'), (None, None))
+        self.assertFalse(self.store.delete('plans/none.json'))
+        self.assertEqual(self.store.metrics()['not_found'], 2)
+
+    def test_write_then_read(self):
+        generation = self.store.write_json('plans/user1.json', {"Day 1": [True]})
+
+        self.assertEqual(LocalBlobStore(self.directory).read_json('plans/user1.json'), ({"Day 1": [True]}, generation))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'plans', 'user1.json')))
+
+    def test_unchanged_blob_is_served_from_the_cache(self):
+        self.store.write('plans/user1.json', b'{}')
+
+        with patch('builtins.open', side_effect=AssertionError("read the file")):
+            self.assertEqual(self.store.read('plans/user1.json')[0], b'{}')
+        self.assertEqual(self.store.metrics()['hits'], 1)
+
+    def test_changed_blob_is_read_again(self):
+        self.store.write('plans/user1.json', b'old')
+        generation = LocalBlobStore(self.directory).write('plans/user1.json', b'new')
+
+        self.assertEqual(self.store.read('plans/user1.json'), (b'new', generation))
+        self.assertEqual(self.store.metrics()['hits'], 0)
+
+    def test_generation_preconditions(self):
+        first = self.store.write('plans/user1.json', b'1', if_generation_match=0)
+        second = self.store.write('plans/user1.json', b'2', if_generation_match=first)
+
+        self.assertGreater(second, first)
+        with self.assertRaises(PreconditionFailed):
+            self.store.write('plans/user1.json', b'3', if_generation_match=first)
+        with self.assertRaises(PreconditionFailed):
+            self.store.write('plans/user1.json', b'3', if_generation_match=0)
+        self.assertEqual(self.store.read('plans/user1.json'), (b'2', second))
+        self.assertEqual(self.store.metrics()['conflicts'], 2)
+        self.assertEqual(os.listdir(os.path.join(self.directory, 'plans')), ['user1.json'])
+
+    def test_list_by_prefix(self):
+        for name in ['events/a_1/2', 'events/a_1/1', 'events/a_10/1', 'other.json']:
+            self.store.write(name, b'')
+
+        self.assertEqual(self.store.list('events/a_1/'), ['events/a_1/1', 'events/a_1/2'])
+        self.assertEqual(self.store.list('events/a_1'), ['events/a_1/1', 'events/a_1/2', 'events/a_10/1'])
+        self.assertEqual(self.store.list('missing/'), [])
+
+    def test_cache_is_bounded(self):
+        store = LocalBlobStore(self.directory, cache_entries=2)
+        for name in 'abc':
+            store.write(name, b'')
+
+        self.assertEqual(store.metrics()['cached'], 2)
+
+    def test_names_stay_inside_the_directory(self):
+        for name in ['../escape', '/etc/passwd', 'a//b', '']:
+            with self.assertRaises(ValueError):
+                self.store.read(name)
+
+
+class TestGCSBlobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = GCSBlobStore()
+        self.store._bucket = MagicMock()
+        self.blob = self.store._bucket.blob.return_value
+
+    def test_read_is_one_request(self):
+        def download(if_generation_not_match=None):
+            self.blob.generation = 7
+            return b'{"a": 1}'
+
+        self.blob.download_as_bytes.side_effect = download
+
+        self.assertEqual(self.store.read_json('x.json'), ({"a": 1}, 7))
+        self.blob.download_as_bytes.assert_called_once_with(if_generation_not_match=None)
+        self.blob.exists.assert_not_called()
+
+    def test_missing_blob(self):
+        self.blob.download_as_bytes.side_effect = NotFound("x.json")
+
+        self.assertEqual(self.store.read('x.json'), (None, None))
+
+    def test_cached_blob_is_revalidated_by_generation(self):
+        self.blob.generation = 7
+        self.store.write('x.json', b'cached')
+        self.blob.download_as_bytes.side_effect = NotModified("x.json")
+
+        self.assertEqual(self.store.read('x.json'), (b'cached', 7))
+        self.blob.download_as_bytes.assert_called_once_with(if_generation_not_match=7)
+        self.assertEqual(self.store.metrics()['hits'], 1)
+
+    def test_write_passes_the_precondition(self):
+        self.blob.upload_from_string.side_effect = PreconditionFailed("x.json")
+
+        with self.assertRaises(PreconditionFailed):
+            self.store.write_json('x.json', {}, if_generation_match=3)
+        self.blob.upload_from_string.assert_called_once_with(b'{}', content_type='application/json',
+                                                             if_generation_match=3)
+
+    def test_client_is_created_once(self):
+        store = GCSBlobStore(bucket='test-bucket')
+        with patch('google.auth.default', return_value=(MagicMock(), 'project')), \
+                patch('google.cloud.storage.Client') as client:
+            self.assertIs(store.bucket(), store.bucket())
+        client.assert_called_once()
+        client.return_value.bucket.assert_called_once_with('test-bucket')
+
+
+class TestGetBlobStore(unittest.TestCase):
+
+    def tearDown(self):
+        set_blob_store(None)
+
+    def test_store_is_picked_from_the_environment(self):
+        set_blob_store(None)
+        with patch.dict(os.environ, {"BYTEME_BLOB_STORE": "local"}):
+            self.assertIsInstance(get_blob_store(), LocalBlobStore)
+        self.assertIs(get_blob_store(), get_blob_store())
+
+        set_blob_store(None)
+        with patch.dict(os.environ, {"BYTEME_BLOB_STORE": "s3"}):
+            with self.assertRaises(ValueError):
+                get_blob_store()
+
+    def test_default_is_gcs(self):
+        set_blob_store(None)
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsInstance(get_blob_store(), GCSBlobStore)
+        self.assertEqual(blob_store.BUCKET, 'byte-me-user-tasks')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+#############################################################################
+# cache.py
+#
+# This file contains the in-process read-through cache that sits in front of
+# the user-scoped reads in data_fetcher.py. It is a module-level object, so
+# every Streamlit session served by the same process shares it.
+#############################################################################
+
+import copy
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """A load in progress that other callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Set when the key is invalidated mid-load, so the result isn't stored
+        self.invalidated = False
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a per-entry TTL.
+
+    Concurrent misses on the same key are coalesced: the first caller runs the
+    loader and everyone else waits for its result, so N viewers of the same
+    data cost one backend query.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader, ttl):
+        """Returns the cached value for key, calling loader() to fill it on a miss.
+
+        None results are not cached so that failed reads are retried. ttl may
+        also be a function of the loaded value, e.g. to keep negative results
+        for less time.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        return self._load(key, loader, ttl, flight)
+
+    def _load(self, key, loader, ttl, flight):
+        """Runs loader() as the leader of flight and stores its result."""
+        try:
+            value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            with self._lock:
+                # Skip the store if this key was invalidated while we were loading
+                if value is not None and not flight.invalidated:
+                    self._entries[key] = (time.monotonic() + (ttl(value) if callable(ttl) else ttl), value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def get_or_refresh(self, key, loader, ttl, max_stale):
+        """Like get_or_load, but serves stale values while they are reloaded.
+
+        An entry up to max_stale seconds past its ttl is returned right away,
+        and one background thread reloads it; callers arriving while that
+        reload runs start no other. Only a missing entry, or one staler than
+        that, makes the caller wait for loader(). A failed background reload
+        keeps the stale value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or entry[0] + max_stale <= now:
+                entry = None
+            elif entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            else:
+                self._entries.move_to_end(key)
+                self.stale += 1
+                refresh = key not in self._inflight
+                if refresh:
+                    flight = self._inflight[key] = _Flight()
+
+        if entry is None:
+            return self.get_or_load(key, loader, ttl)
+        if refresh:
+            threading.Thread(target=self._refresh, args=(key, loader, ttl, flight),
+                             name="cache-refresh", daemon=True).start()
+        return entry[1]
+
+    def _refresh(self, key, loader, ttl, flight):
+        try:
+            self._load(key, loader, ttl, flight)
+        except Exception as e:
+            print(f"Error refreshing {key}: {e}")
+
+    def peek(self, key):
+        """Returns the fresh cached value for key, or None, without loading anything."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            return None
+
+    def put(self, key, value, ttl):
+        """Stores a value loaded elsewhere, e.g. one row of a batch query."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name, user_id=None):
+        """Drops every entry of one cached function, optionally only for one user.
+
+        Loads of those entries already in flight still answer their callers,
+        but their results aren't stored; loads of other keys are unaffected.
+        """
+        def matches(key):
+            return isinstance(key, tuple) and key[0] == name and (user_id is None or key[1] == user_id)
+
+        with self._lock:
+            for key in [k for k in self._entries if matches(k)]:
+                del self._entries[key]
+            for key, flight in self._inflight.items():
+                if matches(key):
+                    flight.invalidated = True
+
+    def clear(self):
+        with self._lock:
+            for flight in self._inflight.values():
+                flight.invalidated = True
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = self.stale = 0
+
+    def stats(self):
+        """Returns the hit/miss counters and current size of the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'stale': self.stale,
+                'size': len(self._entries),
+            }
+
+
+# Shared by every session in this process
+user_cache = TTLCache(maxsize=2048)
+
+
+def cache_key(name, user_id, **arguments):
+    """Builds the key cached() uses for one call of the fetcher called name."""
+    return (name, user_id, tuple(sorted(arguments.items())))
+
+
+def cached(ttl, cache=user_cache):
+    """Caches a user-scoped fetcher whose first argument is the user id.
+
+    Entries are keyed by (function name, user_id, remaining arguments). Calls
+    that inject their own client bypass the cache entirely, so tests and
+    callers with a specific client always hit that client. Callers get a
+    deep copy of the cached value, which every session shares, and may
+    change it and anything nested in it freely.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            if bound.arguments.get('client') is not None:
+                return func(*args, **kwargs)
+
+            arguments = dict(bound.arguments)
+            arguments.pop('client', None)
+            user_id = arguments.pop(next(iter(signature.parameters)))
+            key = cache_key(func.__name__, user_id, **arguments)
+
+            return copy.deepcopy(cache.get_or_load(key, lambda: func(*args, **kwargs), ttl))
+
+        return wrapper
+    return decorator
@@ -0,0 +1,198 @@
+#############################################################################
+# cache_test.py
+#
+# This file contains tests for cache.py.
+#############################################################################
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from cache import TTLCache, cached
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache(maxsize=2)
+
+    def test_hit_after_miss(self):
+        loader = MagicMock(return_value={'full_name': 'Remi'})
+
+        self.assertEqual(self.cache.get_or_load(('get_user_profile', 'user1', ()), loader, 60), {'full_name': 'Remi'})
+        self.assertEqual(self.cache.get_or_load(('get_user_profile', 'user1', ()), loader, 60), {'full_name': 'Remi'})
+
+        loader.assert_called_once()
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        loader = MagicMock(return_value=[])
+        key = ('get_user_posts', 'user1', ())
+
+        with patch('cache.time.monotonic', return_value=100.0):
+            self.cache.get_or_load(key, loader, 10)
+        with patch('cache.time.monotonic', return_value=111.0):
+            self.cache.get_or_load(key, loader, 10)
+
+        self.assertEqual(loader.call_count, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.get_or_load(('f', 'user1', ()), lambda: 1, 60)
+        self.cache.get_or_load(('f', 'user2', ()), lambda: 2, 60)
+        self.cache.get_or_load(('f', 'user1', ()), lambda: 1, 60)
+        self.cache.get_or_load(('f', 'user3', ()), lambda: 3, 60)
+
+        loader = MagicMock(return_value=2)
+        self.cache.get_or_load(('f', 'user2', ()), loader, 60)
+        loader.assert_called_once()
+
+    def test_none_is_not_cached(self):
+        loader = MagicMock(return_value=None)
+        self.cache.get_or_load(('f', 'user1', ()), loader, 60)
+        self.cache.get_or_load(('f', 'user1', ()), loader, 60)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_invalidate_one_user(self):
+        self.cache.get_or_load(('get_user_posts', 'user1', ()), lambda: ['a'], 60)
+        self.cache.get_or_load(('get_user_posts', 'user2', ()), lambda: ['b'], 60)
+
+        self.cache.invalidate('get_user_posts', 'user1')
+
+        self.assertEqual(self.cache.get_or_load(('get_user_posts', 'user1', ()), lambda: ['new'], 60), ['new'])
+        self.assertEqual(self.cache.get_or_load(('get_user_posts', 'user2', ()), lambda: ['new'], 60), ['b'])
+
+    def test_invalidate_only_discards_loads_of_that_key(self):
+        release = threading.Event()
+        results = {}
+
+        def slow_load(key, value):
+            def loader():
+                release.wait(5)
+                return value
+            results[key] = self.cache.get_or_load(key, loader, 60)
+
+        posts1, posts2 = ('get_user_posts', 'user1', ()), ('get_user_posts', 'user2', ())
+        threads = [threading.Thread(target=slow_load, args=(posts1, ['old'])),
+                   threading.Thread(target=slow_load, args=(posts2, ['b']))]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        self.cache.invalidate('get_user_posts', 'user1')
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {posts1: ['old'], posts2: ['b']})
+        self.assertEqual(self.cache.get_or_load(posts1, lambda: ['new'], 60), ['new'])
+        self.assertEqual(self.cache.get_or_load(posts2, lambda: ['new'], 60), ['b'])
+
+    def test_concurrent_misses_share_one_load(self):
+        calls = []
+        release = threading.Event()
+
+        def slow_loader():
+            calls.append(1)
+            release.wait(5)
+            return {'full_name': 'Blake'}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.get_or_load(('get_user_profile', 'user2', ()), slow_loader, 60))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'full_name': 'Blake'}] * 10)
+
+
+class TestGetOrRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache()
+        self.key = ('get_genai_advice', 'user1', ())
+
+    def test_stale_value_is_served_while_refreshing_once(self):
+        release = threading.Event()
+        refreshed = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            if len(calls) > 1:
+                release.wait(5)
+                refreshed.set()
+            return f'advice {len(calls)}'
+
+        with patch('cache.time.monotonic', return_value=100.0):
+            self.assertEqual(self.cache.get_or_refresh(self.key, loader, 10, 60), 'advice 1')
+        with patch('cache.time.monotonic', return_value=115.0):
+            # Every caller gets the stale advice at once; only one reload starts
+            for _ in range(5):
+                self.assertEqual(self.cache.get_or_refresh(self.key, loader, 10, 60), 'advice 1')
+        release.set()
+        refreshed.wait(5)
+        time.sleep(0.05)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.cache.get_or_refresh(self.key, loader, 10, 60), 'advice 2')
+        self.assertEqual(self.cache.stats()['stale'], 5)
+
+    def test_too_stale_value_is_reloaded_in_the_caller(self):
+        loader = MagicMock(side_effect=['old', 'new'])
+
+        with patch('cache.time.monotonic', return_value=100.0):
+            self.cache.get_or_refresh(self.key, loader, 10, 60)
+        with patch('cache.time.monotonic', return_value=171.0):
+            self.assertEqual(self.cache.get_or_refresh(self.key, loader, 10, 60), 'new')
+
+    def test_failed_refresh_keeps_stale_value(self):
+        done = threading.Event()
+
+        def failing():
+            done.set()
+            raise RuntimeError('model unavailable')
+
+        with patch('cache.time.monotonic', return_value=100.0):
+            self.cache.get_or_refresh(self.key, lambda: 'advice', 10, 60)
+        with patch('cache.time.monotonic', return_value=115.0), patch('builtins.print'):
+            self.assertEqual(self.cache.get_or_refresh(self.key, failing, 10, 60), 'advice')
+            done.wait(5)
+            time.sleep(0.05)
+            self.assertEqual(self.cache.get_or_refresh(self.key, lambda: 'retried', 10, 60), 'advice')
+
+
+class TestCachedDecorator(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TTLCache()
+        self.backend = MagicMock(return_value=[{'WorkoutId': 'workout1'}])
+
+        @cached(ttl=60, cache=self.cache)
+        def get_user_workouts(user_id, client=None):
+            return self.backend(user_id)
+
+        self.get_user_workouts = get_user_workouts
+
+    def test_repeated_reads_hit_backend_once(self):
+        self.get_user_workouts('user1')
+        self.get_user_workouts('user1')
+        self.backend.assert_called_once_with('user1')
+
+    def test_injected_client_bypasses_cache(self):
+        self.get_user_workouts('user1', client=MagicMock())
+        self.get_user_workouts('user1', client=MagicMock())
+        self.assertEqual(self.backend.call_count, 2)
+
+    def test_callers_get_a_copy(self):
+        self.get_user_workouts('user1').append({'WorkoutId': 'workout2'})
+        self.get_user_workouts('user1')[0]['WorkoutId'] = 'changed'
+        self.assertEqual(self.get_user_workouts('user1'), [{'WorkoutId': 'workout1'}])
+
+
+if __name__ == "__main__":
+    unittest.main()
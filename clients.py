@@ -0,0 +1,72 @@
+#############################################################################
+# clients.py
+#
+# This file contains the shared BigQuery client registry used by
+# data_fetcher.py. Building a bigquery.Client means credential discovery, a
+# new HTTP session and new TLS handshakes, so every fetcher borrows one
+# long-lived client per project from here instead of creating its own.
+#############################################################################
+
+import os
+import threading
+
+import requests
+from google.cloud import bigquery
+
+# Project that owns the bytemeproject dataset
+DEFAULT_PROJECT = "keishlyanysanabriatechx25"
+
+# Maximum number of pooled HTTP connections kept open per client
+POOL_SIZE = int(os.environ.get("BIGQUERY_POOL_SIZE", "32"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _create_client(project, pool_size):
+    """Builds a BigQuery client whose HTTP session keeps up to pool_size connections alive."""
+    import google.auth
+    from google.auth.transport.requests import AuthorizedSession
+
+    credentials, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+
+    return bigquery.Client(project=project, credentials=credentials, _http=session)
+
+
+def get_bigquery_client(project=None, pool_size=None):
+    """Returns the process-wide BigQuery client for a project, creating it on first use.
+
+    The client is shared by every thread, Streamlit session and rerun in the
+    process. Callers that need a specific client (e.g. tests) should keep
+    passing it explicitly through the fetchers' client parameter instead.
+
+    Args:
+        project (str, optional): The billing project. None uses the environment's default project.
+        pool_size (int, optional): HTTP connection pool size for a newly created client.
+            Defaults to the BIGQUERY_POOL_SIZE environment variable (32).
+
+    Returns:
+        bigquery.Client: The shared client for that project.
+    """
+    client = _clients.get(project)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(project)
+            if client is None:
+                client = _create_client(project, pool_size or POOL_SIZE)
+                _clients[project] = client
+    return client
+
+
+def reset_clients():
+    """Closes and forgets every pooled client. Mainly useful in tests."""
+    with _clients_lock:
+        for client in _clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
@@ -0,0 +1,70 @@
+#############################################################################
+# clients_test.py
+#
+# This file contains tests for clients.py.
+#############################################################################
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+import clients
+
+
+class TestGetBigQueryClient(unittest.TestCase):
+
+    def setUp(self):
+        clients.reset_clients()
+
+    def tearDown(self):
+        clients.reset_clients()
+
+    @patch('clients._create_client')
+    def test_client_is_reused(self, mock_create_client):
+        """The same project always gets the same client object."""
+        mock_create_client.side_effect = lambda project, pool_size: MagicMock()
+
+        first = clients.get_bigquery_client("project-a")
+        second = clients.get_bigquery_client("project-a")
+
+        self.assertIs(first, second)
+        mock_create_client.assert_called_once_with("project-a", clients.POOL_SIZE)
+
+    @patch('clients._create_client')
+    def test_one_client_per_project(self, mock_create_client):
+        mock_create_client.side_effect = lambda project, pool_size: MagicMock()
+
+        self.assertIsNot(clients.get_bigquery_client("project-a"), clients.get_bigquery_client("project-b"))
+        self.assertIsNot(clients.get_bigquery_client(), clients.get_bigquery_client("project-a"))
+        self.assertEqual(mock_create_client.call_count, 3)
+
+    @patch('clients._create_client')
+    def test_concurrent_first_use_creates_one_client(self, mock_create_client):
+        mock_create_client.side_effect = lambda project, pool_size: MagicMock()
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(clients.get_bigquery_client("p")))
+                   for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_create_client.assert_called_once()
+        self.assertTrue(all(result is results[0] for result in results))
+
+    @patch('clients._create_client')
+    def test_injected_client_is_honored(self, mock_create_client):
+        """Fetchers still use a client that is passed in explicitly."""
+        from data_fetcher import get_pending_requests
+
+        mock_client = MagicMock()
+        mock_client.query.return_value.result.return_value = [{"SenderUsername": "blake", "RequesterId": "user2"}]
+
+        result = get_pending_requests("user1", client=mock_client)
+
+        self.assertEqual(result, [{"username": "blake", "user_id": "user2"}])
+        mock_create_client.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
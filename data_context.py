@@ -0,0 +1,79 @@
+#############################################################################
+# data_context.py
+#
+# This file contains the per-rerun data context. app.py creates one at the
+# top of every script run and passes it to the display functions in
+# modules.py, so each distinct read happens exactly once per rerun. It is
+# discarded when the run ends; data that should outlive a rerun belongs in
+# the process cache (cache.py) instead.
+#############################################################################
+
+import threading
+from collections import Counter
+
+from prefetch import prefetch, DEFAULT_TIMEOUT
+
+
+class DataContext:
+    """Memoizes fetcher results for the lifetime of one script run."""
+
+    def __init__(self):
+        self._results = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = {}
+
+    @property
+    def backend_calls(self):
+        """How many times a fetcher actually ran during this render."""
+        return sum(self.calls.values())
+
+    def _key(self, func, args):
+        return (func.__name__, tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args))
+
+    def _invoke(self, func, *args):
+        with self._lock:
+            self.calls[func.__name__] += 1
+        return func(*args)
+
+    def prefetch(self, *fetches, timeout=DEFAULT_TIMEOUT):
+        """Starts the given reads in the background.
+
+        Args:
+            *fetches: (function, args) or (function, args, timeout) tuples.
+            timeout (float): Seconds to wait for fetches that don't set their own timeout.
+        """
+        specs = {}
+        for spec in fetches:
+            key = self._key(spec[0], spec[1])
+            if key not in self._results and key not in self._pending and key not in specs:
+                specs[key] = (self._invoke, (spec[0],) + tuple(spec[1])) + tuple(spec[2:])
+        page_data = prefetch(specs, timeout=timeout)
+        for key in specs:
+            self._pending[key] = page_data
+
+    def fetch(self, func, *args, default=None):
+        """Returns func(*args), running it at most once per context.
+
+        Prefetched reads are waited on up to their deadline. A read that timed
+        out or failed returns default and its error is kept in self.errors;
+        later fetches of it return their default too instead of running it again.
+        """
+        key = self._key(func, args)
+        if key in self._results:
+            return self._results[key]
+        if key in self.errors:
+            return default
+
+        page_data = self._pending.pop(key, None)
+        if page_data is not None:
+            result = page_data.get(key, default)
+            if key in page_data.errors:
+                self.errors[key] = page_data.errors[key]
+                return result
+        else:
+            result = self._invoke(func, *args)
+
+        self._results[key] = result
+        return result
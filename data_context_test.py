@@ -0,0 +1,76 @@
+#############################################################################
+# data_context_test.py
+#
+# This file contains tests for data_context.py.
+#############################################################################
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from data_context import DataContext
+
+
+def get_user_workouts(user_id):
+    return [{'WorkoutId': 'workout1', 'user': user_id}]
+
+
+class TestDataContext(unittest.TestCase):
+
+    def test_repeated_fetch_runs_once(self):
+        get_user_posts = MagicMock(__name__='get_user_posts', return_value=[])
+        ctx = DataContext()
+
+        ctx.fetch(get_user_posts, 'user1')
+        ctx.fetch(get_user_posts, 'user1')
+        ctx.fetch(get_user_posts, 'user2')
+
+        self.assertEqual(get_user_posts.call_count, 2)
+        self.assertEqual(ctx.backend_calls, 2)
+        self.assertEqual(ctx.calls['get_user_posts'], 2)
+
+    def test_prefetched_result_is_reused(self):
+        ctx = DataContext()
+        ctx.prefetch((get_user_workouts, ('user1',)))
+
+        first = ctx.fetch(get_user_workouts, 'user1')
+        second = ctx.fetch(get_user_workouts, 'user1')
+
+        self.assertIs(first, second)
+        self.assertEqual(ctx.backend_calls, 1)
+
+    def test_list_arguments_are_memoized(self):
+        get_user_profiles = MagicMock(__name__='get_user_profiles', return_value={})
+        ctx = DataContext()
+
+        ctx.fetch(get_user_profiles, ['user2', 'user3'])
+        ctx.fetch(get_user_profiles, ['user2', 'user3'])
+
+        get_user_profiles.assert_called_once()
+
+    def test_timed_out_prefetch_returns_default(self):
+        def get_genai_advice(user_id):
+            time.sleep(1)
+            return {'content': 'Keep going!'}
+
+        ctx = DataContext()
+        ctx.prefetch((get_genai_advice, ('user1',), 0.05))
+
+        self.assertIsNone(ctx.fetch(get_genai_advice, 'user1'))
+        self.assertEqual(len(ctx.errors), 1)
+
+    def test_timed_out_prefetch_is_not_run_again(self):
+        get_user_workouts_frame = MagicMock(__name__='get_user_workouts_frame', side_effect=lambda user_id: time.sleep(1))
+        ctx = DataContext()
+        ctx.prefetch((get_user_workouts_frame, ('user1',), 0.05))
+
+        ctx.fetch(get_user_workouts_frame, 'user1')
+        started = time.perf_counter()
+        self.assertEqual(ctx.fetch(get_user_workouts_frame, 'user1', default=[]), [])
+
+        self.assertLess(time.perf_counter() - started, 0.5)
+        get_user_workouts_frame.assert_called_once()
+        self.assertEqual(ctx.backend_calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,17 +8,39 @@
 # testing earlier units.
 #############################################################################
 
+import copy
+import hashlib
 import json
 import random
+import time
+import uuid
 from google.cloud import bigquery
+from google.api_core.exceptions import PreconditionFailed
 import os
-import vertexai
-from vertexai.generative_models import GenerativeModel
-from dotenv import load_dotenv
 import datetime
 import pytz
-
-_vertexai_initialized = False
+from clients import DEFAULT_PROJECT
+from backends import get_client
+from cache import cached, cache_key, user_cache
+from write_queue import write_queue
+from username_index import username_index
+from friend_graph import friend_graph
+from llm_gateway import LLMTimeoutError, llm
+from plan_stream import PlanStreamParser, plan_stream_metrics
+from workout_summary import format_summary, summarize_workouts
+from blob_store import get_blob_store
+from task_log import read_completion_state, record_completion, snapshot_name
+
+# Seconds a cached user profile stays fresh
+PROFILE_TTL = 300
+
+# Seconds a cached workout summary stays fresh
+WORKOUT_SUMMARY_TTL = 300
+
+# Seconds generated advice stays fresh, and seconds past that it is still
+# shown while newer advice is generated in the background
+ADVICE_TTL = int(os.environ.get("ADVICE_TTL", "900"))
+ADVICE_MAX_STALE = int(os.environ.get("ADVICE_MAX_STALE", "86400"))
 
 # Import for get_user_posts
 from google.cloud import bigquery
@@ -57,7 +79,7 @@ users = {
 #asked Gemini for help on how to write the query since it needed a lot of parameters
 def get_user_sensor_data(user_id, workout_id, client=None):
     if client is None:
-        client = bigquery.Client(project="keishlyanysanabriatechx25")
+        client = get_client(DEFAULT_PROJECT)
 
     '''Fetches data from BigQuery using a given SQL query.
 
@@ -69,8 +91,75 @@ def get_user_sensor_data(user_id, workout_id, client=None):
         A list of rows, where each row is a dictionary, or None if an error occurs.
     '''
     try:
-        query_string = f"""
-            SELECT
+        return [row for page in iter_user_sensor_data(user_id, workout_id, output='rows', client=client) for row in page]
+
+    except Exception as e:
+        print(f"Error fetching BigQuery data: {e}")
+        return None
+
+def get_user_sensor_frame(user_id, workout_id, client=None):
+    """Returns the sensor readings of a workout as one DataFrame, or None on error.
+
+    Built from the DataFrame pages of iter_user_sensor_data, so no dict is
+    created per reading. display_sensor_data takes it as is.
+    """
+    import pandas as pd
+
+    try:
+        pages = list(iter_user_sensor_data(user_id, workout_id, output='dataframe', client=client))
+    except Exception as e:
+        print(f"Error fetching BigQuery data: {e}")
+        return None
+    return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+
+def iter_user_sensor_data(user_id, workout_id, start=None, end=None, sensor_ids=None,
+                          page_size=10000, output='dataframe', use_storage_api=False, client=None):
+    """Streams the sensor readings of a workout one page at a time, oldest first.
+
+    The filters are applied by the query, and only one page is held in memory
+    at a time, so callers can aggregate long, high-frequency workouts without
+    materializing every reading.
+
+    Args:
+        user_id (str): The ID of the user who owns the workout.
+        workout_id (str): The ID of the workout.
+        start (datetime.datetime, optional): Only readings at or after this time.
+        end (datetime.datetime, optional): Only readings before this time.
+        sensor_ids (list, optional): Only readings from these SensorIds.
+        page_size (int): Rows per page when reading through the REST API.
+        output (str): 'dataframe' for pandas DataFrames, 'arrow' for pyarrow
+            RecordBatches, or 'rows' for lists of dictionaries.
+        use_storage_api (bool): Download through the BigQuery Storage Read API
+            when google-cloud-bigquery-storage is installed. Pages then follow
+            the read streams instead of page_size.
+
+    Yields:
+        One page of readings with the columns UserId, SensorId, Name, Units,
+        Timestamp and SensorValue.
+    """
+    if output not in ('dataframe', 'arrow', 'rows'):
+        raise ValueError(f"Unknown output '{output}', expected 'dataframe', 'arrow' or 'rows'")
+
+    if client is None:
+        client = get_client(DEFAULT_PROJECT)
+
+    filters = []
+    query_parameters = [
+        bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
+        bigquery.ScalarQueryParameter("workout_id", "STRING", workout_id),
+    ]
+    if start is not None:
+        filters.append("AND SensorData.Timestamp >= @start")
+        query_parameters.append(bigquery.ScalarQueryParameter("start", "TIMESTAMP", start))
+    if end is not None:
+        filters.append("AND SensorData.Timestamp < @end")
+        query_parameters.append(bigquery.ScalarQueryParameter("end", "TIMESTAMP", end))
+    if sensor_ids:
+        filters.append("AND SensorData.SensorId IN UNNEST(@sensor_ids)")
+        query_parameters.append(bigquery.ArrayQueryParameter("sensor_ids", "STRING", list(sensor_ids)))
+
+    query = f"""
+        SELECT
             Workouts.UserId,
             COALESCE(SensorTypes.SensorId, SensorData.SensorId) AS SensorId,
             SensorTypes.Name,
@@ -86,23 +175,37 @@ def get_user_sensor_data(user_id, workout_id, client=None):
             `keishlyanysanabriatechx25.bytemeproject.SensorTypes` AS SensorTypes
         ON SensorData.SensorId = SensorTypes.SensorId
         WHERE
-        Workouts.UserId = '{user_id}'
-        AND Workouts.WorkoutId = '{workout_id}';
-        """
+            Workouts.UserId = @user_id
+            AND Workouts.WorkoutId = @workout_id
+            {' '.join(filters)}
+        ORDER BY
+            SensorData.Timestamp
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    rows = client.query(query, job_config=job_config).result(page_size=page_size)
 
-        query_job = client.query(query_string)
-        results = query_job.result()
+    if output == 'rows':
+        for page in rows.pages:
+            yield [dict(row.items()) for row in page]
+        return
 
-        data = [dict(row.items()) for row in results]
-        return data
+    bqstorage_client = None
+    if use_storage_api:
+        try:
+            from google.cloud import bigquery_storage
+            bqstorage_client = bigquery_storage.BigQueryReadClient()
+        except ImportError:
+            print("google-cloud-bigquery-storage is not installed, reading through the REST API")
 
-    except Exception as e:
-        print(f"Error fetching BigQuery data: {e}")
-        return None
+    if output == 'arrow':
+        yield from rows.to_arrow_iterable(bqstorage_client=bqstorage_client)
+    else:
+        yield from rows.to_dataframe_iterable(bqstorage_client=bqstorage_client)
 
+@cached(ttl=60)
 def get_user_workouts(user_id, client=None):
     if client is None:
-        client = bigquery.Client()
+        client = get_client()
     
     query = f"""
         SELECT
@@ -139,14 +242,74 @@ def get_user_workouts(user_id, client=None):
     #print(workouts)
     return workouts
 
+@cached(ttl=60)
+def get_user_workouts_frame(user_id, client=None):
+    """Returns a user's workouts as one columnar, Arrow-backed DataFrame.
+
+    The columnar counterpart of get_user_workouts: the query result goes
+    straight to Arrow and into pandas without building a dict per row.
+    Timestamps keep a native timestamp dtype and the rows come back sorted
+    newest first, so callers don't need to re-sort.
+
+    Args:
+        user_id (str): The user whose workouts are fetched.
+
+    Returns:
+        pd.DataFrame: One row per workout with the columns WorkoutId,
+        StartTimestamp, end_timestamp, StartLocationLat, StartLocationLong,
+        EndLocationLat, EndLocationLong, distance, steps and calories_burned.
+    """
+    import pandas as pd
+
+    if client is None:
+        client = get_client()
+
+    query = """
+        SELECT
+            WorkoutId,
+            StartTimestamp,
+            EndTimestamp AS end_timestamp,
+            StartLocationLat,
+            StartLocationLong,
+            EndLocationLat,
+            EndLocationLong,
+            TotalDistance AS distance,
+            TotalSteps AS steps,
+            CaloriesBurned AS calories_burned
+        FROM
+            `keishlyanysanabriatechx25.bytemeproject.Workouts`
+        WHERE
+            UserId = @user_id
+        ORDER BY
+            StartTimestamp DESC
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("user_id", "STRING", user_id)]
+    )
+    table = client.query(query, job_config=job_config).result().to_arrow()
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+@cached(ttl=WORKOUT_SUMMARY_TTL)
+def get_workout_summary(user_id, client=None):
+    """Returns the statistical profile of a user's workouts used in the model prompts.
+
+    Args:
+        user_id (str): The user whose workouts are summarized.
+
+    Returns:
+        dict: See workout_summary.summarize_workouts.
+    """
+    return summarize_workouts(get_user_workouts_frame(user_id, client=client))
+
 # Function fixed by Claude: "Fix code so that it has job_config"
+@cached(ttl=PROFILE_TTL)
 def get_user_profile(user_id, client=None):
     # function: get_user_profile
     # input: user_id (str) - the ID of the user whose profile is being fetched
     # output: dict - contains full_name, username, date_of_birth, profile_image, and friends list
 
     if client is None:
-        client = bigquery.Client(project="keishlyanysanabriatechx25")
+        client = get_client(DEFAULT_PROJECT)
     
     query = """
         SELECT
@@ -189,12 +352,84 @@ def get_user_profile(user_id, client=None):
     else:
         return {}
 
+def get_user_profiles(user_ids, client=None):
+    """Returns the profiles of many users using a single query.
+
+    Profiles already in the cache are served from it; the rest are fetched
+    together with one UNNEST(@ids) query and cached individually, so later
+    get_user_profile calls for the same users are hits too.
+
+    Args:
+        user_ids (iterable): The IDs of the users whose profiles are being fetched.
+
+    Returns:
+        dict: Maps each found user_id to the same dictionary get_user_profile returns,
+              copied like its result is. Users that don't exist are left out.
+    """
+    # Like the cached fetchers, an injected client bypasses the cache
+    use_cache = client is None
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = user_cache.peek(cache_key('get_user_profile', user_id)) if use_cache else None
+        if profile is not None:
+            profiles[user_id] = copy.deepcopy(profile)
+        else:
+            missing.append(user_id)
+
+    if not missing:
+        return profiles
+
+    if client is None:
+        client = get_client(DEFAULT_PROJECT)
+
+    query = """
+        SELECT
+    u.UserId,
+    u.Name,
+    u.Username,
+    u.ImageUrl,
+    u.DateOfBirth,
+    ARRAY_AGG(CASE
+        WHEN f.UserId1 = u.UserId THEN f.UserId2
+        WHEN f.UserId2 = u.UserId THEN f.UserId1
+        ELSE NULL
+    END IGNORE NULLS) AS friends
+    FROM
+    keishlyanysanabriatechx25.bytemeproject.Users u
+    LEFT JOIN
+    keishlyanysanabriatechx25.bytemeproject.Friends f ON u.UserId = f.UserId1 OR u.UserId = f.UserId2
+    WHERE
+    u.UserId IN UNNEST(@ids)
+    GROUP BY
+    u.UserId, u.Name, u.Username, u.ImageUrl, u.DateOfBirth
+    """
+
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter("ids", "STRING", missing)]
+    )
+
+    for row in client.query(query, job_config=job_config).result():
+        profile = {
+            "full_name": row.Name,
+            "username": row.Username,
+            "date_of_birth": row.DateOfBirth,
+            "profile_image": row.ImageUrl,
+            "friends": row.friends
+        }
+        if use_cache:
+            user_cache.put(cache_key('get_user_profile', row.UserId), copy.deepcopy(profile), PROFILE_TTL)
+        profiles[row.UserId] = profile
+
+    return profiles
+
 '''
 Funcion partially created by ChatGPT and Claude: "fix the following Function: get_user_posts in data_fetcher.py 
 Returns a list of a user's posts. Some data in a post may not be populated.
 Input: user_id
 Output: A list of posts. Each post is a dictionary with keys user_id, post_id, timestamp, content, and image." 
 '''
+@cached(ttl=60)
 def get_user_posts(user_id, client=None):
     """Returns a list of a user's posts from the BigQuery database.
 
@@ -207,7 +442,7 @@ def get_user_posts(user_id, client=None):
     """
 
     if client is None:
-        client = bigquery.Client()
+        client = get_client()
 
     # Query to fetch posts for the given user_id and join with Users table
     query = f"""
@@ -228,93 +463,163 @@ def get_user_posts(user_id, client=None):
     results = client.query(query)
 
     # Process the results and return the list of posts
-    posts = []
-    for row in results:
-        post = {
-            'user_id': row['AuthorId'],
-            'post_id': row['PostId'],
-            'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
-            'content': row['Content'] if row['Content'] else '',  # Handle empty content
-            'image': row['PostImageUrl'] if row['PostImageUrl'] else '',  # Handle missing post image
-            'username': row['Username'],  # Add username from Users table
-            'user_image': row['UserImageUrl']  # Add user's profile image from Users table
-        }
-        posts.append(post)
-    
-    return posts
+    return [_post_from_row(row) for row in results]
+
+def _post_from_row(row):
+    """Turns a Posts row joined with its author's Users row into a post dictionary."""
+    return {
+        'user_id': row['AuthorId'],
+        'post_id': row['PostId'],
+        'timestamp': row['Timestamp'].strftime('%Y-%m-%d %H:%M:%S'),
+        'content': row['Content'] if row['Content'] else '',  # Handle empty content
+        'image': row['PostImageUrl'] if row['PostImageUrl'] else '',  # Handle missing post image
+        'username': row['Username'],  # Add username from Users table
+        'user_image': row['UserImageUrl']  # Add user's profile image from Users table
+    }
+
+# Posts per feed page
+FEED_PAGE_SIZE = 20
+
+def get_feed(user_id, cursor=None, limit=FEED_PAGE_SIZE, client=None):
+    """Returns one page of the newest posts by a user and all of their friends.
+
+    Pages are keyset-paginated on (Timestamp, PostId): each page continues
+    strictly after the last post of the previous one, so the query reads
+    only one page of posts however deep the user has scrolled, and posts
+    added meanwhile never shift a page.
+
+    Args:
+        user_id (str): The user whose feed is shown.
+        cursor (tuple, optional): The cursor returned with the previous page.
+            None starts from the newest post.
+        limit (int): Posts per page.
+
+    Returns:
+        tuple: (posts, next_cursor). posts is a list of dictionaries like
+        get_user_posts returns, newest first; next_cursor is None on the last page.
+    """
+    if client is None:
+        client = get_client()
+
+    query_parameters = [
+        bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
+        # One extra row tells whether there is a next page
+        bigquery.ScalarQueryParameter("limit", "INT64", limit + 1),
+    ]
+    after_cursor = ""
+    if cursor is not None:
+        after_cursor = "AND (p.Timestamp < @cursor_timestamp OR (p.Timestamp = @cursor_timestamp AND p.PostId < @cursor_post_id))"
+        query_parameters += [
+            bigquery.ScalarQueryParameter("cursor_timestamp", "TIMESTAMP", cursor[0]),
+            bigquery.ScalarQueryParameter("cursor_post_id", "STRING", cursor[1]),
+        ]
+
+    query = f"""
+        WITH authors AS (
+            SELECT @user_id AS UserId
+            UNION DISTINCT
+            SELECT UserId2 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` WHERE UserId1 = @user_id
+            UNION DISTINCT
+            SELECT UserId1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` WHERE UserId2 = @user_id
+        )
+        SELECT p.PostId, p.AuthorId, p.Timestamp, p.Content, p.ImageUrl AS PostImageUrl,
+            u.Username, u.ImageUrl AS UserImageUrl
+        FROM `keishlyanysanabriatechx25.bytemeproject.Posts` p
+        JOIN `keishlyanysanabriatechx25.bytemeproject.Users` u
+        ON p.AuthorId = u.UserId
+        WHERE p.AuthorId IN (SELECT UserId FROM authors)
+            {after_cursor}
+        ORDER BY p.Timestamp DESC, p.PostId DESC
+        LIMIT @limit
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    rows = list(client.query(query, job_config=job_config).result())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['Timestamp'], rows[-1]['PostId'])
+    return [_post_from_row(row) for row in rows], next_cursor
 
 '''
 Function created by Claude AI: "create a function that adds by using these lines, it adds the post to the database:
 post_content = f"I've taken {total_steps} steps in my fitness journey! #FitnessGoals" add_post_to_database(userId, post_content)"
 '''
-def add_post_to_database(user_id, content, image_url=None, client=None):
+def add_post_to_database(user_id, content, image_url=None, client=None, idempotency_key=None):
     """Adds a post to the BigQuery database.
+
+    The post is handed to the write queue (write_queue.py) and written in the
+    background, so this returns without waiting for the insert. Submitting
+    again with the same idempotency_key, e.g. when a rerun replays the same
+    button click, doesn't create a second copy.
    
     Args:
         user_id (str): The ID of the user creating the post.
         content (str): The content of the post.
         image_url (str, optional): URL of the image for the post. Defaults to None.
+        idempotency_key (str, optional): Identifies the event that created the
+            post, e.g. one button click, for deduplication. Without one,
+            every call adds a post, even with the same content.
        
     Returns:
-        bool: True if successful, False otherwise.
+        str: The PostId of the queued post, or False if it couldn't be queued.
     """
 
-    if client is None:
-        client = bigquery.Client()
-
     try:
-        # Generate a unique post ID (you might have a different approach)
-        import uuid
-        post_id = str(uuid.uuid4())
-       
         # Get current timestamp
         from datetime import datetime
         current_timestamp = datetime.now()
-       
-        # Prepare the INSERT query
-        table_id = "keishlyanysanabriatechx25.bytemeproject.Posts"
-       
+
         # Prepare the row to be inserted
-        rows_to_insert = [{
-            'PostId': post_id,
+        row = {
+            'PostId': str(uuid.uuid4()),
             'AuthorId': user_id,
             'Timestamp': current_timestamp.strftime('%Y-%m-%d %H:%M:%S'),
             'Content': content,
             'ImageUrl': image_url,
-        }]
-       
-        # Insert the row into BigQuery
-        errors = client.insert_rows_json(table_id, rows_to_insert)
-       
-        if errors == []:
-            print(f"New post added successfully")
-            return True
-        else:
-            print(f"Errors occurred while adding post: {errors}")
-            return False
+        }
+
+        # The author's cached posts are dropped once the row has landed
+        return write_queue.submit("keishlyanysanabriatechx25.bytemeproject.Posts", row, row['PostId'],
+                                  idempotency_key=idempotency_key, client=client,
+                                  on_written=lambda row: user_cache.invalidate('get_user_posts', user_id))
            
     except Exception as e:
         print(f"Error adding post to database: {e}")
         return False
 
 def get_genai_advice(user_id):
+    """Returns motivational advice for a user, generating it at most once per ADVICE_TTL.
+
+    Advice is cached per user. Once it is older than ADVICE_TTL the cached
+    advice is still returned while new advice is generated in the background,
+    so only a user's first page view (or one after ADVICE_MAX_STALE) waits
+    for the model, and concurrent sessions of one user share one generation.
+
+    Returns:
+        dict: The advice, or None if the model didn't answer before its
+        deadline. Nothing is cached then, so the next view tries again.
+    """
+    try:
+        return copy.deepcopy(user_cache.get_or_refresh(cache_key('get_genai_advice', user_id),
+                                                       lambda: _generate_genai_advice(user_id),
+                                                       ADVICE_TTL, ADVICE_MAX_STALE))
+    except LLMTimeoutError as e:
+        print(f"Error generating advice: {e}")
+        return None
 
-    #had to do this global vertexai variable to handle mocks in tests correctly
-    global _vertexai_initialized
-    load_dotenv()
-    if not _vertexai_initialized:
-        import vertexai
-        vertexai.init(project=os.environ.get("dagutierrez17techx25"), location="us-central1")
-        _vertexai_initialized = True
 
-    workouts = get_user_workouts(user_id)
+def _generate_genai_advice(user_id):
 
-    #call Gemini and give it instructions on how to answer
-    model = GenerativeModel("gemini-1.5-flash-002")
+    # A fixed-size profile of the user's workouts instead of the raw history (see workout_summary.py)
+    workout_summary = format_summary(get_workout_summary(user_id))
 
-    system_instruction = ("You are a the main motivational trainer for a fitness app. You are getting information about the user's past workouts in the 'workouts' list of dictionaries")
+    #call Gemini (through the gateway, see llm_gateway.py) and give it instructions on how to answer
 
-    response = model.generate_content("Please give me a motivational message for the user of this fitness app based on the 'workouts' lis of dictionaries that is received by calling 'get_user_workouts'. Please just output 1 motivational message, and also please don't mention 'get_user_workouts', just say the message")
+    system_instruction = ("You are a the main motivational trainer for a fitness app. You are getting a summary of the user's past workouts")
+
+    response = llm.generate(f"Please give me a motivational message for the user of this fitness app based on this summary of their workouts:\n{workout_summary}\nPlease just output 1 motivational message, and also please don't mention the summary, just say the message",
+                            label="advice")
     
     #added more possible images and randomly select 1
     image = random.choice([
@@ -339,33 +644,23 @@ def get_friend_data(user_id, friend_username, client=None):
     determines if the two users are friends.
     """
 
-    if client is None:
-        client = bigquery.Client()
-
-    # Step 1: Look up UserId of friend_username
-    get_friend_id_query = """
-    SELECT UserId FROM `keishlyanysanabriatechx25.bytemeproject.Users`
-    WHERE Username = @friend_username
-    """
-    job_config_lookup = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("friend_username", "STRING", friend_username),
-        ]
-    )
-
-    result = client.query(get_friend_id_query, job_config=job_config_lookup).result()
-    rows = list(result)
+    # Step 1: Look up UserId of friend_username in the username index, querying
+    # on a miss so users who signed up since the index was loaded are found too
+    friend_id = username_index.lookup(friend_username, client, fallback=True)
 
-    if not rows:
+    if friend_id is None:
         return f"Username '{friend_username}' does not exist."
 
-    friend_id = rows[0]["UserId"]
-
     # Step 2: Check for self
     if user_id == friend_id:
         return "You cannot add yourself as a friend."
 
-    # Step 3: Check if the users are already friends
+    # Step 3: Check if the users are already friends, in memory unless a client was passed in
+    if client is None:
+        if friend_graph.are_friends(user_id, friend_id):
+            return f"You and '{friend_username}' are friends."
+        return f"You and '{friend_username}' are not friends yet."
+
     check_friend_query = """
     SELECT * FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
     WHERE (UserId1 = @user_id AND UserId2 = @friend_id)
@@ -385,143 +680,182 @@ def get_friend_data(user_id, friend_username, client=None):
     else:
         return f"You and '{friend_username}' are not friends yet."
 
-# Function mostly made by ChatGPT: "Following the database structure, create a function that lets the user send a friend request"
-def send_friend_request(user_id, friend_username, client=None):
-    """
-    Sends a friend request from user_id to the user with friend_username.
-    """
-
-    if client is None:
-        client = bigquery.Client()
-
-    # Step 1: Resolve friend_username to friend_id
-    get_friend_id_query = """
-    SELECT UserId FROM `keishlyanysanabriatechx25.bytemeproject.Users`
-    WHERE Username = @friend_username
-    """
-    job_config_lookup = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("friend_username", "STRING", friend_username),
-        ]
-    )
-
-    result = client.query(get_friend_id_query, job_config=job_config_lookup).result()
-    rows = list(result)
+# Attempts a friend operation gets when a concurrent transaction aborts it,
+# and the base delay in seconds between them
+FRIEND_OP_ATTEMPTS = 3
+FRIEND_OP_BACKOFF = 0.2
 
-    if not rows:
-        return f"Username '{friend_username}' does not exist."
+def _is_concurrent_abort(error):
+    """Whether error is a transaction aborted by a concurrent one, which is safe to retry."""
+    message = str(error).lower()
+    return 'concurrent update' in message or 'aborted due to concurrent' in message \
+        or 'database is locked' in message
 
-    friend_id = rows[0]["UserId"]
+def _run_friend_operation(script, client, **params):
+    """Runs one friend operation script as a single query job and returns its result rows.
 
-    # Step 2: Prevent sending to self
-    if friend_id == user_id:
-        return "You cannot send a friend request to yourself."
+    The scripts check and write inside one transaction, so a click never
+    acts on a half-applied earlier one. Two transactions that both update or
+    delete rows of the same table conflict: BigQuery aborts one of them, and
+    it is retried here with backoff so it reruns its checks against the
+    winner's result. Inserts alone don't conflict, which is why the send
+    script also deletes. On the local backend the same script runs as an
+    SQLite transaction.
 
-    # Step 3: Check if they're already friends
-    check_friend_query = """
-    SELECT * FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
-    WHERE (UserId1 = @user_id AND UserId2 = @friend_id)
-       OR (UserId1 = @friend_id AND UserId2 = @user_id)
+    Returns:
+        list: The result rows, or None if every attempt was aborted by a
+        concurrent transaction.
     """
-    job_config_check = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-            bigquery.ScalarQueryParameter("friend_id", "STRING", friend_id),
-        ]
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter(name, "STRING", value) for name, value in params.items()]
     )
+    for attempt in range(FRIEND_OP_ATTEMPTS):
+        try:
+            return list(client.query(script, job_config=job_config).result())
+        except Exception as e:
+            if not _is_concurrent_abort(e):
+                raise
+            print(f"Friend operation aborted by a concurrent one (attempt {attempt + 1}): {e}")
+            if attempt + 1 < FRIEND_OP_ATTEMPTS:
+                time.sleep(FRIEND_OP_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+    return None
 
-    if client.query(check_friend_query, job_config=job_config_check).result().total_rows > 0:
-        return f"You are already friends with {friend_username}."
+# Function mostly made by ChatGPT: "Following the database structure, create a function that lets the user send a friend request"
+def send_friend_request(user_id, friend_username, client=None):
+    """
+    Sends a friend request from user_id to the user with friend_username.
+    The username is resolved through the username index; the checks and the
+    insert run as one query job.
 
-    # Step 4: Check if a request already exists
-    check_request_query = """
-    SELECT * FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
-    WHERE (RequesterId = @user_id AND ReceiverId = @friend_id)
-       OR (RequesterId = @friend_id AND ReceiverId = @user_id)
+    Returns:
+        str: A status code: 'sent', 'unknown_user', 'self', 'already_friends',
+             'already_pending' or 'conflict'.
     """
-    job_config_request_check = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-            bigquery.ScalarQueryParameter("friend_id", "STRING", friend_id),
-        ]
-    )
 
-    if client.query(check_request_query, job_config=job_config_request_check).result().total_rows > 0:
-        return f"A friend request is already pending between you and {friend_username}."
+    friend_id = username_index.lookup(friend_username, client, fallback=True)
+    if friend_id is None:
+        return 'unknown_user'
+
+    if client is None:
+        # Skip the job for the common case the friend graph already answers
+        if friend_graph.are_friends(user_id, friend_id):
+            return 'already_friends'
+        client = get_client()
+
+    script = """
+    BEGIN TRANSACTION;
+
+    CREATE TEMP TABLE friend_op AS
+    SELECT
+        CASE
+            WHEN FriendId = @user_id THEN 'self'
+            WHEN EXISTS (
+                SELECT 1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
+                WHERE (UserId1 = @user_id AND UserId2 = FriendId)
+                   OR (UserId1 = FriendId AND UserId2 = @user_id)
+            ) THEN 'already_friends'
+            WHEN EXISTS (
+                SELECT 1 FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
+                WHERE (RequesterId = @user_id AND ReceiverId = FriendId)
+                   OR (RequesterId = FriendId AND ReceiverId = @user_id)
+            ) THEN 'already_pending'
+            ELSE 'sent'
+        END AS Status,
+        FriendId
+    FROM (SELECT @friend_id AS FriendId) AS target;
+
+    -- Matches no rows when sending, but makes the transaction a mutation of
+    -- FriendRequests, so two concurrent sends conflict instead of both inserting
+    DELETE FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
+    WHERE RequesterId = @user_id AND ReceiverId = (SELECT FriendId FROM friend_op WHERE Status = 'sent');
 
-    # Step 5: Insert the friend request
-    insert_request_query = """
     INSERT INTO `keishlyanysanabriatechx25.bytemeproject.FriendRequests` (RequesterId, ReceiverId, RequestedAt)
-    VALUES (@user_id, @friend_id, CURRENT_TIMESTAMP())
+    SELECT @user_id, FriendId, CURRENT_TIMESTAMP() FROM friend_op WHERE Status = 'sent';
+
+    COMMIT TRANSACTION;
+
+    SELECT Status, FriendId FROM friend_op;
     """
-    job_config_insert = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-            bigquery.ScalarQueryParameter("friend_id", "STRING", friend_id),
-        ]
-    )
 
-    client.query(insert_request_query, job_config=job_config_insert).result()
-    return f"Friend request sent to {friend_username}!"
+    rows = _run_friend_operation(script, client, user_id=user_id, friend_id=friend_id)
+    if rows is None:
+        return 'conflict'
+    status, friend_id = rows[0]['Status'], rows[0]['FriendId']
+    if status == 'sent':
+        user_cache.invalidate('get_pending_requests', friend_id)
+    return status
 
 # Function mostly made by ChatGPT: "Following the database structure, create a function that lets the user remove a friend"
 def remove_friend(user_id, friend_username, client=None):
     """
     Removes the friend relationship between user_id and friend_username.
-    First resolves friend_username to UserId, then deletes the friendship if it exists.
-    """
+    The username is resolved through the username index; the check and the
+    delete run as one query job.
 
-    if client is None:
-        client = bigquery.Client()
-
-    # Resolve Username to UserId
-    get_friend_id_query = """
-    SELECT UserId FROM `keishlyanysanabriatechx25.bytemeproject.Users`
-    WHERE Username = @friend_username
+    Returns:
+        str: A status code: 'removed', 'unknown_user', 'not_friends' or 'conflict'.
     """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("friend_username", "STRING", friend_username),
-        ]
-    )
 
-    result = client.query(get_friend_id_query, job_config=job_config).result()
-    rows = list(result)
+    friend_id = username_index.lookup(friend_username, client, fallback=True)
+    if friend_id is None:
+        return 'unknown_user'
 
-    friend_id = rows[0]["UserId"]
+    if client is None:
+        client = get_client()
+
+    script = """
+    BEGIN TRANSACTION;
+
+    CREATE TEMP TABLE friend_op AS
+    SELECT
+        CASE
+            WHEN EXISTS (
+                SELECT 1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
+                WHERE (UserId1 = @user_id AND UserId2 = FriendId)
+                   OR (UserId1 = FriendId AND UserId2 = @user_id)
+            ) THEN 'removed'
+            ELSE 'not_friends'
+        END AS Status,
+        FriendId
+    FROM (SELECT @friend_id AS FriendId) AS target;
 
-    # Delete the friendship
-    delete_query = """
     DELETE FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
-    WHERE (UserId1 = @user_id AND UserId2 = @friend_id)
-       OR (UserId1 = @friend_id AND UserId2 = @user_id)
+    WHERE (UserId1 = @user_id AND UserId2 = (SELECT FriendId FROM friend_op))
+       OR (UserId1 = (SELECT FriendId FROM friend_op) AND UserId2 = @user_id);
+
+    COMMIT TRANSACTION;
+
+    SELECT Status, FriendId FROM friend_op;
     """
-    job_config_delete = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-            bigquery.ScalarQueryParameter("friend_id", "STRING", friend_id),
-        ]
-    )
 
-    client.query(delete_query, job_config=job_config_delete).result()
-    return f"Friendship with {friend_username} has been removed."
+    rows = _run_friend_operation(script, client, user_id=user_id, friend_id=friend_id)
+    if rows is None:
+        return 'conflict'
+    status, friend_id = rows[0]['Status'], rows[0]['FriendId']
+    if status == 'removed':
+        friend_graph.remove(user_id, friend_id)
+        _invalidate_friendship(user_id, friend_id)
+    return status
 
 # Function created by ChatGPT: "create a function that checks the pending requests that the user_id currently has, it will be shown in an already created tab"
+@cached(ttl=30)
 def get_pending_requests(user_id, client=None):
     """
     Returns a list of usernames who have sent a friend request to the given user_id.
     """
 
     if client is None:
-        client = bigquery.Client()
+        client = get_client()
     
+    # Grouped, so a duplicate request row never shows up twice
     query = """
-    SELECT U.Username AS SenderUsername, FR.RequesterId
+    SELECT U.Username AS SenderUsername, FR.RequesterId, MAX(FR.RequestedAt) AS RequestedAt
     FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests` FR
     JOIN `keishlyanysanabriatechx25.bytemeproject.Users` U
     ON FR.RequesterId = U.UserId
     WHERE FR.ReceiverId = @user_id
-    ORDER BY FR.RequestedAt DESC
+    GROUP BY U.Username, FR.RequesterId
+    ORDER BY RequestedAt DESC
     """
 
     job_config = bigquery.QueryJobConfig(
@@ -536,42 +870,115 @@ def get_pending_requests(user_id, client=None):
 
 # Following 2 functions partially created by ChatGPT: "create the lines to accept and decline the friend requests. it should use the following functions to save/decline those friends: accept_friend_request"
 def accept_friend_request(current_user_id, requester_id, client=None):
-    if client is None:
-        client = bigquery.Client()
+    """
+    Accepts the friend request requester_id sent to current_user_id.
+    The friendship insert and the request delete run as one query job.
 
-    # Add friendship in one direction only
-    insert_query = """
+    Returns:
+        str: A status code: 'accepted', 'no_request' or 'conflict'.
+    """
+    if client is None:
+        client = get_client()
+
+    script = """
+    BEGIN TRANSACTION;
+
+    CREATE TEMP TABLE friend_op AS
+    SELECT
+        CASE
+            WHEN EXISTS (
+                SELECT 1 FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
+                WHERE RequesterId = @requester_id AND ReceiverId = @user_id
+            ) THEN 'accepted'
+            ELSE 'no_request'
+        END AS Status,
+        EXISTS (
+            SELECT 1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
+            WHERE (UserId1 = @user_id AND UserId2 = @requester_id)
+               OR (UserId1 = @requester_id AND UserId2 = @user_id)
+        ) AS AlreadyFriends;
+
+    -- Add friendship in one direction only
     INSERT INTO `keishlyanysanabriatechx25.bytemeproject.Friends` (UserId1, UserId2)
-    VALUES (@user1, @user2)
+    SELECT @user_id, @requester_id FROM friend_op WHERE Status = 'accepted' AND NOT AlreadyFriends;
+
+    -- Remove the request, and one the accepting user may have sent back
+    DELETE FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
+    WHERE (RequesterId = @requester_id AND ReceiverId = @user_id)
+       OR (RequesterId = @user_id AND ReceiverId = @requester_id);
+
+    COMMIT TRANSACTION;
+
+    SELECT Status FROM friend_op;
     """
 
-    insert_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user1", "STRING", current_user_id),
-            bigquery.ScalarQueryParameter("user2", "STRING", requester_id),
-        ]
-    )
+    rows = _run_friend_operation(script, client, user_id=current_user_id, requester_id=requester_id)
+    if rows is None:
+        return 'conflict'
+    status = rows[0]['Status']
+    if status == 'accepted':
+        friend_graph.add(current_user_id, requester_id)
+        _invalidate_friendship(current_user_id, requester_id)
+        user_cache.invalidate('get_pending_requests', requester_id)
+    user_cache.invalidate('get_pending_requests', current_user_id)
+    return status
+
+def accept_all_friend_requests(current_user_id, client=None):
+    """
+    Accepts every friend request current_user_id has received, in one query job.
+
+    Returns:
+        list: The UserIds of the users who are now friends with current_user_id,
+        or None if concurrent changes kept aborting it.
+    """
+    if client is None:
+        client = get_client()
 
-    client.query(insert_query, job_config=insert_config).result()
+    script = """
+    BEGIN TRANSACTION;
+
+    CREATE TEMP TABLE accepted AS
+    SELECT DISTINCT RequesterId
+    FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests` FR
+    WHERE ReceiverId = @user_id
+      AND NOT EXISTS (
+          SELECT 1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` F
+          WHERE (F.UserId1 = @user_id AND F.UserId2 = FR.RequesterId)
+             OR (F.UserId1 = FR.RequesterId AND F.UserId2 = @user_id)
+      );
+
+    INSERT INTO `keishlyanysanabriatechx25.bytemeproject.Friends` (UserId1, UserId2)
+    SELECT @user_id, RequesterId FROM accepted;
 
-    # Remove the friend request
-    delete_query = """
     DELETE FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
-    WHERE RequesterId = @requester_id AND ReceiverId = @receiver_id
-    """
+    WHERE ReceiverId = @user_id
+       OR (RequesterId = @user_id AND ReceiverId IN (SELECT RequesterId FROM accepted));
 
-    delete_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("requester_id", "STRING", requester_id),
-            bigquery.ScalarQueryParameter("receiver_id", "STRING", current_user_id),
-        ]
-    )
+    COMMIT TRANSACTION;
+
+    SELECT RequesterId FROM accepted;
+    """
 
-    client.query(delete_query, job_config=delete_config).result()
+    rows = _run_friend_operation(script, client, user_id=current_user_id)
+    if rows is None:
+        return None
+    accepted = [row['RequesterId'] for row in rows]
+    for requester_id in accepted:
+        friend_graph.add(current_user_id, requester_id)
+        _invalidate_friendship(current_user_id, requester_id)
+        user_cache.invalidate('get_pending_requests', requester_id)
+    user_cache.invalidate('get_pending_requests', current_user_id)
+    return accepted
 
 def decline_friend_request(current_user_id, requester_id, client=None):
+    """
+    Deletes the friend request requester_id sent to current_user_id.
+
+    Returns:
+        str: A status code: 'declined' or 'no_request'.
+    """
     if client is None:
-        client = bigquery.Client()
+        client = get_client()
 
     query = """
     DELETE FROM `keishlyanysanabriatechx25.bytemeproject.FriendRequests`
@@ -585,89 +992,275 @@ def decline_friend_request(current_user_id, requester_id, client=None):
         ]
     )
 
-    client.query(query, job_config=config).result()
+    job = client.query(query, job_config=config)
+    job.result()
+    user_cache.invalidate('get_pending_requests', current_user_id)
+    return 'declined' if job.num_dml_affected_rows else 'no_request'
+
+def _invalidate_friendship(user_id, friend_id):
+    """Drops cached profiles and leaderboards of two users whose friendship changed."""
+    for uid in (user_id, friend_id):
+        user_cache.invalidate('get_user_profile', uid)
+        user_cache.invalidate('get_leaderboard_data', uid)
+        user_cache.invalidate('get_windowed_leaderboard', uid)
 
 #the query was generated by gemini. i described the tables to it and then i asked it to create the query so that it returns the friend's workout data
+@cached(ttl=60)
 def get_leaderboard_data(user_id, client=None):
     """
-    Retrieves workout data for a given user and their friends
-    (based on the Friends table with UserId1 and UserId2 columns)
-    and structures it into a nested dictionary.
+    Retrieves the workout totals of a given user and their friends
+    (based on the Friends table with UserId1 and UserId2 columns, in either direction).
+    The totals and the ranks are computed by the query itself, so only one
+    row per participant is transferred no matter how many workouts they have.
 
     Args:
         user_id (str): The UserId of the person you're interested in.
 
     Returns:
-        dict: A dictionary where keys are UserIds (the initial user and their friends),
-              and values are dictionaries containing 'distance', 'steps', and 'calories'.
+        dict: A dictionary where keys are UserIds (the initial user and their friends that have
+              workouts), and values are dictionaries containing 'name', the totals 'distance',
+              'steps', 'calories' and 'workouts', and 'distance_rank', 'steps_rank' and
+              'calories_rank' (1 is first place; ties are broken by UserId).
     """
     if client is None:
-        client = bigquery.Client(project="keishlyanysanabriatechx25")
+        client = get_client(DEFAULT_PROJECT)
 
     try:
-        query = f"""
+        query = """
+            WITH participants AS (
+                SELECT @user_id AS UserId
+                UNION DISTINCT
+                SELECT UserId2 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` WHERE UserId1 = @user_id
+                UNION DISTINCT
+                SELECT UserId1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` WHERE UserId2 = @user_id
+            ),
+            totals AS (
+                SELECT
+                    u.UserId,
+                    u.Name,
+                    COALESCE(SUM(w.TotalDistance), 0) AS TotalDistance,
+                    COALESCE(SUM(w.TotalSteps), 0) AS TotalSteps,
+                    COALESCE(SUM(w.CaloriesBurned), 0) AS TotalCalories,
+                    COUNT(*) AS WorkoutCount
+                FROM
+                    participants p
+                JOIN
+                    `keishlyanysanabriatechx25.bytemeproject.Workouts` w ON w.UserId = p.UserId
+                JOIN
+                    `keishlyanysanabriatechx25.bytemeproject.Users` u ON u.UserId = p.UserId
+                GROUP BY
+                    u.UserId, u.Name
+            )
             SELECT
-                u.Name,
-                w.UserId,
-                w.TotalDistance,
-                w.TotalSteps,
-                w.CaloriesBurned
+                *,
+                ROW_NUMBER() OVER (ORDER BY TotalDistance DESC, UserId) AS DistanceRank,
+                ROW_NUMBER() OVER (ORDER BY TotalSteps DESC, UserId) AS StepsRank,
+                ROW_NUMBER() OVER (ORDER BY TotalCalories DESC, UserId) AS CaloriesRank
             FROM
-                `keishlyanysanabriatechx25.bytemeproject.Workouts` w
-            JOIN
-                `keishlyanysanabriatechx25.bytemeproject.Users` u ON w.UserId = u.UserId
-            WHERE w.UserId = '{user_id}'
-            UNION ALL
-            SELECT
-                u.Name,
-                w.UserId,
-                w.TotalDistance,
-                w.TotalSteps,
-                w.CaloriesBurned
-            FROM
-                `keishlyanysanabriatechx25.bytemeproject.Friends` f
-            JOIN
-                `keishlyanysanabriatechx25.bytemeproject.Workouts` w ON (f.UserId2 = w.UserId)
-            JOIN
-                `keishlyanysanabriatechx25.bytemeproject.Users` u ON w.UserId = u.UserId
-            WHERE f.UserId1 = '{user_id}'
-            UNION ALL
-            SELECT
-                u.Name,
-                w.UserId,
-                w.TotalDistance,
-                w.TotalSteps,
-                w.CaloriesBurned
-            FROM
-                `keishlyanysanabriatechx25.bytemeproject.Friends` f
-            JOIN
-                `keishlyanysanabriatechx25.bytemeproject.Workouts` w ON (f.UserId1 = w.UserId)
-            JOIN
-                `keishlyanysanabriatechx25.bytemeproject.Users` u ON w.UserId = u.UserId
-            WHERE f.UserId2 = '{user_id}'
+                totals
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("user_id", "STRING", user_id)]
+        )
+        results = client.query(query, job_config=job_config).result()
+        return _leaderboard_from_rows(results)
+
+    except Exception as e:
+        print(f"Error fetching BigQuery data: {e}")
+        return None
+
+def _leaderboard_from_rows(results):
+    """Turns leaderboard query rows into the dictionary get_leaderboard_data returns."""
+    workout_data = {}
+    for row in results:
+        workout_data[row.UserId] = {
+            'name': row.Name,
+            'distance': row.TotalDistance,
+            'steps': row.TotalSteps,
+            'calories': row.TotalCalories,
+            'workouts': row.WorkoutCount,
+            'distance_rank': row.DistanceRank,
+            'steps_rank': row.StepsRank,
+            'calories_rank': row.CaloriesRank,
+        }
+    return workout_data
+
+# Days covered by each leaderboard window; None means all-time
+LEADERBOARD_WINDOWS = {'today': 1, '7d': 7, '30d': 30, 'all': None}
+
+# Days before the latest rolled-up day that every refresh recomputes, so
+# workouts logged late for a recent day are still counted
+ROLLUP_LOOKBACK_DAYS = int(os.environ.get("ROLLUP_LOOKBACK_DAYS", "30"))
+
+def refresh_daily_rollups(user_id=None, since=None, client=None):
+    """
+    Folds workouts into the WorkoutDailyRollup table, which keeps one row of
+    steps, distance, calories and workout count per user per day.
+
+    Only the days from `since` on are recomputed. By default that is
+    ROLLUP_LOOKBACK_DAYS before the latest day already rolled up, so each
+    refresh only reads recent workouts but still picks up ones logged late
+    for any day the windowed leaderboards show. A workout logged for a day
+    older than that is only counted once a refresh is run with that day as
+    `since`. Recomputed days are upserted, so running it twice is harmless.
+
+    This is the write side of the leaderboards, run on a schedule with
+    `python data_fetcher.py refresh_rollups`; the leaderboard reads never
+    call it.
+
+    Args:
+        user_id (str, optional): Only recompute this user's days.
+        since (datetime.date, optional): First day to recompute.
+    """
+    if client is None:
+        client = get_client(DEFAULT_PROJECT)
+    sqlite = getattr(client, 'dialect', 'bigquery') == 'sqlite'
+
+    if not sqlite:
+        client.query("""
+            CREATE TABLE IF NOT EXISTS `keishlyanysanabriatechx25.bytemeproject.WorkoutDailyRollup` (
+                UserId STRING NOT NULL,
+                Day DATE NOT NULL,
+                Steps INT64,
+                Distance FLOAT64,
+                Calories FLOAT64,
+                WorkoutCount INT64
+            )
+            CLUSTER BY UserId
+        """).result()
+
+    if since is None:
+        row = next(client.query("""
+            SELECT MAX(Day) AS LastDay FROM `keishlyanysanabriatechx25.bytemeproject.WorkoutDailyRollup`
+        """).result(), None)
+        last_day = row.LastDay if row else None
+        if isinstance(last_day, str):
+            last_day = datetime.date.fromisoformat(last_day)
+        since = last_day - datetime.timedelta(days=ROLLUP_LOOKBACK_DAYS) if last_day else datetime.date(1970, 1, 1)
+
+    daily_totals = """
+        SELECT
+            UserId,
+            DATE(StartTimestamp) AS Day,
+            SUM(TotalSteps) AS Steps,
+            SUM(TotalDistance) AS Distance,
+            SUM(CaloriesBurned) AS Calories,
+            COUNT(*) AS WorkoutCount
+        FROM
+            `keishlyanysanabriatechx25.bytemeproject.Workouts`
+        WHERE
+            -- A range on the raw column, so BigQuery can prune partitions by StartTimestamp
+            StartTimestamp >= @since_start
+            AND (@user_id IS NULL OR UserId = @user_id)
+        GROUP BY
+            UserId, DATE(StartTimestamp)
+    """
+    if sqlite:
+        query = f"""
+            INSERT INTO `keishlyanysanabriatechx25.bytemeproject.WorkoutDailyRollup`
+                (UserId, Day, Steps, Distance, Calories, WorkoutCount)
+            {daily_totals}
+            ON CONFLICT (UserId, Day) DO UPDATE SET
+                Steps = excluded.Steps,
+                Distance = excluded.Distance,
+                Calories = excluded.Calories,
+                WorkoutCount = excluded.WorkoutCount
+        """
+    else:
+        query = f"""
+            MERGE `keishlyanysanabriatechx25.bytemeproject.WorkoutDailyRollup` r
+            USING ({daily_totals}) s
+            ON r.UserId = s.UserId AND r.Day = s.Day AND r.Day >= @since
+            WHEN MATCHED THEN UPDATE SET
+                Steps = s.Steps, Distance = s.Distance, Calories = s.Calories, WorkoutCount = s.WorkoutCount
+            WHEN NOT MATCHED THEN INSERT (UserId, Day, Steps, Distance, Calories, WorkoutCount)
+                VALUES (s.UserId, s.Day, s.Steps, s.Distance, s.Calories, s.WorkoutCount)
         """
-        query_job = client.query(query)
-        results = query_job.result()
 
-        workout_data = {}
-        for row in results:
-            user_id = row.UserId
-            name = row.Name
-            distance = row.TotalDistance
-            steps = row.TotalSteps
-            calories = row.CaloriesBurned
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("since", "DATE", since),
+            bigquery.ScalarQueryParameter(
+                "since_start", "TIMESTAMP",
+                datetime.datetime.combine(since, datetime.time(), tzinfo=datetime.timezone.utc)),
+            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
+        ]
+    )
+    client.query(query, job_config=job_config).result()
 
-            if user_id not in workout_data:
-                workout_data[user_id] = {}
+    # Leaderboards cached by other processes catch up within their TTL
+    user_cache.invalidate('get_windowed_leaderboard')
 
-            workout_data[user_id] = {
-                'name': name,
-                'distance': distance,
-                'steps': steps,
-                'calories': calories
-            }
+@cached(ttl=60)
+def get_windowed_leaderboard(user_id, window='7d', client=None):
+    """
+    Retrieves the leaderboard of a user and their friends over a time window,
+    summed from the daily rollups so the cost depends on the number of days
+    in the window, not on how many workouts everyone has logged. It only
+    reads; the rollups are kept up to date by refresh_daily_rollups.
 
-        return workout_data
+    Args:
+        user_id (str): The UserId of the person you're interested in.
+        window (str): One of 'today', '7d', '30d' or 'all'.
+
+    Returns:
+        dict: The same shape get_leaderboard_data returns, or None on error.
+    """
+    if window not in LEADERBOARD_WINDOWS:
+        raise ValueError(f"Unknown leaderboard window '{window}'")
+
+    if client is None:
+        client = get_client(DEFAULT_PROJECT)
+
+    try:
+        days = LEADERBOARD_WINDOWS[window]
+        # Rollup days are UTC dates, so the window is counted in UTC too
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        start = today - datetime.timedelta(days=days - 1) if days else datetime.date(1970, 1, 1)
+
+        query = """
+            WITH participants AS (
+                SELECT @user_id AS UserId
+                UNION DISTINCT
+                SELECT UserId2 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` WHERE UserId1 = @user_id
+                UNION DISTINCT
+                SELECT UserId1 FROM `keishlyanysanabriatechx25.bytemeproject.Friends` WHERE UserId2 = @user_id
+            ),
+            totals AS (
+                SELECT
+                    u.UserId,
+                    u.Name,
+                    COALESCE(SUM(r.Distance), 0) AS TotalDistance,
+                    COALESCE(SUM(r.Steps), 0) AS TotalSteps,
+                    COALESCE(SUM(r.Calories), 0) AS TotalCalories,
+                    SUM(r.WorkoutCount) AS WorkoutCount
+                FROM
+                    participants p
+                JOIN
+                    `keishlyanysanabriatechx25.bytemeproject.WorkoutDailyRollup` r ON r.UserId = p.UserId
+                JOIN
+                    `keishlyanysanabriatechx25.bytemeproject.Users` u ON u.UserId = p.UserId
+                WHERE
+                    r.Day >= @start
+                GROUP BY
+                    u.UserId, u.Name
+            )
+            SELECT
+                *,
+                ROW_NUMBER() OVER (ORDER BY TotalDistance DESC, UserId) AS DistanceRank,
+                ROW_NUMBER() OVER (ORDER BY TotalSteps DESC, UserId) AS StepsRank,
+                ROW_NUMBER() OVER (ORDER BY TotalCalories DESC, UserId) AS CaloriesRank
+            FROM
+                totals
+        """
+        job_config = bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
+                bigquery.ScalarQueryParameter("start", "DATE", start),
+            ]
+        )
+        results = client.query(query, job_config=job_config).result()
+        return _leaderboard_from_rows(results)
 
     except Exception as e:
         print(f"Error fetching BigQuery data: {e}")
@@ -698,7 +1291,7 @@ def get_leaderboard_data(user_id, client=None):
 
     
 
-def ai_call_for_planner(user_id):
+def ai_call_for_planner(user_id, on_day=None, goal=None):
     # === Design, Implement and Test AI Integration for Goal Planning (Daniela) ===
     # AI Response Format:
     # {
@@ -706,37 +1299,40 @@ def ai_call_for_planner(user_id):
     #     ...
     # },
     # "general_tip": "Make sure to stretch before and after each workout."
+    #
+    # The answer is streamed and parsed as it arrives (see plan_stream.py):
+    # on_day(day, activities) is called as soon as each day of the plan is
+    # complete, before the model has finished the rest.
     
-    global _vertexai_initialized
-    load_dotenv()
-    if not _vertexai_initialized:
-        import vertexai
-        vertexai.init(project=os.environ.get("dagutierrez17techx25"), location="us-central1")
-        _vertexai_initialized = True
-
-    workouts = get_user_workouts(user_id) 
-    goal = save_goal(user_id)
-    model = GenerativeModel("gemini-1.5-flash-002")
+    workout_summary = format_summary(get_workout_summary(user_id))
+    if goal is None:
+        goal = save_goal(user_id)
 
     system_instruction = (
-        "You are the lead fitness trainer for a fitness app. You're getting user past workouts "
-        "in the 'workouts' list of dictionaries."
+        "You are the lead fitness trainer for a fitness app. You're getting a summary of the "
+        "user's past workouts."
     )
 
-    response = model.generate_content(f"""
-        Based on the goal: '{goal}' and your knowledge of the user's past workouts: {workouts}, please generate a fitness plan. 
+    prompt = f"""
+        Based on the goal: '{goal}' and this summary of the user's past workouts:
+        {workout_summary}
+        please generate a fitness plan. 
         Return a JSON dictionary with two keys: 
         1. "plan" → a dictionary where the keys are the days (e.g., 'Day 1', 'Day 2', ..., etc), and values are a list of recommended workouts for that day. 
            Each workout should be a dictionary with 'activity', 'duration', and 'calories_goal'.
         2. "general_tip" → a single helpful fitness tip relevant to the entire plan.
 
         Please provide specific exercises or types of activities. Take into consideration the user's past workouts to create a balanced and effective plan. The output should ONLY be a valid JSON dictionary, without any surrounding text or code blocks. Also please don't add line breaks.
-    """)
+    """
 
     task_id = random.randint(1, 1000000)
+    parser = PlanStreamParser(on_day=on_day)
 
     try:
-        full_response = json.loads(response.text)
+        for chunk in llm.stream(prompt, label="planner"):
+            parser.feed(chunk)
+        plan_stream_metrics.record(parser.first_day_ms, (time.perf_counter() - parser.started) * 1000)
+        full_response = parser.close()
 
         plan_dictionary = full_response.get("plan", {})
         general_tip = full_response.get("general_tip", "")
@@ -746,8 +1342,15 @@ def ai_call_for_planner(user_id):
             for task in plan_dictionary[day]:
                 task["completed"] = False
 
-        # Save the plan to GCS
-        save_task_completion_to_gcs(user_id, task_id, plan_dictionary)
+        # Save the plan to GCS, under another id in the rare case this one is taken
+        for attempt in range(3):
+            try:
+                save_task_completion_to_gcs(user_id, task_id, plan_dictionary)
+                break
+            except PreconditionFailed:
+                if attempt == 2:
+                    raise
+                task_id = random.randint(1, 1000000)
 
         return {
             'task_id': task_id,
@@ -757,16 +1360,19 @@ def ai_call_for_planner(user_id):
     except json.JSONDecodeError as e:
         return {
             'task_id': task_id,
-            'content': f"Error: Could not parse the AI response as a JSON dictionary. Raw response: {response.text}. Error details: {e}",
-            'general_tip' : f"Error: Could not parse the AI response as a JSON dictionary. Raw response: {response.text}. Error details: {e}"
+            'content': f"Error: Could not parse the AI response as a JSON dictionary. Raw response: {parser.text}. Error details: {e}",
+            'general_tip' : f"Error: Could not parse the AI response as a JSON dictionary. Raw response: {parser.text}. Error details: {e}"
+        }
+    except LLMTimeoutError as e:
+        return {
+            'task_id': task_id,
+            'content': f"Error: The AI did not finish the plan in time, please try again. Error details: {e}",
+            'general_tip': f"Error: The AI did not finish the plan in time, please try again. Error details: {e}"
         }
 
 def save_plan(user_id, ai_response, client=None):
     # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Goal Plan Display UI (Kei) ===
 
-    if client is None:
-        client = bigquery.Client()
-
     # Extract values from the AI response
     task_id = ai_response.get("task_id")
     content_dict = ai_response.get("content", {})
@@ -789,55 +1395,77 @@ def save_plan(user_id, ai_response, client=None):
     # Define table ID
     table_id = "keishlyanysanabriatechx25.bytemeproject.UserTaskPlans"
 
-    # Insert the row
-    errors = client.insert_rows_json(table_id, [row])
-
-    if errors:
-        print(f"❌ Failed to insert into BigQuery: {errors}")
-    else:
-        print("✅ Plan successfully saved to BigQuery!")
+    # Queue the row; the write queue inserts it in the background and skips
+    # a second save of the same plan
+    return write_queue.submit(table_id, row, f"{user_id}:{task_id}",
+                              idempotency_key=f"plan:{user_id}:{task_id}", client=client)
 
 # Function to save task completion data as a JSON blob in GCS
 def save_task_completion_to_gcs(user_id, task_id, plan_dict):
-    from google.cloud import storage
+    # Create-only: after the plan is first saved, only task_log's compaction
+    # rewrites the snapshot, under the generation it read it at. Raises
+    # PreconditionFailed if the plan already has a snapshot.
+    get_blob_store().write_json(snapshot_name(user_id, task_id), plan_dict, if_generation_match=0)
+
+def _plan_draft_blob_name(user_id, goal):
+    goal_hash = hashlib.sha256(goal.encode("utf-8")).hexdigest()[:16]
+    return f'plan_drafts/{user_id}/{goal_hash}.json'
+
+# Plan drafts are kept next to the task completion blobs, one per (user, goal)
+def save_plan_draft(user_id, goal, draft):
+    get_blob_store().write_json(_plan_draft_blob_name(user_id, goal), {'goal': goal, 'draft': draft})
+
+def read_plan_draft(user_id, goal):
+    stored, _ = get_blob_store().read_json(_plan_draft_blob_name(user_id, goal))
+    # Guard against two goals sharing a hash prefix
+    if stored is None or stored.get('goal') != goal:
+        return None
+    return stored['draft']
 
-    bucket_name = 'byte-me-user-tasks'
-    blob_name = f'task_completion/completed_{user_id}_{task_id}.json'
+def get_plan_draft(user_id, goal, regenerate=False, on_day=None):
+    """Returns the plan draft for a user's goal, generating it only when there is none yet.
 
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
+    A generated draft is kept in the draft store, so rerunning the Planner
+    tab, or opening it in a new session, costs no model call.
 
-    json_data = json.dumps(plan_dict)
-    blob.upload_from_string(json_data, content_type='application/json')
+    Args:
+        user_id (str): The user the plan is for.
+        goal (str): The goal the plan is for.
+        regenerate (bool): Generate a new draft even if one is stored.
+        on_day (callable, optional): Passed to ai_call_for_planner when a
+            draft is generated.
 
-# Function to read task completion data from GCS
+    Returns:
+        dict: What ai_call_for_planner returns.
+    """
+    if not regenerate:
+        try:
+            draft = read_plan_draft(user_id, goal)
+        except Exception as e:
+            print(f"Error reading plan draft: {e}")
+            draft = None
+        if draft is not None:
+            return draft
+
+    draft = ai_call_for_planner(user_id, on_day=on_day, goal=goal)
+    # Failed generations aren't kept, so the next visit tries again
+    if isinstance(draft.get('content'), dict):
+        try:
+            save_plan_draft(user_id, goal, draft)
+        except Exception as e:
+            print(f"Error saving plan draft: {e}")
+    return draft
+
+# Function to read task completion data from GCS: the plan snapshot with
+# every completion recorded since applied (see task_log.py)
 def read_task_completion_from_gcs(user_id, task_id):
-    from google.cloud import storage
-
-    bucket_name = 'byte-me-user-tasks'
-    blob_name = f'task_completion/completed_{user_id}_{task_id}.json'
-
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-
-    if blob.exists():
-        data = blob.download_as_string()
-        return json.loads(data)
-    else:
-        return None  # Or raise an exception if needed
+    return read_completion_state(user_id, task_id)
 
-# Function to mark task completion and update the GCS blob
+# Function to mark task completion: one small append-only event per click
+# instead of rewriting the whole plan blob
 def mark_task(user_id, task_id, day_label, task_index, new_state):
-    task_data = read_task_completion_from_gcs(user_id, task_id)
-    if not task_data:
-        print("Task data not found.")
-        return
-
     try:
-        task_data[day_label][task_index]["completed"] = new_state
-        save_task_completion_to_gcs(user_id, task_id, task_data)
+        record_completion(user_id, task_id, day_label, task_index, new_state)
         print(f"Task updated successfully.")
     except Exception as e:
         print(f"Error updating task: {e}")
@@ -846,7 +1474,7 @@ def get_progress_data(user_id, task_id, client=None):
     # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Goal Progress Tracking (Ariana) ===
 
     if client is None:
-        client = bigquery.Client()
+        client = get_client()
 
     # Step 1: Get the plan content
     plan_query = """
@@ -893,3 +1521,12 @@ def get_progress_data(user_id, task_id, client=None):
             task["completed"] = completion_status.get(key, False)
 
     return plan
+
+
+if __name__ == "__main__":
+    # python data_fetcher.py refresh_rollups: folds newly landed workouts into
+    # the daily rollups; run it on a schedule, e.g. every few minutes from cron
+    import sys
+    if sys.argv[1:2] != ["refresh_rollups"]:
+        sys.exit("usage: python data_fetcher.py refresh_rollups")
+    refresh_daily_rollups()
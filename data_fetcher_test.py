@@ -12,11 +12,16 @@ from google.cloud import bigquery
 import os
 import datetime
 import pytz
+import shutil
 import sys
+import tempfile
 # from data_fetcher import get_user_sensor_data, get_genai_advice, load_dotenv, vertexai, get_user_profile, ai_call_for_planner
 from vertexai.generative_models import GenerativeModel
 # from data_fetcher import _vertexai_initialized
 from dotenv import load_dotenv
+from cache import user_cache
+from llm_gateway import LLMTimeoutError, llm
+from blob_store import LocalBlobStore, set_blob_store
 
 class MockGenerativeModel: #mock the GenAI model
     def __init__(self, expected_message, *args, **kwargs):
@@ -32,8 +37,10 @@ class MockGenerativeModel: #mock the GenAI model
 class TestDataFetcher(unittest.TestCase):
 
     def setUp(self): 
-        global _vertexai_initialized
-        _vertexai_initialized = False
+        # Advice is cached per user; start every test from a cold cache and
+        # with no model handle left over from another test
+        user_cache.clear()
+        llm.reset(backend="vertex")
 
 #     """Tests for get_user_sensor_data_success, these tests were created with help from Gemini"""
 #     @patch('google.cloud.bigquery.Client')
@@ -164,18 +171,18 @@ class TestDataFetcher(unittest.TestCase):
     
     """Tests for get_genai_advice, these tests were created with help from Gemini"""
     
-    @patch('data_fetcher.vertexai.init')
+    @patch('llm_gateway.vertexai.init')
     @patch('os.environ.get')
     @patch('random.choice')
     @patch('random.randint')
     @patch('data_fetcher.datetime')  
-    @patch('data_fetcher.GenerativeModel')
-    @patch('data_fetcher.get_user_workouts')
+    @patch('llm_gateway.GenerativeModel')
+    @patch('data_fetcher.get_workout_summary')
     # @patch('data_fetcher.get_ai_advice')
     @patch("data_fetcher.bigquery.Client")
     def test_get_genai_advice_success(self,
                                   mock_bigquery_client,
-                                  mock_get_user_workouts,
+                                  mock_get_workout_summary,
                                   mock_generative_model,
                                   mock_datetime_module,
                                   mock_randint,
@@ -202,11 +209,8 @@ class TestDataFetcher(unittest.TestCase):
         expected_message = "Stay strong!"
         mock_generative_model.return_value = MockGenerativeModel(expected_message)
 
-        # Configure the return value for the mocked get_user_workouts
-        mock_get_user_workouts.return_value = [
-            {"workout_id": 1, "name": "Running", "duration": 30, "date": "2025-04-01"},
-            {"workout_id": 2, "name": "Weightlifting", "sets": 3, "reps": 10, "date": "2025-04-03"},
-        ]
+        # Configure the return value for the mocked get_workout_summary
+        mock_get_workout_summary.return_value = {'workouts': 2, 'duration_min': [30.0, 30.0]}
 
         result = get_genai_advice("test_user")
 
@@ -216,7 +220,648 @@ class TestDataFetcher(unittest.TestCase):
         self.assertEqual(result['timestamp'], "2024-01-01 12:00:00 ")
         #mock_vertexai_init.assert_called_once_with(project="test_project", location="us-central1")
         mock_datetime_class.now.assert_called_once()
-        mock_get_user_workouts.assert_called_once_with("test_user") 
+        mock_get_workout_summary.assert_called_once_with("test_user") 
+
+    @patch('data_fetcher._generate_genai_advice')
+    def test_get_genai_advice_is_generated_once_per_user(self, mock_generate):
+        from data_fetcher import get_genai_advice
+        mock_generate.side_effect = lambda user_id: {'advice_id': 1, 'content': f'Go {user_id}!'}
+
+        for _ in range(3):
+            self.assertEqual(get_genai_advice('user1')['content'], 'Go user1!')
+        get_genai_advice('user2')
+
+        self.assertEqual(mock_generate.call_count, 2)
+
+    @patch('data_fetcher._generate_genai_advice', side_effect=LLMTimeoutError("deadline"))
+    def test_get_genai_advice_returns_none_on_timeout(self, mock_generate):
+        from data_fetcher import get_genai_advice
+
+        with patch('builtins.print'):
+            self.assertIsNone(get_genai_advice('user_timeout'))
+            self.assertIsNone(get_genai_advice('user_timeout'))
+        self.assertEqual(mock_generate.call_count, 2)
+
+
+class TestAiCallForPlanner(unittest.TestCase):
+    """Tests for the streamed planner call, against the fake model."""
+
+    def setUp(self):
+        llm.reset(backend="fake")
+
+    def tearDown(self):
+        llm.reset(backend="vertex")
+
+    @patch('data_fetcher.save_task_completion_to_gcs')
+    @patch('data_fetcher.save_goal', create=True, return_value="Run a 5k")
+    @patch('data_fetcher.get_workout_summary', return_value={'workouts': 0})
+    def test_days_are_reported_while_streaming(self, mock_workouts, mock_goal, mock_save):
+        from data_fetcher import ai_call_for_planner
+        from plan_stream import plan_stream_metrics
+        plans_before = plan_stream_metrics.metrics()['plans']
+        days = []
+
+        result = ai_call_for_planner('user1', on_day=lambda day, activities: days.append(day))
+
+        self.assertEqual(days, [f"Day {day}" for day in range(1, 8)])
+        self.assertEqual(list(result['content']), days)
+        self.assertTrue(all(task['completed'] is False for tasks in result['content'].values() for task in tasks))
+        self.assertTrue(result['general_tip'])
+        mock_save.assert_called_once_with('user1', result['task_id'], result['content'])
+        self.assertEqual(plan_stream_metrics.metrics()['plans'], plans_before + 1)
+
+    @patch('data_fetcher.save_task_completion_to_gcs')
+    @patch('data_fetcher.save_goal', create=True, return_value="Run a 5k")
+    @patch('data_fetcher.get_workout_summary', return_value={'workouts': 0})
+    def test_timeout_returns_error_message(self, mock_workouts, mock_goal, mock_save):
+        from data_fetcher import ai_call_for_planner
+
+        with patch.object(llm, 'stream', side_effect=LLMTimeoutError("deadline")):
+            result = ai_call_for_planner('user1')
+
+        self.assertTrue(result['content'].startswith("Error"))
+        self.assertTrue(result['general_tip'].startswith("Error"))
+        mock_save.assert_not_called()
+
+
+class TestGetPlanDraft(unittest.TestCase):
+    """Tests for plan draft memoization, with a local blob store and the fake model."""
+
+    def setUp(self):
+        llm.reset(backend="fake")
+        self.directory = tempfile.mkdtemp()
+        self.store = LocalBlobStore(self.directory)
+        set_blob_store(self.store)
+        patcher = patch('data_fetcher.get_workout_summary', return_value={'workouts': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        llm.reset(backend="vertex")
+        set_blob_store(None)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_draft_is_generated_once_per_goal(self):
+        from data_fetcher import get_plan_draft
+
+        first = get_plan_draft('user1', "Run a 5k")
+        again = get_plan_draft('user1', "Run a 5k")
+        get_plan_draft('user1', "Swim a mile")
+
+        self.assertEqual(again, first)
+        self.assertEqual(llm.metrics()['calls'], 2)
+        self.assertEqual(len(self.store.list('plan_drafts/user1/')), 2)
+
+    def test_regenerate_replaces_the_draft(self):
+        from data_fetcher import get_plan_draft, read_plan_draft
+
+        first = get_plan_draft('user1', "Run a 5k")
+        with patch('data_fetcher.random.randint', return_value=first['task_id'] + 1):
+            second = get_plan_draft('user1', "Run a 5k", regenerate=True)
+
+        self.assertNotEqual(second['task_id'], first['task_id'])
+        self.assertEqual(read_plan_draft('user1', "Run a 5k"), second)
+        self.assertEqual(llm.metrics()['calls'], 2)
+
+    def test_generated_plan_is_saved_for_task_tracking(self):
+        from data_fetcher import get_plan_draft, mark_task, read_task_completion_from_gcs
+
+        draft = get_plan_draft('user1', "Run a 5k")
+        with patch('builtins.print'):
+            mark_task('user1', draft['task_id'], "Day 1", 0, True)
+
+        state = read_task_completion_from_gcs('user1', draft['task_id'])
+        self.assertEqual(list(state), list(draft['content']))
+        self.assertTrue(state["Day 1"][0]['completed'])
+
+    def test_plan_never_replaces_an_existing_snapshot(self):
+        from data_fetcher import ai_call_for_planner
+
+        self.store.write_json('task_completion/completed_user1_5.json', {"Day 1": [True]})
+        with patch('data_fetcher.random.randint', side_effect=[5, 6]):
+            result = ai_call_for_planner('user1', goal="Run a 5k")
+
+        self.assertEqual(result['task_id'], 6)
+        self.assertEqual(self.store.read_json('task_completion/completed_user1_5.json')[0], {"Day 1": [True]})
+        self.assertEqual(self.store.read_json('task_completion/completed_user1_6.json')[0], result['content'])
+
+    def test_failed_generation_is_not_stored(self):
+        from data_fetcher import get_plan_draft
+
+        with patch('data_fetcher.ai_call_for_planner', return_value={'task_id': 1, 'content': "Error: ..."}):
+            get_plan_draft('user1', "Run a 5k")
+
+        self.assertEqual(self.store.list('plan_drafts/'), [])
+
+    def test_unreadable_store_falls_back_to_generating(self):
+        from data_fetcher import get_plan_draft
+
+        with patch('data_fetcher.read_plan_draft', side_effect=OSError("unreachable")), patch('builtins.print'):
+            draft = get_plan_draft('user1', "Run a 5k")
+
+        self.assertIsInstance(draft['content'], dict)
+
+
+class TestGetLeaderboardData(unittest.TestCase):
+    """Tests for the aggregated leaderboard."""
+
+    def test_one_row_per_participant_with_ranks(self):
+        from data_fetcher import get_leaderboard_data
+
+        mock_client = MagicMock()
+        mock_client.query.return_value.result.return_value = [
+            MagicMock(UserId='user1', Name='Remi', TotalDistance=12.5, TotalSteps=16000, TotalCalories=900,
+                      WorkoutCount=3, DistanceRank=1, StepsRank=2, CaloriesRank=1),
+            MagicMock(UserId='user2', Name='Blake', TotalDistance=6.0, TotalSteps=20000, TotalCalories=500,
+                      WorkoutCount=2, DistanceRank=2, StepsRank=1, CaloriesRank=2),
+        ]
+
+        result = get_leaderboard_data('user1', client=mock_client)
+
+        self.assertEqual(result['user1'], {
+            'name': 'Remi', 'distance': 12.5, 'steps': 16000, 'calories': 900, 'workouts': 3,
+            'distance_rank': 1, 'steps_rank': 2, 'calories_rank': 1,
+        })
+        self.assertEqual(result['user2']['steps_rank'], 1)
+        query, kwargs = mock_client.query.call_args[0][0], mock_client.query.call_args[1]
+        self.assertIn("GROUP BY", query)
+        self.assertEqual(kwargs['job_config'].query_parameters[0].value, 'user1')
+
+
+class TestIterUserSensorData(unittest.TestCase):
+    """Tests for the streaming sensor reader, run against the local backend."""
+
+    def setUp(self):
+        from backends import LocalClient
+
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("Workouts", [{'WorkoutId': 'workout1', 'UserId': 'user1'}])
+        self.client.insert_rows_json("SensorTypes", [
+            {'SensorId': 'hr', 'Name': 'Heart Rate', 'Units': 'bpm'},
+            {'SensorId': 'spd', 'Name': 'Speed', 'Units': 'km/h'},
+        ])
+        start = datetime.datetime(2024, 7, 29, 7, 0, 0)
+        self.client.insert_rows_json("SensorData", [
+            {'SensorId': 'hr' if i % 2 else 'spd', 'WorkoutID': 'workout1',
+             'Timestamp': (start + datetime.timedelta(seconds=i)).isoformat(" "), 'SensorValue': float(i)}
+            for i in range(10)
+        ])
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_pages_in_time_order(self):
+        from data_fetcher import iter_user_sensor_data
+
+        pages = list(iter_user_sensor_data('user1', 'workout1', page_size=4, output='rows', client=self.client))
+
+        self.assertEqual([len(page) for page in pages], [4, 4, 2])
+        self.assertEqual([row['SensorValue'] for page in pages for row in page], [float(i) for i in range(10)])
+        self.assertEqual(pages[0][1]['Name'], 'Heart Rate')
+
+    def test_filters_are_applied_by_the_query(self):
+        from data_fetcher import iter_user_sensor_data
+
+        pages = iter_user_sensor_data('user1', 'workout1', output='rows', client=self.client,
+                                      start=datetime.datetime(2024, 7, 29, 7, 0, 2),
+                                      end=datetime.datetime(2024, 7, 29, 7, 0, 8),
+                                      sensor_ids=['hr'])
+
+        self.assertEqual([row['SensorValue'] for page in pages for row in page], [3.0, 5.0, 7.0])
+
+    def test_dataframe_pages(self):
+        from data_fetcher import iter_user_sensor_data
+
+        frames = list(iter_user_sensor_data('user1', 'workout1', page_size=5, client=self.client))
+
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(list(frames[0].columns), ['UserId', 'SensorId', 'Name', 'Units', 'Timestamp', 'SensorValue'])
+
+    def test_get_user_sensor_data_returns_dicts(self):
+        from data_fetcher import get_user_sensor_data
+
+        result = get_user_sensor_data('user1', 'workout1', client=self.client)
+
+        self.assertEqual(len(result), 10)
+        self.assertEqual(result[0]['Units'], 'km/h')
+
+    def test_get_user_sensor_frame_charts_directly(self):
+        from data_fetcher import get_user_sensor_frame
+        from downsampling import downsample_sensor_data
+
+        frame = get_user_sensor_frame('user1', 'workout1', client=self.client)
+
+        self.assertEqual(len(frame), 10)
+        self.assertEqual(sum(len(series) for series in downsample_sensor_data(frame).values()), 10)
+
+
+class TestGetUserWorkoutsFrame(unittest.TestCase):
+    """Tests for the columnar workout fetch, run against the local backend."""
+
+    def setUp(self):
+        from backends import LocalClient
+
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("Workouts", [
+            {'WorkoutId': 'workout1', 'UserId': 'user1', 'StartTimestamp': '2024-07-29 07:00:00',
+             'EndTimestamp': '2024-07-29 08:00:00', 'TotalDistance': 5.0, 'TotalSteps': 8000, 'CaloriesBurned': 400},
+            {'WorkoutId': 'workout2', 'UserId': 'user1', 'StartTimestamp': '2024-07-30 07:00:00',
+             'EndTimestamp': '2024-07-30 07:30:00', 'TotalDistance': 2.5, 'TotalSteps': 4000, 'CaloriesBurned': 200},
+            {'WorkoutId': 'workout3', 'UserId': 'user2', 'StartTimestamp': '2024-07-31 07:00:00',
+             'TotalDistance': 1.0, 'TotalSteps': 1000, 'CaloriesBurned': 50},
+        ])
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_returns_sorted_typed_frame(self):
+        import pandas as pd
+        from data_fetcher import get_user_workouts_frame
+
+        df = get_user_workouts_frame('user1', client=self.client)
+
+        self.assertEqual(list(df['WorkoutId']), ['workout2', 'workout1'])
+        self.assertIsInstance(df['StartTimestamp'].dtype, pd.ArrowDtype)
+        self.assertEqual(df['StartTimestamp'].iloc[0], pd.Timestamp('2024-07-30 07:00:00'))
+        self.assertEqual(df['steps'].sum(), 12000)
+
+    def test_no_workouts(self):
+        from data_fetcher import get_user_workouts_frame
+
+        df = get_user_workouts_frame('user9', client=self.client)
+
+        self.assertTrue(df.empty)
+        self.assertIn('calories_burned', df.columns)
+
+
+class TestGetWorkoutSummary(unittest.TestCase):
+    """Tests for the workout summary used in prompts, over the columnar workouts."""
+
+    # Same workouts as the frame tests
+    setUp = TestGetUserWorkoutsFrame.setUp
+    tearDown = TestGetUserWorkoutsFrame.tearDown
+
+    def test_summarizes_the_users_workouts(self):
+        from data_fetcher import get_workout_summary
+
+        summary = get_workout_summary('user1', client=self.client)
+
+        self.assertEqual(summary['workouts'], 2)
+        self.assertEqual(summary['duration_min'], [45.0, 57.0])
+        self.assertEqual(summary['pace_min_per_unit'], [12.0, 12.0, 12.0])
+
+
+class TestFriendOperations(unittest.TestCase):
+    """Tests for the single-job friend operations, run against the local backend."""
+
+    def setUp(self):
+        from backends import LocalClient
+
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("Users", [
+            {'UserId': 'user1', 'Name': 'Remi', 'Username': 'remi_the_rems'},
+            {'UserId': 'user2', 'Name': 'Blake', 'Username': 'blake'},
+            {'UserId': 'user3', 'Name': 'Jordan', 'Username': 'jordan'},
+            {'UserId': 'user4', 'Name': 'Gemmy', 'Username': 'gems'},
+        ])
+        self.client.insert_rows_json("Friends", [{'UserId1': 'user1', 'UserId2': 'user2'}])
+
+    def tearDown(self):
+        self.client.close()
+
+    def _count(self, table):
+        return list(self.client.query(f"SELECT COUNT(*) AS n FROM {table}"))[0]['n']
+
+    def test_send_friend_request_statuses(self):
+        from data_fetcher import send_friend_request
+
+        self.assertEqual(send_friend_request('user1', 'nobody', client=self.client), 'unknown_user')
+        self.assertEqual(send_friend_request('user1', 'remi_the_rems', client=self.client), 'self')
+        self.assertEqual(send_friend_request('user1', 'blake', client=self.client), 'already_friends')
+        self.assertEqual(send_friend_request('user1', 'jordan', client=self.client), 'sent')
+        self.assertEqual(send_friend_request('user3', 'remi_the_rems', client=self.client), 'already_pending')
+        self.assertEqual(self._count('FriendRequests'), 1)
+
+    def test_accept_and_decline(self):
+        from data_fetcher import send_friend_request, accept_friend_request, decline_friend_request
+
+        send_friend_request('user3', 'remi_the_rems', client=self.client)
+        send_friend_request('user4', 'remi_the_rems', client=self.client)
+
+        self.assertEqual(accept_friend_request('user1', 'user3', client=self.client), 'accepted')
+        self.assertEqual(accept_friend_request('user1', 'user3', client=self.client), 'no_request')
+        self.assertEqual(decline_friend_request('user1', 'user4', client=self.client), 'declined')
+        self.assertEqual(decline_friend_request('user1', 'user4', client=self.client), 'no_request')
+        self.assertEqual(self._count('Friends'), 2)
+        self.assertEqual(self._count('FriendRequests'), 0)
+
+    def test_accept_all_friend_requests(self):
+        from data_fetcher import send_friend_request, accept_all_friend_requests
+
+        send_friend_request('user3', 'remi_the_rems', client=self.client)
+        send_friend_request('user4', 'remi_the_rems', client=self.client)
+
+        self.assertEqual(sorted(accept_all_friend_requests('user1', client=self.client)), ['user3', 'user4'])
+        self.assertEqual(accept_all_friend_requests('user1', client=self.client), [])
+        self.assertEqual(self._count('Friends'), 3)
+        self.assertEqual(self._count('FriendRequests'), 0)
+
+    def test_remove_friend(self):
+        from data_fetcher import remove_friend
+
+        self.assertEqual(remove_friend('user1', 'blake', client=self.client), 'removed')
+        self.assertEqual(remove_friend('user1', 'blake', client=self.client), 'not_friends')
+        self.assertEqual(remove_friend('user1', 'nobody', client=self.client), 'unknown_user')
+        self.assertEqual(self._count('Friends'), 0)
+
+    def test_search_finds_users_who_signed_up_after_the_index_loaded(self):
+        from data_fetcher import get_friend_data
+        from username_index import UsernameIndex
+
+        index = UsernameIndex()
+        with patch('username_index.get_client', return_value=self.client), \
+                patch('data_fetcher.username_index', index), \
+                patch('data_fetcher.friend_graph') as mock_graph:
+            mock_graph.are_friends.return_value = False
+            index.load()
+            self.client.insert_rows_json("Users", [{'UserId': 'user5', 'Username': 'newbie'}])
+
+            self.assertEqual(get_friend_data('user1', 'newbie'), "You and 'newbie' are not friends yet.")
+            self.assertEqual(index.suggest('new'), ['newbie'])
+
+    def test_failed_operation_leaves_no_temp_tables(self):
+        from data_fetcher import send_friend_request
+
+        self.client.query("DROP TABLE FriendRequests")
+        with self.assertRaises(Exception):
+            send_friend_request('user1', 'jordan', client=self.client)
+
+        self.assertEqual(list(self.client.query("SELECT name FROM sqlite_temp_master")), [])
+
+    def _aborting(self, failures):
+        """Wraps self.client so its next failures scripts fail like a concurrent BigQuery transaction."""
+        from google.api_core.exceptions import BadRequest
+
+        client, remaining = MagicMock(wraps=self.client), [failures]
+
+        def query(script, job_config=None):
+            if 'BEGIN TRANSACTION' in script and remaining[0]:
+                remaining[0] -= 1
+                raise BadRequest("Transaction is aborted due to concurrent update against table FriendRequests")
+            return self.client.query(script, job_config=job_config)
+
+        client.query.side_effect = query
+        return client
+
+    def test_aborted_operation_is_retried(self):
+        from data_fetcher import send_friend_request
+
+        with patch('data_fetcher.time.sleep'), patch('builtins.print'):
+            self.assertEqual(send_friend_request('user1', 'jordan', client=self._aborting(2)), 'sent')
+        self.assertEqual(self._count('FriendRequests'), 1)
+
+    def test_operation_aborted_every_time_reports_a_conflict(self):
+        from data_fetcher import accept_all_friend_requests, remove_friend
+
+        with patch('data_fetcher.time.sleep'), patch('builtins.print'):
+            self.assertEqual(remove_friend('user1', 'blake', client=self._aborting(3)), 'conflict')
+            self.assertIsNone(accept_all_friend_requests('user1', client=self._aborting(3)))
+        self.assertEqual(self._count('Friends'), 1)
+
+    def test_duplicate_request_rows_are_listed_once(self):
+        from cache import user_cache
+        from data_fetcher import get_pending_requests
+
+        user_cache.clear()
+        self.client.insert_rows_json("FriendRequests", [
+            {'RequesterId': 'user3', 'ReceiverId': 'user1', 'RequestedAt': '2024-07-29 07:00:00'},
+            {'RequesterId': 'user3', 'ReceiverId': 'user1', 'RequestedAt': '2024-07-29 07:00:01'},
+        ])
+
+        self.assertEqual(get_pending_requests('user1', client=self.client), [{'username': 'jordan', 'user_id': 'user3'}])
+
+
+class TestAddPostToDatabase(unittest.TestCase):
+    """Tests for the queued post insert, run against the local backend."""
+
+    def setUp(self):
+        from backends import LocalClient
+
+        self.client = LocalClient(":memory:")
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_rerun_does_not_duplicate_post(self):
+        from data_fetcher import add_post_to_database
+        from write_queue import write_queue
+
+        first = add_post_to_database('user1', 'I ran 5k today!', client=self.client, idempotency_key='post:user1:click1')
+        second = add_post_to_database('user1', 'I ran 5k today!', client=self.client, idempotency_key='post:user1:click1')
+        write_queue.flush()
+
+        self.assertTrue(first)
+        self.assertEqual(first, second)
+        rows = list(self.client.query("SELECT PostId, AuthorId, Content FROM Posts"))
+        self.assertEqual([tuple(row.values()) for row in rows], [(first, 'user1', 'I ran 5k today!')])
+
+    def test_same_content_posted_twice_is_kept_twice(self):
+        from data_fetcher import add_post_to_database
+        from write_queue import write_queue
+
+        first = add_post_to_database('user1', 'I ran 5k today!', client=self.client, idempotency_key='post:user1:click2')
+        second = add_post_to_database('user1', 'I ran 5k today!', client=self.client, idempotency_key='post:user1:click3')
+        third = add_post_to_database('user1', 'I ran 5k today!', client=self.client)
+        write_queue.flush()
+
+        self.assertEqual(len({first, second, third}), 3)
+        self.assertEqual(list(self.client.query("SELECT COUNT(*) AS n FROM Posts"))[0]['n'], 3)
+
+
+class TestGetFeed(unittest.TestCase):
+    """Tests for the keyset-paginated friends feed, run against the local backend."""
+
+    def setUp(self):
+        from backends import LocalClient
+
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("Users", [
+            {'UserId': f'user{i}', 'Name': f'User {i}', 'Username': f'user{i}', 'ImageUrl': f'https://example.com/{i}.png'}
+            for i in range(1, 4)
+        ])
+        self.client.insert_rows_json("Friends", [{'UserId1': 'user2', 'UserId2': 'user1'}])
+        start = datetime.datetime(2024, 7, 29, 7, 0, 0)
+        # Pairs of posts share a timestamp, so the PostId tie-break matters
+        self.client.insert_rows_json("Posts", [
+            {'PostId': f'post{i:02d}', 'AuthorId': f'user{i % 3 + 1}',
+             'Timestamp': (start + datetime.timedelta(minutes=i // 2)).isoformat(" "), 'Content': f'Post {i}'}
+            for i in range(30)
+        ])
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_pages_cover_friends_posts_newest_first(self):
+        from data_fetcher import get_feed
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            posts, cursor = get_feed('user1', cursor, limit=7, client=self.client)
+            seen.extend(posts)
+            pages += 1
+            if cursor is None:
+                break
+
+        expected = sorted((f'post{i:02d}' for i in range(30) if i % 3 != 2), reverse=True)
+        self.assertEqual([post['post_id'] for post in seen], expected)
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen[0]['username'], 'user2')
+
+    def test_new_posts_do_not_shift_later_pages(self):
+        from data_fetcher import get_feed
+
+        first, cursor = get_feed('user1', limit=5, client=self.client)
+        self.client.insert_rows_json("Posts", [{'PostId': 'post99', 'AuthorId': 'user1',
+                                                'Timestamp': '2024-07-30 07:00:00', 'Content': 'New'}])
+        second, _ = get_feed('user1', cursor, limit=5, client=self.client)
+
+        self.assertFalse({post['post_id'] for post in first} & {post['post_id'] for post in second})
+        self.assertLess(second[0]['post_id'], first[-1]['post_id'])
+
+
+class TestWindowedLeaderboard(unittest.TestCase):
+    """Tests for the daily rollups and windowed leaderboard, run against the local backend."""
+
+    def setUp(self):
+        from backends import LocalClient
+
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("Users", [
+            {'UserId': 'user1', 'Name': 'Remi', 'Username': 'remi_the_rems'},
+            {'UserId': 'user2', 'Name': 'Blake', 'Username': 'blake'},
+        ])
+        self.client.insert_rows_json("Friends", [{'UserId1': 'user2', 'UserId2': 'user1'}])
+
+        today = datetime.datetime.combine(datetime.datetime.now(datetime.timezone.utc).date(), datetime.time(8))
+        self.client.insert_rows_json("Workouts", [
+            {'WorkoutId': 'w1', 'UserId': 'user1', 'StartTimestamp': today.isoformat(" "),
+             'TotalDistance': 5.0, 'TotalSteps': 6000, 'CaloriesBurned': 300},
+            {'WorkoutId': 'w2', 'UserId': 'user1', 'StartTimestamp': (today - datetime.timedelta(days=20)).isoformat(" "),
+             'TotalDistance': 10.0, 'TotalSteps': 12000, 'CaloriesBurned': 600},
+            {'WorkoutId': 'w3', 'UserId': 'user2', 'StartTimestamp': (today - datetime.timedelta(days=3)).isoformat(" "),
+             'TotalDistance': 7.0, 'TotalSteps': 9000, 'CaloriesBurned': 450},
+        ])
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_windows_sum_rollups(self):
+        from data_fetcher import get_windowed_leaderboard, refresh_daily_rollups
+
+        refresh_daily_rollups(client=self.client)
+
+        today = get_windowed_leaderboard('user1', 'today', client=self.client)
+        week = get_windowed_leaderboard('user1', '7d', client=self.client)
+        all_time = get_windowed_leaderboard('user1', 'all', client=self.client)
+
+        self.assertEqual(set(today), {'user1'})
+        self.assertEqual(week['user2']['distance_rank'], 1)
+        self.assertEqual(all_time['user1']['steps'], 18000)
+        self.assertEqual(all_time['user1']['workouts'], 2)
+
+    def test_leaderboard_only_reads(self):
+        from data_fetcher import get_windowed_leaderboard
+
+        with patch('data_fetcher.refresh_daily_rollups', side_effect=AssertionError("refreshed")):
+            self.assertEqual(get_windowed_leaderboard('user1', 'all', client=self.client), {})
+
+        rows = list(self.client.query("SELECT COUNT(*) AS n FROM WorkoutDailyRollup"))
+        self.assertEqual(rows[0]['n'], 0)
+
+    def test_refresh_is_incremental_and_idempotent(self):
+        from data_fetcher import get_windowed_leaderboard, refresh_daily_rollups
+
+        refresh_daily_rollups(client=self.client)
+        self.client.insert_rows_json("Workouts", [
+            {'WorkoutId': 'w4', 'UserId': 'user2', 'StartTimestamp': datetime.datetime.now().isoformat(" "),
+             'TotalDistance': 1.0, 'TotalSteps': 1000, 'CaloriesBurned': 50},
+        ])
+        refresh_daily_rollups(client=self.client)
+        refresh_daily_rollups(client=self.client)
+
+        all_time = get_windowed_leaderboard('user1', 'all', client=self.client)
+        self.assertEqual(all_time['user2']['workouts'], 2)
+        self.assertEqual(all_time['user2']['steps'], 10000)
+
+    def test_refresh_counts_workouts_logged_late_for_earlier_days(self):
+        from data_fetcher import get_windowed_leaderboard, refresh_daily_rollups
+
+        refresh_daily_rollups(client=self.client)
+        five_days_ago = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(days=5)
+        self.client.insert_rows_json("Workouts", [
+            {'WorkoutId': 'w4', 'UserId': 'user1', 'StartTimestamp': five_days_ago.isoformat(" "),
+             'TotalDistance': 4.0, 'TotalSteps': 5000, 'CaloriesBurned': 250},
+        ])
+        refresh_daily_rollups(client=self.client)
+
+        week = get_windowed_leaderboard('user1', '7d', client=self.client)
+        self.assertEqual(week['user1']['workouts'], 2)
+        self.assertEqual(week['user1']['distance'], 9.0)
+
+
+class TestGetUserProfiles(unittest.TestCase):
+    """Tests for the batch profile lookup."""
+
+    def setUp(self):
+        from cache import user_cache
+        user_cache.clear()
+
+    def _mock_client(self, rows):
+        mock_client = MagicMock()
+        mock_client.query.return_value.result.return_value = rows
+        return mock_client
+
+    def _row(self, user_id, name):
+        return MagicMock(UserId=user_id, Name=name, Username=name.lower(), ImageUrl=None,
+                         DateOfBirth=datetime.date(1990, 1, 1), friends=['user1'])
+
+    def test_many_profiles_in_one_query(self):
+        from data_fetcher import get_user_profiles
+
+        mock_client = self._mock_client([self._row('user2', 'Blake'), self._row('user3', 'Jordan')])
+
+        result = get_user_profiles(['user2', 'user3', 'user2', 'missing'], client=mock_client)
+
+        self.assertEqual(set(result), {'user2', 'user3'})
+        self.assertEqual(result['user3']['full_name'], 'Jordan')
+        mock_client.query.assert_called_once()
+        query, kwargs = mock_client.query.call_args[0][0], mock_client.query.call_args[1]
+        self.assertIn("IN UNNEST(@ids)", query)
+        self.assertEqual(kwargs['job_config'].query_parameters[0].values, ['user2', 'user3', 'missing'])
+
+    @patch('data_fetcher.get_client')
+    def test_cached_profiles_are_not_queried(self, mock_get_client):
+        from data_fetcher import get_user_profiles
+
+        mock_client = self._mock_client([self._row('user2', 'Blake')])
+        mock_get_client.return_value = mock_client
+        get_user_profiles(['user2'])
+
+        result = get_user_profiles(['user2'])
+
+        self.assertEqual(result['user2']['full_name'], 'Blake')
+        mock_client.query.assert_called_once()
+
+    @patch('data_fetcher.get_client')
+    def test_callers_cannot_change_the_cached_profiles(self, mock_get_client):
+        from data_fetcher import get_user_profile, get_user_profiles
+
+        mock_get_client.return_value = self._mock_client([self._row('user2', 'Blake')])
+        get_user_profiles(['user2'])['user2']['friends'].append('user9')
+        get_user_profiles(['user2'])['user2']['friends'].append('user8')
+
+        self.assertEqual(get_user_profiles(['user2'])['user2']['friends'], ['user1'])
+        self.assertEqual(get_user_profile('user2')['friends'], ['user1'])
 
 
 # # Imports for get_user_posts testing
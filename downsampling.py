@@ -0,0 +1,147 @@
+#############################################################################
+# downsampling.py
+#
+# This file contains the downsampling stage for the sensor charts. A long
+# workout can hold millions of readings; display_sensor_data only ships a
+# fixed number of points per sensor to the browser, picked so the chart
+# keeps the shape and peaks of the full series:
+#
+#   lttb   - Largest-Triangle-Three-Buckets, best for smooth line charts
+#   minmax - the lowest and highest reading of every bucket, never drops a peak
+#############################################################################
+
+import numpy as np
+import pandas as pd
+
+# Points per sensor chart sent to the browser
+DEFAULT_MAX_POINTS = 1000
+
+METHODS = ("lttb", "minmax")
+
+
+def lttb(x, y, n_out):
+    """Picks n_out points of a series with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. Every bucket in between keeps
+    the point forming the largest triangle with the point kept from the
+    previous bucket and the mean of the next bucket. The loop runs once per
+    bucket; the work inside each bucket is vectorized.
+
+    Args:
+        x (np.ndarray): Sorted x values (e.g. timestamps as int64).
+        y (np.ndarray): The values at x.
+        n_out (int): Number of points to keep.
+
+    Returns:
+        np.ndarray: Sorted indices of the kept points.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if n_out >= n else np.linspace(0, n - 1, max(n_out, 0), dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, x[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        bx, by = x[start:end], y[start:end]
+        # Twice the triangle area; the constant factor doesn't change the argmax
+        area = np.abs((x[a] - mean_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax(x, y, n_out):
+    """Keeps the lowest and highest reading of n_out // 2 equal buckets.
+
+    Args:
+        x (np.ndarray): Sorted x values.
+        y (np.ndarray): The values at x.
+        n_out (int): Upper bound on the number of points to keep.
+
+    Returns:
+        np.ndarray: Sorted, unique indices of the kept points.
+    """
+    n = len(x)
+    buckets = n_out // 2
+    if n_out >= n or buckets < 1:
+        return np.arange(n) if n_out >= n else np.array([int(np.argmax(y))], dtype=np.int64)
+
+    size = -(-n // buckets)
+    padded = np.full(size * buckets, np.nan)
+    padded[:n] = y
+    grid = padded.reshape(buckets, size)
+    # A trailing bucket can be all padding when size doesn't divide n evenly
+    filled = ~np.isnan(grid).all(axis=1)
+    offsets = np.arange(buckets)[filled] * size
+    grid = grid[filled]
+    kept = np.concatenate([offsets + np.nanargmin(grid, axis=1), offsets + np.nanargmax(grid, axis=1)])
+    return np.unique(kept)
+
+
+def downsample(x, y, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """Returns the indices of at most max_points points to plot from (x, y)."""
+    if method == "lttb":
+        return lttb(x, y, max_points)
+    if method == "minmax":
+        return minmax(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method '{method}', expected one of {METHODS}")
+
+
+def _readings_frame(readings):
+    """Turns a list of reading dicts, a DataFrame or an iterable of DataFrame pages into one DataFrame."""
+    if isinstance(readings, pd.DataFrame):
+        return readings
+    if isinstance(readings, list):
+        return pd.DataFrame.from_records(readings)
+    pages = [page if isinstance(page, pd.DataFrame) else pd.DataFrame.from_records(page) for page in readings]
+    return pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+
+
+def downsample_sensor_data(readings, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """Splits sensor readings per sensor and downsamples each one for charting.
+
+    Args:
+        readings: What get_user_sensor_data or iter_user_sensor_data return:
+            a list of dicts or DataFrame pages with Name, Units, Timestamp and
+            SensorValue.
+        max_points (int): Points to keep per sensor.
+        method (str): "lttb" or "minmax".
+
+    Returns:
+        dict: Maps "Name (Units)" to a DataFrame indexed by Timestamp with one
+        column of that name, holding at most max_points rows.
+    """
+    df = _readings_frame(readings)
+    if df.empty:
+        return {}
+
+    df = df.dropna(subset=["Timestamp", "SensorValue"])
+    timestamps = pd.to_datetime(df["Timestamp"], utc=True).dt.tz_convert(None).to_numpy(dtype="datetime64[ns]")
+    values = pd.to_numeric(df["SensorValue"], errors="coerce").to_numpy(dtype=np.float64)
+    units = df["Units"].fillna("") if "Units" in df else pd.Series("", index=df.index)
+
+    series = {}
+    for (name, unit), positions in df.groupby([df["Name"].fillna("Unknown"), units]).indices.items():
+        order = np.argsort(timestamps[positions], kind="stable")
+        x = timestamps[positions][order].astype(np.int64)
+        y = values[positions][order]
+        finite = ~np.isnan(y)
+        x, y = x[finite], y[finite]
+
+        kept = downsample(x, y, max_points, method)
+        label = f"{name} ({unit})" if unit else name
+        index = pd.DatetimeIndex(x[kept].astype("datetime64[ns]"), name="Timestamp")
+        series[label] = pd.DataFrame({label: y[kept]}, index=index)
+    return series
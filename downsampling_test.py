@@ -0,0 +1,96 @@
+#############################################################################
+# downsampling_test.py
+#
+# This file contains tests for downsampling.py.
+#############################################################################
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from downsampling import lttb, minmax, downsample, downsample_sensor_data
+
+
+class TestLTTB(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.arange(100000, dtype=np.int64)
+        self.y = np.sin(self.x / 500.0)
+        # Single-sample spikes a naive stride would skip
+        self.y[12345] = 40.0
+        self.y[77777] = -40.0
+
+    def test_keeps_requested_point_count(self):
+        kept = lttb(self.x, self.y, 500)
+
+        self.assertEqual(len(kept), 500)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        self.assertEqual((kept[0], kept[-1]), (0, len(self.x) - 1))
+
+    def test_preserves_peaks(self):
+        kept = lttb(self.x, self.y, 500)
+
+        self.assertIn(12345, kept)
+        self.assertIn(77777, kept)
+
+    def test_short_series_is_returned_whole(self):
+        np.testing.assert_array_equal(lttb(self.x[:10], self.y[:10], 500), np.arange(10))
+
+
+class TestMinMax(unittest.TestCase):
+
+    def test_preserves_peaks_and_bounds_size(self):
+        x = np.arange(100001, dtype=np.int64)
+        y = np.cos(x / 300.0)
+        y[54321] = 99.0
+        y[101] = -99.0
+
+        kept = minmax(x, y, 1000)
+
+        self.assertLessEqual(len(kept), 1000)
+        self.assertIn(54321, kept)
+        self.assertIn(101, kept)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            downsample(np.arange(10), np.arange(10), 5, method="stride")
+
+
+class TestDownsampleSensorData(unittest.TestCase):
+
+    def _readings(self, count):
+        start = datetime.datetime(2024, 7, 29, 7, 0, 0)
+        readings = []
+        for i in range(count):
+            timestamp = start + datetime.timedelta(seconds=i)
+            readings.append({'Name': 'Heart Rate', 'Units': 'bpm', 'Timestamp': timestamp, 'SensorValue': 120.0})
+            readings.append({'Name': 'Speed', 'Units': 'km/h', 'Timestamp': timestamp, 'SensorValue': 10.0})
+        readings[2 * (count // 3)]['SensorValue'] = 190.0
+        return readings
+
+    def test_splits_per_sensor_and_bounds_points(self):
+        charts = downsample_sensor_data(self._readings(10000), max_points=200)
+
+        self.assertEqual(sorted(charts), ['Heart Rate (bpm)', 'Speed (km/h)'])
+        for label, frame in charts.items():
+            self.assertLessEqual(len(frame), 200)
+            self.assertEqual(list(frame.columns), [label])
+        self.assertEqual(charts['Heart Rate (bpm)']['Heart Rate (bpm)'].max(), 190.0)
+
+    def test_accepts_dataframe_pages(self):
+        readings = self._readings(3000)
+        pages = [pd.DataFrame(readings[i:i + 1000]) for i in range(0, len(readings), 1000)]
+
+        charts = downsample_sensor_data(iter(pages), max_points=100, method="minmax")
+
+        self.assertEqual(charts['Heart Rate (bpm)']['Heart Rate (bpm)'].max(), 190.0)
+        self.assertTrue(charts['Speed (km/h)'].index.is_monotonic_increasing)
+
+    def test_no_readings(self):
+        self.assertEqual(downsample_sensor_data([]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+#############################################################################
+# friend_graph.py
+#
+# This file contains the in-process friend graph. The Friends table stores
+# each friendship once, in one direction, so every check against it needs
+# an (a, b) OR (b, a) predicate. The graph loads the table once into a
+# compact undirected adjacency structure and answers from memory:
+#
+#   are_friends(a, b)      - O(1), through a set of packed id pairs
+#   friends(user_id)       - the user's friends
+#   mutual_count(a, b)     - friends a and b have in common
+#   suggestions(user_id)   - friends of friends, ranked by mutual friends
+#
+# UserIds are interned to small integers and every user's friends are kept
+# as a sorted array('l') of those integers. accept/remove update the graph
+# in place, and it is reloaded every GRAPH_TTL seconds to pick up changes
+# made by other processes.
+#############################################################################
+
+import bisect
+import threading
+import time
+from array import array
+from collections import Counter
+
+from backends import get_client
+
+# Seconds before the next read reloads the whole graph
+GRAPH_TTL = 600
+
+LOAD_QUERY = """
+    SELECT UserId1, UserId2
+    FROM `keishlyanysanabriatechx25.bytemeproject.Friends`
+"""
+
+
+def _pair(a, b):
+    """Packs an unordered pair of interned ids into one int."""
+    return (a << 32) | b if a < b else (b << 32) | a
+
+
+class FriendGraph:
+    """Undirected friend graph over interned UserIds."""
+
+    def __init__(self, ttl=GRAPH_TTL):
+        self.ttl = ttl
+        self._ids = {}
+        self._user_ids = []
+        self._adjacency = []
+        self._edges = set()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def _intern(self, user_id):
+        index = self._ids.get(user_id)
+        if index is None:
+            index = self._ids[user_id] = len(self._user_ids)
+            self._user_ids.append(user_id)
+            self._adjacency.append(array('l'))
+        return index
+
+    def load(self, client=None):
+        """Replaces the graph with the contents of the Friends table.
+
+        The new graph is built aside and swapped in at once, so reads during a
+        reload see the previous graph rather than a partly built one.
+        """
+        if client is None:
+            client = get_client()
+        rows = client.query(LOAD_QUERY).result()
+
+        ids, user_ids, edges, neighbours = {}, [], set(), []
+
+        def intern(user_id):
+            index = ids.get(user_id)
+            if index is None:
+                index = ids[user_id] = len(user_ids)
+                user_ids.append(user_id)
+            return index
+
+        for row in rows:
+            a, b = intern(row["UserId1"]), intern(row["UserId2"])
+            if a == b or _pair(a, b) in edges:
+                continue
+            edges.add(_pair(a, b))
+            neighbours.append((a, b))
+        # Build each sorted array once instead of inserting edge by edge
+        lists = [[] for _ in user_ids]
+        for a, b in neighbours:
+            lists[a].append(b)
+            lists[b].append(a)
+        adjacency = [array('l', sorted(friends)) for friends in lists]
+
+        with self._lock:
+            self._ids, self._user_ids, self._adjacency, self._edges = ids, user_ids, adjacency, edges
+            self._loaded_at = time.monotonic()
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        if self._stale():
+            # Only one thread reloads; the others wait for it instead of querying too
+            with self._load_lock:
+                if self._stale():
+                    self.load()
+
+    def are_friends(self, user_id, friend_id):
+        """True if the two users are friends, in either direction."""
+        self._ensure_loaded()
+        with self._lock:
+            a, b = self._ids.get(user_id), self._ids.get(friend_id)
+            return a is not None and b is not None and _pair(a, b) in self._edges
+
+    def friends(self, user_id):
+        """Returns the UserIds of a user's friends."""
+        self._ensure_loaded()
+        with self._lock:
+            index = self._ids.get(user_id)
+            if index is None:
+                return []
+            return [self._user_ids[i] for i in self._adjacency[index]]
+
+    def mutual_count(self, user_id, other_id):
+        """Returns how many friends two users have in common."""
+        self._ensure_loaded()
+        with self._lock:
+            a, b = self._ids.get(user_id), self._ids.get(other_id)
+            if a is None or b is None:
+                return 0
+            return len(set(self._adjacency[a]).intersection(self._adjacency[b]))
+
+    def suggestions(self, user_id, limit=5):
+        """Returns the friends of friends a user isn't friends with yet.
+
+        Returns:
+            list: Up to limit (UserId, mutual friend count) pairs, most mutual
+            friends first and then by UserId.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            index = self._ids.get(user_id)
+            if index is None:
+                return []
+            friends = self._adjacency[index]
+            mutuals = Counter()
+            for friend in friends:
+                mutuals.update(self._adjacency[friend])
+            for known in friends:
+                mutuals.pop(known, None)
+            mutuals.pop(index, None)
+            ranked = sorted(mutuals.items(), key=lambda item: (-item[1], self._user_ids[item[0]]))
+            return [(self._user_ids[i], count) for i, count in ranked[:limit]]
+
+    def add(self, user_id, friend_id):
+        """Records a new friendship. Does nothing until the graph has been loaded."""
+        with self._lock:
+            if not self.loaded or user_id == friend_id:
+                return
+            a, b = self._intern(user_id), self._intern(friend_id)
+            if _pair(a, b) in self._edges:
+                return
+            self._edges.add(_pair(a, b))
+            bisect.insort(self._adjacency[a], b)
+            bisect.insort(self._adjacency[b], a)
+
+    def remove(self, user_id, friend_id):
+        """Forgets a friendship. Does nothing until the graph has been loaded."""
+        with self._lock:
+            a, b = self._ids.get(user_id), self._ids.get(friend_id)
+            if a is None or b is None or _pair(a, b) not in self._edges:
+                return
+            self._edges.discard(_pair(a, b))
+            del self._adjacency[a][bisect.bisect_left(self._adjacency[a], b)]
+            del self._adjacency[b][bisect.bisect_left(self._adjacency[b], a)]
+
+
+# Shared by every session in this process
+friend_graph = FriendGraph()
@@ -0,0 +1,95 @@
+#############################################################################
+# friend_graph_test.py
+#
+# This file contains tests for friend_graph.py.
+#############################################################################
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from backends import LocalClient
+from friend_graph import FriendGraph
+
+
+class TestFriendGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.client = LocalClient(":memory:")
+        # Stored one-directionally, like accept_friend_request writes them
+        self.client.insert_rows_json("Friends", [
+            {'UserId1': 'user1', 'UserId2': 'user2'},
+            {'UserId1': 'user3', 'UserId2': 'user1'},
+            {'UserId1': 'user2', 'UserId2': 'user4'},
+            {'UserId1': 'user4', 'UserId2': 'user3'},
+            {'UserId1': 'user2', 'UserId2': 'user5'},
+            {'UserId1': 'user2', 'UserId2': 'user1'},
+        ])
+        patcher = patch('friend_graph.get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.graph = FriendGraph()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_are_friends_in_either_direction(self):
+        self.assertTrue(self.graph.are_friends('user1', 'user2'))
+        self.assertTrue(self.graph.are_friends('user1', 'user3'))
+        self.assertFalse(self.graph.are_friends('user1', 'user4'))
+        self.assertFalse(self.graph.are_friends('user1', 'nobody'))
+
+    def test_friends_and_mutual_count(self):
+        self.assertEqual(sorted(self.graph.friends('user2')), ['user1', 'user4', 'user5'])
+        self.assertEqual(self.graph.mutual_count('user1', 'user4'), 2)
+        self.assertEqual(self.graph.mutual_count('user1', 'nobody'), 0)
+        self.assertEqual(self.graph.friends('nobody'), [])
+
+    def test_suggestions_rank_friends_of_friends(self):
+        self.assertEqual(self.graph.suggestions('user1'), [('user4', 2), ('user5', 1)])
+        self.assertEqual(self.graph.suggestions('user1', limit=1), [('user4', 2)])
+        self.assertEqual(self.graph.suggestions('nobody'), [])
+
+    def test_incremental_updates(self):
+        self.graph.load()
+        with patch.object(self.client, 'query', side_effect=AssertionError("queried")):
+            self.graph.add('user1', 'user4')
+            self.graph.add('user1', 'user6')
+            self.assertTrue(self.graph.are_friends('user4', 'user1'))
+            self.assertEqual(self.graph.suggestions('user1'), [('user5', 1)])
+
+            self.graph.remove('user2', 'user1')
+            self.assertFalse(self.graph.are_friends('user1', 'user2'))
+            self.assertEqual(sorted(self.graph.friends('user1')), ['user3', 'user4', 'user6'])
+
+    def test_reads_during_a_reload_see_the_previous_graph(self):
+        self.graph.load()
+        rows = list(self.client.query("SELECT UserId1, UserId2 FROM Friends"))
+        halfway, resume = threading.Event(), threading.Event()
+
+        def slow_rows():
+            for index, row in enumerate(rows):
+                if index == 1:
+                    halfway.set()
+                    resume.wait(2)
+                yield row
+
+        slow_client = MagicMock()
+        slow_client.query.return_value.result.return_value = slow_rows()
+        reload = threading.Thread(target=self.graph.load, args=(slow_client,))
+        reload.start()
+        halfway.wait(2)
+
+        self.assertTrue(self.graph.are_friends('user1', 'user2'))
+        self.assertTrue(self.graph.are_friends('user4', 'user3'))
+        resume.set()
+        reload.join()
+        self.assertTrue(self.graph.are_friends('user4', 'user3'))
+
+    def test_updates_before_load_are_ignored(self):
+        self.graph.add('user1', 'user9')
+
+        self.assertFalse(self.graph.are_friends('user1', 'user9'))
+
+
+if __name__ == "__main__":
+    unittest.main()
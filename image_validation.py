@@ -0,0 +1,72 @@
+#############################################################################
+# image_validation.py
+#
+# This file contains the image URL checks used by display_post. A URL is a
+# valid image if a HEAD request to it answers 200 with an image/* content
+# type. Checks share one pooled HTTP session, the images of a whole feed are
+# checked concurrently, and every answer (including "not an image") is
+# cached per URL, so reruns don't repeat them.
+#############################################################################
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cache import TTLCache
+
+# Seconds a URL stays known as a valid image, and as not one
+VALID_TTL = 3600
+INVALID_TTL = 300
+
+# (connect, read) timeouts in seconds for one check
+TIMEOUT = (2, 3)
+
+_MAX_WORKERS = int(os.environ.get("IMAGE_CHECK_WORKERS", "16"))
+
+# Pooled HTTP session for image requests, also used by thumbnails.py
+http_session = requests.Session()
+http_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=_MAX_WORKERS, pool_maxsize=_MAX_WORKERS))
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=_MAX_WORKERS, pool_maxsize=_MAX_WORKERS))
+
+_executor = ThreadPoolExecutor(max_workers=_MAX_WORKERS, thread_name_prefix="image-check")
+
+# Shared by every session in this process, keyed by URL
+image_cache = TTLCache(maxsize=4096)
+
+
+def _fetch_is_image(url):
+    """Asks the server whether url is an image, without downloading it."""
+    try:
+        with http_session.head(url, timeout=TIMEOUT, allow_redirects=True) as response:
+            status, content_type = response.status_code, response.headers.get('Content-Type', '')
+        if status in (405, 501):
+            # Some servers don't allow HEAD; read only the headers of a GET instead
+            with http_session.get(url, timeout=TIMEOUT, stream=True) as response:
+                status, content_type = response.status_code, response.headers.get('Content-Type', '')
+        return status == 200 and content_type.startswith('image/')
+    except requests.RequestException:
+        return False
+
+
+def is_valid_image(url):
+    """Returns True if url answers as an image. Results are cached per URL."""
+    if not url:
+        return False
+    # Broken links are retried sooner than working ones
+    return image_cache.get_or_load(url, lambda: _fetch_is_image(url),
+                                   lambda valid: VALID_TTL if valid else INVALID_TTL)
+
+
+def validate_images(urls):
+    """Checks many URLs at once.
+
+    Args:
+        urls (iterable): Image URLs; empty values and repeats are skipped.
+
+    Returns:
+        dict: Maps each URL to True if it is a valid image.
+    """
+    urls = [url for url in dict.fromkeys(urls) if url]
+    futures = {url: _executor.submit(is_valid_image, url) for url in urls}
+    return {url: future.result() for url, future in futures.items()}
@@ -0,0 +1,123 @@
+#############################################################################
+# image_validation_test.py
+#
+# This file contains tests for image_validation.py. The checks run against a
+# stub HTTP server on localhost.
+#############################################################################
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import image_validation
+from image_validation import is_valid_image, validate_images
+
+
+class StubImageServer(BaseHTTPRequestHandler):
+    """Answers like an image host; requests are counted per method and path."""
+
+    requests = Counter()
+    delay = 0
+
+    def _answer(self, send_body):
+        StubImageServer.requests[(self.command, self.path)] += 1
+        time.sleep(self.delay)
+        if self.path.startswith('/no-head') and self.command == 'HEAD':
+            self.send_response(405)
+            self.end_headers()
+            return
+        if self.path.endswith('.png'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', '4')
+            self.end_headers()
+            if send_body:
+                self.wfile.write(b'\x89PNG')
+        elif self.path.endswith('.html'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def do_HEAD(self):
+        self._answer(send_body=False)
+
+    def do_GET(self):
+        self._answer(send_body=True)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestImageValidation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageServer)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubImageServer.requests.clear()
+        StubImageServer.delay = 0
+        image_validation.image_cache.clear()
+
+    def test_valid_and_invalid_urls(self):
+        self.assertTrue(is_valid_image(f"{self.base}/photo.png"))
+        self.assertFalse(is_valid_image(f"{self.base}/page.html"))
+        self.assertFalse(is_valid_image(f"{self.base}/missing.png.gone"))
+        self.assertFalse(is_valid_image("http://127.0.0.1:1/unreachable.png"))
+        self.assertFalse(is_valid_image(None))
+
+    def test_uses_head_requests(self):
+        is_valid_image(f"{self.base}/photo.png")
+
+        self.assertEqual(StubImageServer.requests, Counter({('HEAD', '/photo.png'): 1}))
+
+    def test_falls_back_to_get_when_head_is_not_allowed(self):
+        self.assertTrue(is_valid_image(f"{self.base}/no-head.png"))
+        self.assertEqual(StubImageServer.requests[('GET', '/no-head.png')], 1)
+
+    def test_results_are_cached_including_negative_ones(self):
+        for _ in range(3):
+            is_valid_image(f"{self.base}/photo.png")
+            is_valid_image(f"{self.base}/page.html")
+
+        self.assertEqual(sum(StubImageServer.requests.values()), 2)
+
+    def test_negative_results_expire_sooner(self):
+        with patch.object(image_validation, 'INVALID_TTL', 0):
+            is_valid_image(f"{self.base}/page.html")
+            is_valid_image(f"{self.base}/page.html")
+            is_valid_image(f"{self.base}/photo.png")
+            is_valid_image(f"{self.base}/photo.png")
+
+        self.assertEqual(StubImageServer.requests[('HEAD', '/page.html')], 2)
+        self.assertEqual(StubImageServer.requests[('HEAD', '/photo.png')], 1)
+
+    def test_feed_is_validated_concurrently(self):
+        StubImageServer.delay = 0.2
+        urls = [f"{self.base}/post{i}.png" for i in range(10)] + [None, f"{self.base}/post0.png"]
+
+        started = time.perf_counter()
+        results = validate_images(urls)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(results.values()))
+        self.assertLess(elapsed, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
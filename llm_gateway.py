@@ -0,0 +1,333 @@
+#############################################################################
+# llm_gateway.py
+#
+# This file contains the gateway every model call in data_fetcher.py goes
+# through. It initializes Vertex AI once per process, keeps one
+# GenerativeModel handle per model name, bounds how many calls are in
+# flight at once, gives every call a deadline, and records token counts and
+# latency per call.
+#
+# The model is picked with the BYTEME_LLM_BACKEND environment variable
+# ("vertex", the default, or "fake"). The fake model answers instantly (or
+# after BYTEME_LLM_FAKE_LATENCY seconds) with deterministic text, so the
+# advice and planner paths can be run and load-tested offline.
+#############################################################################
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import vertexai
+from dotenv import load_dotenv
+from vertexai.generative_models import GenerativeModel
+
+DEFAULT_MODEL = "gemini-1.5-flash-002"
+
+# Google Cloud project the Vertex AI calls are billed to, unless VERTEX_PROJECT
+# (in the environment or .env) names another one
+DEFAULT_VERTEX_PROJECT = "dagutierrez17techx25"
+
+BACKEND = os.environ.get("BYTEME_LLM_BACKEND", "vertex")
+
+# Model calls allowed in flight at once across every session in the process
+MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", "4"))
+
+# Seconds a call may take, including waiting for a free slot
+DEADLINE = float(os.environ.get("LLM_DEADLINE", "30"))
+
+# Calls kept for metrics()
+HISTORY = 256
+
+
+class LLMTimeoutError(TimeoutError):
+    """A model call did not finish before its deadline."""
+
+
+class _FakePart:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeContent:
+    def __init__(self, text):
+        self.parts = [_FakePart(text)]
+
+
+class _FakeCandidate:
+    def __init__(self, text):
+        self.content = _FakeContent(text)
+
+
+class _FakeUsage:
+    def __init__(self, prompt_tokens, response_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+        self.total_token_count = prompt_tokens + response_tokens
+
+
+class FakeResponse:
+    """The parts of a Vertex GenerationResponse the app reads."""
+
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.candidates = [_FakeCandidate(text)]
+        self.usage_metadata = usage
+
+
+class FakeModel:
+    """Deterministic stand-in for GenerativeModel.
+
+    Prompts asking for a "plan" get a JSON plan in the planner's format;
+    every other prompt gets a motivational message. The same prompt always
+    gets the same answer. With stream=True the answer arrives in
+    CHUNK_SIZE-character chunks, the latency spread evenly over them.
+    """
+
+    CHUNK_SIZE = 40
+
+    MESSAGES = [
+        "Every step counts. Keep showing up and the results will follow!",
+        "You're stronger than yesterday. Let's make today count!",
+        "Consistency beats intensity. One more workout, one more win!",
+    ]
+    ACTIVITIES = ["Running", "Cycling", "Strength training", "Yoga", "Swimming", "Walking", "Rest"]
+
+    def __init__(self, model_name=DEFAULT_MODEL, latency=None):
+        self.model_name = model_name
+        self.latency = float(os.environ.get("BYTEME_LLM_FAKE_LATENCY", "0")) if latency is None else latency
+
+    def _answer(self, prompt):
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16)
+        if '"plan"' not in prompt:
+            return self.MESSAGES[seed % len(self.MESSAGES)]
+        plan = {}
+        for day in range(1, 8):
+            activity = self.ACTIVITIES[(seed + day) % len(self.ACTIVITIES)]
+            plan[f"Day {day}"] = [{"activity": activity, "duration": f"{20 + 5 * ((seed + day) % 5)} minutes",
+                                   "calories_goal": 150 + 25 * ((seed + day) % 6)}]
+        return json.dumps({"plan": plan, "general_tip": "Warm up before and stretch after every workout."})
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        text = self._answer(prompt)
+        usage = _FakeUsage(estimate_tokens(prompt), estimate_tokens(text))
+        if stream:
+            return self._stream(text, usage)
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(text, usage)
+
+    def _stream(self, text, usage):
+        chunks = [text[i:i + self.CHUNK_SIZE] for i in range(0, len(text), self.CHUNK_SIZE)]
+        for i, chunk in enumerate(chunks):
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            # Like Vertex, only the last chunk carries the token counts
+            yield FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
+
+
+def estimate_tokens(text):
+    """Rough token count of text, about four characters per token."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class LLMGateway:
+    """Owns the model handles and runs every model call under a limit and deadline."""
+
+    def __init__(self, backend=BACKEND, max_in_flight=MAX_IN_FLIGHT, deadline=DEADLINE):
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # Calls run here so the caller can stop waiting at the deadline
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm")
+        self._models = {}
+        self._initialized = False
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self._history = deque(maxlen=HISTORY)
+
+    def _init_vertex(self):
+        load_dotenv()
+        vertexai.init(project=os.environ.get("VERTEX_PROJECT", DEFAULT_VERTEX_PROJECT), location="us-central1")
+
+    def model(self, name=DEFAULT_MODEL):
+        """Returns the shared handle for a model, initializing the backend on first use."""
+        handle = self._models.get(name)
+        if handle is None:
+            with self._lock:
+                handle = self._models.get(name)
+                if handle is None:
+                    if self.backend == "fake":
+                        handle = FakeModel(name)
+                    else:
+                        if not self._initialized:
+                            self._init_vertex()
+                            self._initialized = True
+                        handle = GenerativeModel(name)
+                    self._models[name] = handle
+        return handle
+
+    def generate(self, prompt, model=DEFAULT_MODEL, deadline=None, label=None):
+        """Calls generate_content on a model and returns its response.
+
+        Args:
+            prompt (str): The prompt.
+            model (str): Model name.
+            deadline (float, optional): Seconds to wait for the answer,
+                including waiting for a free slot. Defaults to self.deadline.
+            label (str, optional): Name the call is recorded under in metrics().
+
+        Raises:
+            LLMTimeoutError: If the deadline passed first.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        started = time.perf_counter()
+        handle = self.model(model)
+
+        if not self._slots.acquire(timeout=deadline):
+            self._record(label, started, error="timeout")
+            raise LLMTimeoutError(f"No free model slot within {deadline:.0f}s")
+
+        def call():
+            try:
+                return handle.generate_content(prompt)
+            finally:
+                # The slot stays taken until the model answers, even after a timeout
+                self._slots.release()
+
+        future = self._executor.submit(call)
+        try:
+            response = future.result(timeout=max(0, deadline - (time.perf_counter() - started)))
+        except FutureTimeout:
+            self._record(label, started, error="timeout")
+            raise LLMTimeoutError(f"Model {model} did not answer within {deadline:.0f}s") from None
+        except Exception as e:
+            self._record(label, started, error=type(e).__name__)
+            raise
+
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        response_tokens = getattr(usage, "candidates_token_count", None)
+        self._record(label, started,
+                     prompt_tokens=prompt_tokens if isinstance(prompt_tokens, int) else estimate_tokens(prompt),
+                     response_tokens=response_tokens if isinstance(response_tokens, int) else 0)
+        return response
+
+    def stream(self, prompt, model=DEFAULT_MODEL, deadline=None, label=None):
+        """Calls generate_content with stream=True and yields the text of each chunk.
+
+        Takes the same arguments as generate(). The deadline covers the whole
+        stream; LLMTimeoutError is raised from the iteration once it passes.
+        """
+        deadline = self.deadline if deadline is None else deadline
+        started = time.perf_counter()
+        handle = self.model(model)
+
+        if not self._slots.acquire(timeout=deadline):
+            self._record(label, started, error="timeout")
+            raise LLMTimeoutError(f"No free model slot within {deadline:.0f}s")
+
+        release = True
+        first_chunk_ms = None
+        usage = None
+        try:
+            chunks = iter(self._executor.submit(handle.generate_content, prompt, stream=True)
+                          .result(timeout=deadline))
+            while True:
+                # Each chunk is awaited on the executor so the deadline holds between chunks too
+                future = self._executor.submit(next, chunks, None)
+                try:
+                    chunk = future.result(timeout=max(0, deadline - (time.perf_counter() - started)))
+                except FutureTimeout:
+                    # The slot is freed once the pending read gives up, not before
+                    release = False
+                    future.add_done_callback(lambda _: self._slots.release())
+                    self._record(label, started, error="timeout", first_chunk_ms=first_chunk_ms)
+                    raise LLMTimeoutError(f"Model {model} did not finish within {deadline:.0f}s") from None
+                if chunk is None:
+                    break
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - started) * 1000
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk.text
+        except LLMTimeoutError:
+            raise
+        except FutureTimeout:
+            self._record(label, started, error="timeout")
+            raise LLMTimeoutError(f"Model {model} did not answer within {deadline:.0f}s") from None
+        except Exception as e:
+            self._record(label, started, error=type(e).__name__, first_chunk_ms=first_chunk_ms)
+            raise
+        finally:
+            if release:
+                self._slots.release()
+
+        prompt_tokens = getattr(usage, "prompt_token_count", None)
+        response_tokens = getattr(usage, "candidates_token_count", None)
+        self._record(label, started,
+                     prompt_tokens=prompt_tokens if isinstance(prompt_tokens, int) else estimate_tokens(prompt),
+                     response_tokens=response_tokens if isinstance(response_tokens, int) else 0,
+                     first_chunk_ms=first_chunk_ms)
+
+    def _record(self, label, started, prompt_tokens=0, response_tokens=0, error=None, first_chunk_ms=None):
+        latency_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.calls += 1
+            if error == "timeout":
+                self.timeouts += 1
+            elif error is not None:
+                self.errors += 1
+            self.prompt_tokens += prompt_tokens
+            self.response_tokens += response_tokens
+            self._history.append({'label': label, 'latency_ms': latency_ms, 'first_chunk_ms': first_chunk_ms,
+                                  'prompt_tokens': prompt_tokens, 'response_tokens': response_tokens,
+                                  'error': error})
+
+    def recent_calls(self, label=None):
+        """Returns the recorded calls, oldest first, optionally only those under label."""
+        with self._lock:
+            return [call for call in self._history if label is None or call['label'] == label]
+
+    def metrics(self):
+        """Returns call counts, token totals and latency percentiles of the recent calls."""
+        with self._lock:
+            latencies = sorted(call['latency_ms'] for call in self._history if call['error'] is None)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            'backend': self.backend,
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'prompt_tokens': self.prompt_tokens,
+            'response_tokens': self.response_tokens,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+        }
+
+    def reset(self, backend=None):
+        """Forgets the model handles and metrics, optionally switching backend. Mainly useful in tests."""
+        with self._lock:
+            if backend is not None:
+                self.backend = backend
+            self._models.clear()
+            self._initialized = False
+            self.calls = self.errors = self.timeouts = 0
+            self.prompt_tokens = self.response_tokens = 0
+            self._history.clear()
+
+
+# Shared by every session in this process
+llm = LLMGateway()
@@ -0,0 +1,146 @@
+#############################################################################
+# llm_gateway_test.py
+#
+# This file contains tests for llm_gateway.py. Nothing here reaches Vertex
+# AI: the tests use the fake model or patch GenerativeModel.
+#############################################################################
+import json
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from llm_gateway import DEFAULT_VERTEX_PROJECT, FakeModel, LLMGateway, LLMTimeoutError
+
+
+class SlowModel:
+    """Model that blocks until released, counting the calls in flight."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.release.wait(5)
+        with self._lock:
+            self.in_flight -= 1
+        return FakeModel().generate_content(prompt)
+
+
+class TestLLMGateway(unittest.TestCase):
+
+    @patch('llm_gateway.GenerativeModel')
+    @patch('llm_gateway.vertexai.init')
+    def test_vertex_is_initialized_once_and_handles_are_reused(self, mock_init, mock_model):
+        gateway = LLMGateway(backend="vertex")
+        mock_model.return_value.generate_content.return_value = MagicMock(usage_metadata=None)
+
+        for _ in range(3):
+            gateway.generate("Hello")
+        gateway.generate("Hello", model="gemini-other")
+
+        mock_init.assert_called_once()
+        self.assertEqual(mock_model.call_count, 2)
+        self.assertEqual(mock_model.return_value.generate_content.call_count, 4)
+
+    @patch.dict('os.environ', {}, clear=True)
+    @patch('llm_gateway.load_dotenv')
+    @patch('llm_gateway.GenerativeModel')
+    @patch('llm_gateway.vertexai.init')
+    def test_vertex_project_defaults_when_unset(self, mock_init, mock_model, mock_dotenv):
+        LLMGateway(backend="vertex").model()
+
+        mock_init.assert_called_once_with(project=DEFAULT_VERTEX_PROJECT, location="us-central1")
+
+    def test_fake_model_is_deterministic(self):
+        gateway = LLMGateway(backend="fake")
+
+        first = gateway.generate("Motivate me").text
+        self.assertEqual(gateway.generate("Motivate me").text, first)
+        self.assertIn(first, FakeModel.MESSAGES)
+
+    def test_fake_model_answers_planner_prompts_with_a_plan(self):
+        response = LLMGateway(backend="fake").generate('Return a JSON dictionary with "plan" and "general_tip"')
+
+        answer = json.loads(response.text)
+        self.assertEqual(list(answer['plan']), [f"Day {day}" for day in range(1, 8)])
+        self.assertEqual(set(answer['plan']['Day 1'][0]), {'activity', 'duration', 'calories_goal'})
+        self.assertTrue(answer['general_tip'])
+
+    def test_tokens_and_latency_are_recorded(self):
+        gateway = LLMGateway(backend="fake")
+
+        gateway.generate("x" * 400, label="advice")
+        gateway.generate("y" * 40, label="planner")
+
+        metrics = gateway.metrics()
+        self.assertEqual(metrics['calls'], 2)
+        self.assertEqual(metrics['prompt_tokens'], 110)
+        self.assertGreater(metrics['response_tokens'], 0)
+        self.assertEqual([call['prompt_tokens'] for call in gateway.recent_calls("advice")], [100])
+
+    def test_in_flight_calls_are_limited(self):
+        gateway = LLMGateway(backend="fake", max_in_flight=2)
+        model = SlowModel()
+        gateway._models["gemini-1.5-flash-002"] = model
+
+        threads = [threading.Thread(target=gateway.generate, args=(f"prompt {i}",)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        model.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(model.max_in_flight, 2)
+        self.assertEqual(gateway.metrics()['calls'], 6)
+
+    def test_calls_past_the_deadline_time_out(self):
+        gateway = LLMGateway(backend="fake", max_in_flight=1)
+        model = SlowModel()
+        gateway._models["gemini-1.5-flash-002"] = model
+
+        with self.assertRaises(LLMTimeoutError):
+            gateway.generate("slow", deadline=0.1)
+        # The only slot is still held by the unfinished call
+        with self.assertRaises(LLMTimeoutError):
+            gateway.generate("queued", deadline=0.1)
+        model.release.set()
+
+        self.assertEqual(gateway.metrics()['timeouts'], 2)
+
+    def test_stream_yields_chunks_and_records_tokens(self):
+        gateway = LLMGateway(backend="fake")
+
+        chunks = list(gateway.stream('Return JSON with "plan"', label="planner"))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertIn("Day 1", json.loads("".join(chunks))['plan'])
+        call = gateway.recent_calls("planner")[0]
+        self.assertGreater(call['response_tokens'], 0)
+        self.assertIsNotNone(call['first_chunk_ms'])
+
+    def test_stream_past_the_deadline_times_out(self):
+        gateway = LLMGateway(backend="fake", max_in_flight=1)
+        gateway.model().latency = 2
+
+        with self.assertRaises(LLMTimeoutError):
+            list(gateway.stream('Return JSON with "plan"', deadline=0.2))
+
+        self.assertEqual(gateway.metrics()['timeouts'], 1)
+
+    def test_reset_switches_backend(self):
+        gateway = LLMGateway(backend="vertex")
+
+        gateway.reset(backend="fake")
+
+        self.assertIsInstance(gateway.model(), FakeModel)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,11 +15,17 @@ import matplotlib.pyplot as plt
 # Import for display_post
 import requests
 import base64
-from data_fetcher import get_user_posts, get_genai_advice, get_user_profile, get_user_sensor_data, get_user_workouts, get_friend_data, send_friend_request, remove_friend, get_leaderboard_data, leaderboard_scoring_logic, save_goal, ai_call_for_planner, mark_task, get_progress_data, get_pending_requests, accept_friend_request, decline_friend_request, save_plan, read_task_completion_from_gcs
+from data_fetcher import get_user_posts, get_genai_advice, get_user_profile, get_user_profiles, get_user_sensor_data, get_user_workouts_frame, get_friend_data, send_friend_request, remove_friend, get_leaderboard_data, get_windowed_leaderboard, leaderboard_scoring_logic, save_goal, ai_call_for_planner, get_plan_draft, mark_task, get_progress_data, get_pending_requests, accept_friend_request, accept_all_friend_requests, decline_friend_request, save_plan, read_task_completion_from_gcs
 
 # Import for user_profile
 import datetime
 from google.cloud import bigquery
+from data_context import DataContext
+from downsampling import downsample_sensor_data, DEFAULT_MAX_POINTS
+from username_index import username_index
+from image_validation import is_valid_image
+from thumbnails import thumbnail, thumbnail_src
+from friend_graph import friend_graph
 
 # This one has been written for you as an example. You may change it as wanted.
 def display_my_custom_component(value):
@@ -59,20 +65,9 @@ def display_post(username, user_image, timestamp, content, post_image=None):
         "user_image": user_image
     }
 
-    def is_valid_image(url):
-        """Checks if a given URL is a valid image."""
-        try:
-            print(f"Attempting to fetch: {url}") #added print statement
-            response = requests.get(url, stream=True, timeout=5)
-            print(f"Response status: {response.status_code}") #added print statement
-            content_type = response.headers.get('Content-Type', '')
-            print(f"Content type: {content_type}") #added print statement
-            return response.status_code == 200 and 'image' in content_type
-        except requests.RequestException as e:
-            print(f"Request exception: {e}") #added print statement
-            return False
-
-    # Check if post_image is provided and valid
+    # Check if post_image is provided and valid; answers are cached per URL
+    # (see image_validation.py), so pages that ran validate_images over their
+    # posts first don't wait here
     if post['post_image'] and not is_valid_image(post['post_image']):
         # If invalid, just set to None and inform the user
         st.warning("Invalid image URL. Your post will be created without an image.")
@@ -117,7 +112,8 @@ def display_post(username, user_image, timestamp, content, post_image=None):
 
     # Handle None values
     username_display = post['username'] if post['username'] else ""
-    user_image_display = post['user_image'] if post['user_image'] else ""
+    # Images are served as thumbnails at their display width (see thumbnails.py)
+    user_image_display = thumbnail_src(post['user_image'], 50) if post['user_image'] else ""
     content_display = post['content'] if post['content'] else ""
     timestamp_display = post['timestamp'] if post['timestamp'] else ""
 
@@ -132,7 +128,7 @@ def display_post(username, user_image, timestamp, content, post_image=None):
                 </div>
                 <p>{content_display}</p>
             </div>
-            <img src="{post['post_image']}" style="width: 100%; height: auto;">
+            <img src="{thumbnail_src(post['post_image'], 640)}" style="width: 100%; height: auto;">
             <div class="timestamp-row">
                 <p>Posted on: {timestamp_display}</p>
             </div>
@@ -157,9 +153,25 @@ def display_post(username, user_image, timestamp, content, post_image=None):
     
     st.markdown(html_content, unsafe_allow_html=True)
 
+# Table headings for the columns of get_user_workouts_frame
+WORKOUT_COLUMN_LABELS = {
+    'WorkoutId': 'Workout ID',
+    'StartTimestamp': 'Start Time',
+    'end_timestamp': 'End Time',
+    'StartLocationLat': 'Start Lat',
+    'StartLocationLong': 'Start Long',
+    'EndLocationLat': 'End Lat',
+    'EndLocationLong': 'End Long',
+    'distance': 'Distance (km)',
+    'steps': 'Steps',
+    'calories_burned': 'Calories Burned',
+}
+
+
 def display_activity_summary(workouts_list):
-    # Convert the workouts data into a DataFrame for easy display
-    df = pd.DataFrame(workouts_list)
+    # Workouts come either as get_user_workouts' list of dicts or as the
+    # DataFrame from get_user_workouts_frame, which is used as is
+    df = workouts_list if isinstance(workouts_list, pd.DataFrame) else pd.DataFrame(workouts_list)
 
     # Display a table with the workout summary
     st.subheader("Activity Summary")
@@ -183,19 +195,23 @@ def display_activity_summary(workouts_list):
 
 
 def display_recent_workouts(workouts_list):
-    if not workouts_list:
+    if workouts_list is None or len(workouts_list) == 0:
         st.write("No recent workouts. Let's get started!")
         return
 
-    #Gemini was used in this method to create the table using DataFrame
-    # Sort workouts by start time (most recent first)
-    workouts_list.sort(key=lambda x: x['StartTimestamp'], reverse=True)
+    if isinstance(workouts_list, pd.DataFrame):
+        # get_user_workouts_frame already returns the newest workouts first
+        df = workouts_list.rename(columns=WORKOUT_COLUMN_LABELS)
+    else:
+        #Gemini was used in this method to create the table using DataFrame
+        # Sort workouts by start time (most recent first)
+        workouts_list.sort(key=lambda x: x['StartTimestamp'], reverse=True)
 
-    # Convert workouts_list into a DataFrame for easier display in table form
-    df = pd.DataFrame(workouts_list)
+        # Convert workouts_list into a DataFrame for easier display in table form
+        df = pd.DataFrame(workouts_list)
 
-    # Rename columns for better readability
-    df.columns = ['Workout ID', 'Start Time', 'End Time', 'Start Location', 'End Location', 'Distance (km)', 'Steps', 'Calories Burned']
+        # Rename columns for better readability
+        df.columns = ['Workout ID', 'Start Time', 'End Time', 'Start Location', 'End Location', 'Distance (km)', 'Steps', 'Calories Burned']
 
     st.write("Here is a list of your most recent workout(s):")
     
@@ -203,54 +219,95 @@ def display_recent_workouts(workouts_list):
     st.table(df)
 
 
-def display_genai_advice(timestamp, content, image):
+def _number(value):
+    """A workout statistic for display, with missing values shown as 0."""
+    return 0 if pd.isna(value) else value
+
+
+def display_workout_cards(workouts):
+    """Shows one card with distance, steps and calories per row of a get_user_workouts_frame frame."""
+    for workout in workouts.itertuples(index=False):
+        with st.container():
+            start_time = workout.StartTimestamp
+            formatted_time = start_time.strftime('%Y-%m-%d %H:%M') if pd.notna(start_time) else "an unknown date"
+            st.write(f"**Workout on {formatted_time}**")
+
+            # Create columns for workout stats
+            stat_cols = st.columns(3)
 
-    genai_advice = get_genai_advice('user1') #get data from data_fetcher
+            with stat_cols[0]:
+                st.metric("Distance", f"{_number(workout.distance):.2f} km")
+
+            with stat_cols[1]:
+                st.metric("Steps", int(_number(workout.steps)))
+
+            with stat_cols[2]:
+                st.metric("Calories", _number(workout.calories_burned))
+
+            st.divider()
+
+
+def display_genai_advice(timestamp, content, image):
 
     #get timestamp and display it 
-    timestamp = genai_advice['timestamp']
     if timestamp is not None:
         st.subheader(f" :blue[{timestamp}]", divider="green")
     else:
         st.subheader(f" :blue[No timestamp available]", divider="green")
 
     #get motivational message and display it
-    content = genai_advice['content']
     if content is not None:
         st.title(f" :red[{content}]")
     else:
         st.title(f" :red[No motivational message available]")
 
     #get image and display it  
-    image = genai_advice['image']
     if image is not None:
-        st.image(image)
+        st.image(thumbnail(image, 640))
     else:
         st.title(f" :red[No image available]")
 
-def display_sensor_data(sensor_list):
+def display_sensor_data(sensor_list, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """Charts each sensor of a workout over time.
 
-    st.title("User Sensor Data Viewer")
+    Readings are split per sensor and downsampled before they reach the
+    browser, so every chart holds at most max_points points however long the
+    workout was.
 
-    #if user_id and workout_id:
-    #sensor_data_df = get_user_sensor_data(user_id, workout_id)
+    Args:
+        sensor_list: Readings from get_user_sensor_data (list of dicts),
+            get_user_sensor_frame (a DataFrame) or iter_user_sensor_data
+            (DataFrame pages).
+        max_points (int): Points per chart.
+        method (str): "lttb" or "minmax", see downsampling.py.
+    """
 
-    if sensor_list is not None:
-        #st.subheader(f"Sensor Data for User: {user_id}, Workout: {workout_id}")
-        st.dataframe(sensor_list)  # Display as a nice interactive table
-    #elif sensor_list is not None and sensor_list.empty:
-        #st.info("No sensor data found for the specified User ID and Workout ID.")
-    else:
+    st.title("User Sensor Data Viewer")
+
+    if sensor_list is None:
         st.warning("Invalid User ID and Workout ID.")
+        return
+
+    charts = downsample_sensor_data(sensor_list, max_points=max_points, method=method)
+    if not charts:
+        st.info("No sensor data found for the specified User ID and Workout ID.")
+        return
 
-def display_user_profile(user_id):
+    for label, series in charts.items():
+        st.subheader(label)
+        st.line_chart(series)
+
+def display_user_profile(user_id, ctx=None):
     """Displays the user profile information in a well-formatted layout.
     
     Args:
         user_id (str): The ID of the user whose profile is being displayed.
+        ctx (DataContext, optional): The current run's data context. A new one is used if omitted.
     """
+    ctx = ctx or DataContext()
+
     # Get user profile data
-    user_profile = get_user_profile(user_id)
+    user_profile = ctx.fetch(get_user_profile, user_id)
     
     if not user_profile:
         st.error(f"User profile not found for ID: {user_id}")
@@ -262,7 +319,7 @@ def display_user_profile(user_id):
     # Profile image and basic info
     with col1:
         if user_profile.get("profile_image"):
-            st.image(user_profile["profile_image"], width=200)
+            st.image(thumbnail(user_profile["profile_image"], 200), width=200)
         else:
             # Display placeholder if no image
             st.image("https://via.placeholder.com/200x200?text=No+Image", width=200)
@@ -292,7 +349,7 @@ def display_user_profile(user_id):
         
         # Additional profile stats could go here
         # Example: posts count
-        posts = get_user_posts(user_id)
+        posts = ctx.fetch(get_user_posts, user_id)
         st.write(f"**Posts:** {len(posts)}")
     
     # Display tabs for different sections of the profile
@@ -300,7 +357,6 @@ def display_user_profile(user_id):
     
     # Posts tab
     with profile_tabs[0]:
-        posts = get_user_posts(user_id)
         if posts:
             for post in posts:
                 with st.container():
@@ -308,7 +364,7 @@ def display_user_profile(user_id):
                     st.write(post['content'])
                     
                     if post.get('image'):
-                        st.image(post['image'])
+                        st.image(thumbnail(post['image'], 640))
                     
                     st.divider()
         else:
@@ -320,6 +376,7 @@ def display_user_profile(user_id):
             # Create grid layout for friends
             friends_per_row = 4
             num_friends = len(user_profile["friends"])
+            friend_profiles = ctx.fetch(get_user_profiles, user_profile["friends"])
             
             for i in range(0, num_friends, friends_per_row):
                 cols = st.columns(min(friends_per_row, num_friends - i))
@@ -327,11 +384,11 @@ def display_user_profile(user_id):
                 for j in range(min(friends_per_row, num_friends - i)):
                     with cols[j]:
                         friend_id = user_profile["friends"][i + j]
-                        friend_profile = get_user_profile(friend_id)
+                        friend_profile = friend_profiles.get(friend_id)
                         
                         if friend_profile:
                             if friend_profile.get("profile_image"):
-                                st.image(friend_profile["profile_image"], width=100)
+                                st.image(thumbnail(friend_profile["profile_image"], 100), width=100)
                             else:
                                 st.image("https://via.placeholder.com/100x100?text=No+Image", width=100)
                             
@@ -345,83 +402,95 @@ def display_user_profile(user_id):
     
     # Activity tab
     with profile_tabs[2]:
-        # Assuming you have a function to get user workouts
+        # The same frame the Activity Summary and Recent Workouts tabs use, so
+        # this run reads it once; it is already sorted newest first
         try:
-            workouts = get_user_workouts(user_id)
-            if workouts and len(workouts) > 0:
-                # Sort workouts by start time (most recent first)
-                workouts.sort(key=lambda x: x['StartTimestamp'], reverse=True)
-                
-                # Take only 5 most recent
-                recent_workouts = workouts[:5]
-                
-                for workout in recent_workouts:
-                    with st.container():
-                        # Format timestamp
-                        start_time = workout['StartTimestamp']
-                        formatted_time = start_time
-                        if isinstance(start_time, datetime.datetime):
-                            formatted_time = start_time.strftime('%Y-%m-%d %H:%M')
-                        
-                        st.write(f"**Workout on {formatted_time}**")
-                        
-                        # Create columns for workout stats
-                        stat_cols = st.columns(3)
-                        
-                        with stat_cols[0]:
-                            st.metric("Distance", f"{workout.get('Distance (km)', 0):.2f} km")
-                        
-                        with stat_cols[1]:
-                            st.metric("Steps", workout.get('Steps', 0))
-                        
-                        with stat_cols[2]:
-                            st.metric("Calories", workout.get('Calories Burned', 0))
-                        
-                        st.divider()
+            workouts = ctx.fetch(get_user_workouts_frame, user_id)
+            if workouts is not None and len(workouts) > 0:
+                display_workout_cards(workouts.head(5))
             else:
                 st.write("No workout activity recorded yet.")
         except Exception as e:
             st.write("Unable to load activity data.")
             st.error(str(e))
 
-def friend_request_ui(user_id):
+# What friend_request_ui tells the user for each status code the friend operations return
+FRIEND_STATUS_MESSAGES = {
+    'sent': (st.success, "Friend request sent to {name}!"),
+    'unknown_user': (st.error, "Username '{name}' does not exist."),
+    'self': (st.warning, "You cannot send a friend request to yourself."),
+    'already_friends': (st.info, "You are already friends with {name}."),
+    'already_pending': (st.info, "A friend request is already pending between you and {name}."),
+    'removed': (st.success, "Removed {name} from your friends."),
+    'not_friends': (st.info, "You and {name} are not friends."),
+    'accepted': (st.success, "You are now friends with {name}!"),
+    'declined': (st.info, "Declined friend request from {name}."),
+    'no_request': (st.info, "The friend request from {name} is no longer pending."),
+    'conflict': (st.warning, "Someone else changed this at the same time, please try again."),
+}
+
+
+def show_friend_status(status, name):
+    """Shows the message for a friend operation's status code."""
+    show, message = FRIEND_STATUS_MESSAGES.get(status, (st.error, "Something went wrong, please try again."))
+    show(message.format(name=name))
+
+
+def friend_request_ui(user_id, ctx=None):
     # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Friend Request Functionality (Kei) ===
     """
     Note: This function will call get_friend_data in data_fetcher.py to get the data of 
     the friend and send/receive friend requests for it to be reflected in the database
     """
+    ctx = ctx or DataContext()
+
     st.header("Friend Network")
     
     # Create tabs for different friend-related functions
-    tab1, tab2 = st.tabs(["Search Users", "Pending Requests"])
+    tab1, tab2, tab3 = st.tabs(["Search Users", "Pending Requests", "People You May Know"])
     
     # Tab 1: Search for users to send friend requests
     with tab1:
         st.subheader("Find Friends")
-        friend_username = st.text_input("Search for users by username")
+        search = st.text_input("Search for users by username")
+        friend_username = search
+
+        # Suggest matching usernames from the in-memory index, without a query per keystroke.
+        # What was typed stays the default, so a suggestion is only used once picked.
+        suggestions = [name for name in username_index.suggest(search) if name != search]
+        if suggestions:
+            friend_username = st.selectbox(
+                "Did you mean", [search] + suggestions,
+                format_func=lambda name: f"{name} (as typed)" if name == search else name)
         
         if friend_username:
-            search_results = get_friend_data(user_id, friend_username)
+            search_results = ctx.fetch(get_friend_data, user_id, friend_username)
 
             st.write(search_results)
 
             if search_results == f"You and '{friend_username}' are not friends yet.":
                 if st.button(f"Send Friend Request to {friend_username}"):
-                    send_friend_request(user_id, friend_username)
-                    st.success(f"Friend request sent to {friend_username}!")
+                    show_friend_status(send_friend_request(user_id, friend_username), friend_username)
             elif search_results == f"You and '{friend_username}' are friends.":
                 if st.button(f"Remove Friend"):
-                    remove_friend(user_id, friend_username)
-                    st.success(f"Removed {friend_username} from your friends.")
+                    show_friend_status(remove_friend(user_id, friend_username), friend_username)
     
     # Tab 2: Users can see their pending requests
     with tab2:
         st.subheader("Requests You've Received")
-        pending_requests = get_pending_requests(user_id)
+        pending_requests = ctx.fetch(get_pending_requests, user_id)
 
         if not pending_requests:
             st.info("No pending friend requests.")
         else:
+            if len(pending_requests) > 1 and st.button(f"✅ Accept all ({len(pending_requests)})", key="accept_all"):
+                accepted = accept_all_friend_requests(user_id)
+                if accepted is None:
+                    show_friend_status('conflict', user_id)
+                else:
+                    st.success(f"Accepted {len(accepted)} friend request(s).")
+                    st.rerun()
+
             for req in pending_requests:
                 with st.container():
                     st.write(f"👤 {req['username']} sent you a friend request.")
@@ -429,23 +498,48 @@ def friend_request_ui(user_id):
 
                     with col1:
                         if st.button(f"✅ Accept {req['username']}", key=f"accept_{req['user_id']}"):
-                            accept_friend_request(user_id, req['user_id'])
-                            st.success(f"You are now friends with {req['username']}!")
+                            show_friend_status(accept_friend_request(user_id, req['user_id']), req['username'])
                             st.rerun()
 
                     with col2:
                         if st.button(f"❌ Decline {req['username']}", key=f"decline_{req['user_id']}"):
-                            decline_friend_request(user_id, req['user_id'])
-                            st.info(f"Declined friend request from {req['username']}.")
+                            show_friend_status(decline_friend_request(user_id, req['user_id']), req['username'])
                             st.rerun()
 
+    # Tab 3: Friends of friends, ranked by mutual friends, from the in-memory friend graph
+    with tab3:
+        st.subheader("People You May Know")
+        suggestions = friend_graph.suggestions(user_id)
+
+        if not suggestions:
+            st.info("No suggestions yet. Add some friends first!")
+        else:
+            profiles = ctx.fetch(get_user_profiles, [uid for uid, _ in suggestions])
+            for uid, mutual in suggestions:
+                profile = profiles.get(uid)
+                if not profile:
+                    continue
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    st.write(f"👤 **{profile['full_name']}** (@{profile['username']})")
+                    st.caption(f"{mutual} mutual friend{'s' if mutual != 1 else ''}")
+                with col2:
+                    if st.button("➕ Add", key=f"suggest_{uid}"):
+                        show_friend_status(send_friend_request(user_id, profile['username']), profile['username'])
+
 #created with help from gemini, asked it to create a leaderboard table based on leaderboard_data and to then also add the
 #friend's profile functionality
-def create_leaderboard_ui(user_id):
+def create_leaderboard_ui(user_id, ctx=None):
+    ctx = ctx or DataContext()
+
     st.title("Friends Leaderboard")
+
+    windows = {'All time': 'all', 'Last 30 days': '30d', 'Last 7 days': '7d', 'Today': 'today'}
+    window = st.radio("Time window:", list(windows), horizontal=True)
+
     st.write("Select the metric you want to see the leaderboard based on:")
 
-    leaderboard_data = get_leaderboard_data(user_id)
+    leaderboard_data = ctx.fetch(get_windowed_leaderboard, user_id, windows[window])
 
     if not leaderboard_data:
         st.warning("No workout data found for you or your friends.")
@@ -455,9 +549,11 @@ def create_leaderboard_ui(user_id):
     df_leaderboard.index.name = 'UserId'
     df_leaderboard = df_leaderboard.reset_index()
 
+    # Resolve every name on the board with one query
+    profiles = ctx.fetch(get_user_profiles, df_leaderboard['UserId'].tolist())
+
     def get_full_name(uid):
-        profile = get_user_profile(uid)
-        return profile.get('full_name', 'Unknown')
+        return profiles.get(uid, {}).get('full_name', 'Unknown')
 
     df_leaderboard['Name'] = df_leaderboard['UserId'].apply(get_full_name)
 
@@ -481,8 +577,9 @@ def create_leaderboard_ui(user_id):
     else:
         return
 
-    sorted_leaderboard = df_leaderboard.sort_values(by=sort_by, ascending=False).reset_index(drop=True)
-    sorted_leaderboard.index = sorted_leaderboard.index + 1
+    # Ranks come precomputed from the query, so ordering is a lookup, not a sort
+    sorted_leaderboard = df_leaderboard.set_index(f'{sort_by}_rank').loc[range(1, len(df_leaderboard) + 1)]
+    sorted_leaderboard.index.name = None
 
     st.subheader(f"Leaderboard by {display_name}")
     st.table(sorted_leaderboard[columns_to_display].rename(columns=column_renaming))
@@ -502,7 +599,7 @@ def create_leaderboard_ui(user_id):
     #Only display the profile if the user has explicitly clicked the button
     if 'selected_profile_to_display' in st.session_state:
         st.markdown("---")
-        display_user_profile(st.session_state['selected_profile_to_display'])
+        display_user_profile(st.session_state['selected_profile_to_display'], ctx=ctx)
 
 def goal_creation_ui(user_id):
     # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Goal Creation Interface (Darianne) ===
@@ -515,6 +612,48 @@ def goal_creation_ui(user_id):
     """
     pass
 
+def _plan_table_rows(plan):
+    """Turns a plan into the Day/Tasks rows of the plan table, as HTML."""
+    # Google colors
+    google_blue = "#4285F4"
+    google_red = "#DB4437"
+    google_yellow = "#F4B400"
+    google_green = "#0F9D58"
+    colors = [google_blue, google_red, google_yellow, google_green]
+    color_index = 0
+
+    table_data = []
+
+    for day, activities in plan.items():
+        tasks_html_list = []
+
+        # Normalize to list
+        if not isinstance(activities, list):
+            activities = [activities]
+
+        for i, activity in enumerate(activities):
+            if isinstance(activity, dict):
+                activity_text = (
+                    f"{activity.get('activity', 'No activity')}<br>"
+                    f"{activity.get('duration', 'No duration')}<br>"
+                    f"Goal: {activity.get('calories_goal', 'N/A')} cal"
+                )
+            else:
+                activity_text = str(activity)
+
+            # Create a list item instead of checkbox
+            task_html = f"<li style='margin-bottom: 0.5em;'>{activity_text}</li>"
+            tasks_html_list.append(task_html)
+
+        table_data.append({
+            'Day': f"<span style='color: {colors[color_index % len(colors)]}; font-weight: bold;'>{day}</span>",
+            'Tasks': f"<ul>{''.join(tasks_html_list)}</ul>"
+        })
+
+        color_index += 1
+
+    return table_data
+
 # Partially created by ChatGPT and Claude to "make a table showing the tasks obtained from ai_call_for_planner"
 def goal_plan_display_ui(user_id):
     # === PLACEHOLDER FOR ISSUE: Design, Implement and Test Goal Plan Display UI (Kei) ===
@@ -532,51 +671,38 @@ def goal_plan_display_ui(user_id):
         goal_progress_tracking_ui(user_id, task_id, start, end)
         return  # Don't continue with the planning UI
 
-    ai_response = ai_call_for_planner(user_id)
+    goal = save_goal(user_id)
 
-    if 'content' in ai_response and isinstance(ai_response['content'], dict):
-        plan = ai_response['content']
-        task_id = ai_response['task_id']
-        st.markdown(f"<h2 style='font-size: 1.5em;'>Plan to {save_goal(user_id).lower()}</h2>", unsafe_allow_html=True)
+    # The draft for this goal is kept for the session (and in the draft store,
+    # see get_plan_draft), so reruns don't call the model again; only
+    # Regenerate does
+    drafts = st.session_state.setdefault("plan_drafts", {})
+    regenerate = st.button("Regenerate", key="regenerate_plan")
+    ai_response = None if regenerate else drafts.get((user_id, goal))
 
-        # Google colors
-        google_blue = "#4285F4"
-        google_red = "#DB4437"
-        google_yellow = "#F4B400"
-        google_green = "#0F9D58"
-        colors = [google_blue, google_red, google_yellow, google_green]
-        color_index = 0
+    if ai_response is None:
+        # Days are drawn as the model streams them; the full table replaces them once the plan is complete
+        streamed_days = st.empty()
+        streamed_days.info("Generating your plan...")
+        streamed_plan = {}
 
-        completed_tasks = st.session_state.get(f"completed_tasks_{task_id}", {})
-        table_data = []
-
-        for day, activities in plan.items():
-            tasks_html_list = []
-
-            # Normalize to list
-            if not isinstance(activities, list):
-                activities = [activities]
-
-            for i, activity in enumerate(activities):
-                if isinstance(activity, dict):
-                    activity_text = (
-                        f"{activity.get('activity', 'No activity')}<br>"
-                        f"{activity.get('duration', 'No duration')}<br>"
-                        f"Goal: {activity.get('calories_goal', 'N/A')} cal"
-                    )
-                else:
-                    activity_text = str(activity)
+        def show_day(day, activities):
+            streamed_plan[day] = activities
+            df = pd.DataFrame(_plan_table_rows(streamed_plan))
+            streamed_days.markdown(df.to_html(index=False, escape=False), unsafe_allow_html=True)
 
-                # Create a list item instead of checkbox
-                task_html = f"<li style='margin-bottom: 0.5em;'>{activity_text}</li>"
-                tasks_html_list.append(task_html)
+        ai_response = get_plan_draft(user_id, goal, regenerate=regenerate, on_day=show_day)
+        streamed_days.empty()
+        if isinstance(ai_response.get('content'), dict):
+            drafts[(user_id, goal)] = ai_response
 
-            table_data.append({
-                'Day': f"<span style='color: {colors[color_index % len(colors)]}; font-weight: bold;'>{day}</span>",
-                'Tasks': f"<ul>{''.join(tasks_html_list)}</ul>"
-            })
+    if 'content' in ai_response and isinstance(ai_response['content'], dict):
+        plan = ai_response['content']
+        task_id = ai_response['task_id']
+        st.markdown(f"<h2 style='font-size: 1.5em;'>Plan to {goal.lower()}</h2>", unsafe_allow_html=True)
 
-            color_index += 1
+        completed_tasks = st.session_state.get(f"completed_tasks_{task_id}", {})
+        table_data = _plan_table_rows(plan)
 
         if table_data:
             # Create columns for table and buttons
@@ -0,0 +1,199 @@
+#############################################################################
+# plan_stream.py
+#
+# This file contains the incremental parser for streamed planner answers.
+# The planner asks the model for one JSON object:
+#
+#   {"plan": {"Day 1": [...], "Day 2": [...], ...}, "general_tip": "..."}
+#
+# Instead of waiting for the whole answer and json.loads-ing it, the parser
+# is fed the text chunks as the model streams them and reports every
+# "Day N" entry of "plan" the moment its closing bracket arrives, so the
+# Planner tab can draw day 1 while the model is still writing day 7. It
+# scans each character once and only json.loads the text of finished
+# values. Anything before the first "{" (e.g. a ```json fence) is skipped.
+#############################################################################
+
+import json
+import threading
+import time
+from collections import deque
+
+# Plans kept for the time-to-first-day percentiles
+HISTORY = 256
+
+
+class _Frame:
+    """An object or array the scanner is inside of."""
+
+    __slots__ = ("kind", "key", "expect_key", "value_start")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.key = None
+        # Inside an object, the next string is a key rather than a value
+        self.expect_key = kind == "{"
+        self.value_start = None
+
+
+class PlanStreamParser:
+    """Parses a planner answer chunk by chunk.
+
+    Args:
+        on_day (callable, optional): Called with (day, activities) as each
+            entry of "plan" completes.
+        on_tip (callable, optional): Called with the general tip once it completes.
+    """
+
+    def __init__(self, on_day=None, on_tip=None):
+        self.on_day = on_day
+        self.on_tip = on_tip
+        self.plan = {}
+        self.general_tip = ""
+        self.started = time.perf_counter()
+        self.first_day_ms = None
+        self._text = []
+        self._buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._scalar_start = None
+        self._done = False
+
+    @property
+    def text(self):
+        """Everything fed so far."""
+        return "".join(self._text)
+
+    def feed(self, chunk):
+        """Scans the next chunk of the answer, reporting the values it completes."""
+        self._text.append(chunk)
+        self._buffer += chunk
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer) and not self._done:
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(self._string_start, i + 1)
+            elif self._scalar_start is not None and (char in ",}]" or char.isspace()):
+                self._end_value(self._scalar_start, i)
+                self._scalar_start = None
+                continue  # the delimiter itself still needs scanning
+            elif self._scalar_start is not None:
+                pass
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+                self._start_value(i)
+            elif char in "{[":
+                if self._stack:
+                    self._start_value(i)
+                self._stack.append(_Frame(char))
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                    if not self._stack:
+                        self._done = True
+                    else:
+                        self._end_value(self._stack[-1].value_start, i + 1)
+            elif char == ",":
+                if self._stack and self._stack[-1].kind == "{":
+                    self._stack[-1].expect_key = True
+            elif char == ":" or char.isspace():
+                pass
+            elif self._stack:
+                # Start of a number, true, false or null
+                self._start_value(i)
+                self._scalar_start = i
+            i += 1
+        self._pos = i
+
+    def _start_value(self, i):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and not (frame.kind == "{" and frame.expect_key):
+            frame.value_start = i
+
+    def _end_string(self, start, end):
+        frame = self._stack[-1] if self._stack else None
+        if frame is not None and frame.kind == "{" and frame.expect_key:
+            frame.key = json.loads(self._buffer[start:end])
+            frame.expect_key = False
+        else:
+            self._end_value(start, end)
+
+    def _end_value(self, start, end):
+        """Reports a finished value if it is a day of the plan or the general tip."""
+        path = [frame.key for frame in self._stack]
+        if path[:1] == ["plan"] and len(path) == 2 and self._stack[1].kind == "{":
+            self._finish_day(self._stack[1].key, json.loads(self._buffer[start:end]))
+        elif path == ["general_tip"]:
+            self.general_tip = json.loads(self._buffer[start:end])
+            if self.on_tip is not None:
+                self.on_tip(self.general_tip)
+
+    def _finish_day(self, day, activities):
+        if self.first_day_ms is None:
+            self.first_day_ms = (time.perf_counter() - self.started) * 1000
+        self.plan[day] = activities
+        if self.on_day is not None:
+            self.on_day(day, activities)
+
+    def close(self):
+        """Checks the whole answer once the stream has ended.
+
+        Returns:
+            dict: The parsed answer.
+
+        Raises:
+            json.JSONDecodeError: If the answer was not one complete JSON object.
+        """
+        text = self.text
+        start = text.find("{")
+        answer, _ = json.JSONDecoder().raw_decode(text, start if start >= 0 else 0)
+        if not isinstance(answer, dict):
+            raise json.JSONDecodeError("Expected a JSON object", text, 0)
+        return answer
+
+
+class StreamMetrics:
+    """Time to the first day and to the whole plan of recent streamed plans."""
+
+    def __init__(self, history=HISTORY):
+        self.plans = 0
+        self._first_day = deque(maxlen=history)
+        self._total = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def record(self, first_day_ms, total_ms):
+        with self._lock:
+            self.plans += 1
+            if first_day_ms is not None:
+                self._first_day.append(first_day_ms)
+            self._total.append(total_ms)
+
+    def metrics(self):
+        """Returns p50/p95 time to first day and to the complete plan, in milliseconds."""
+        def percentile(values, p):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+        with self._lock:
+            return {
+                'plans': self.plans,
+                'first_day_p50_ms': percentile(self._first_day, 0.5),
+                'first_day_p95_ms': percentile(self._first_day, 0.95),
+                'total_p50_ms': percentile(self._total, 0.5),
+                'total_p95_ms': percentile(self._total, 0.95),
+            }
+
+
+# Shared by every session in this process
+plan_stream_metrics = StreamMetrics()
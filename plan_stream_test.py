@@ -0,0 +1,98 @@
+#############################################################################
+# plan_stream_test.py
+#
+# This file contains tests for plan_stream.py.
+#############################################################################
+import json
+import time
+import unittest
+
+from llm_gateway import LLMGateway
+from plan_stream import PlanStreamParser, StreamMetrics
+
+ANSWER = {
+    "plan": {
+        "Day 1": [{"activity": "Running", "duration": "30 minutes", "calories_goal": 200}],
+        "Day 2": [{"activity": "Yoga \"flow\" [easy]", "duration": "20 minutes", "calories_goal": 80},
+                  {"activity": "Walking", "duration": "15 minutes", "calories_goal": 60.5}],
+        "Day 3": [],
+    },
+    "general_tip": "Stretch {before} and after.",
+}
+
+
+def feed_in_chunks(parser, text, size):
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+
+
+class TestPlanStreamParser(unittest.TestCase):
+
+    def test_days_are_reported_in_order_for_any_chunking(self):
+        text = json.dumps(ANSWER)
+        for size in (1, 7, len(text)):
+            days = []
+            parser = PlanStreamParser(on_day=lambda day, activities: days.append((day, activities)))
+
+            feed_in_chunks(parser, text, size)
+
+            self.assertEqual(days, list(ANSWER['plan'].items()))
+            self.assertEqual(parser.general_tip, ANSWER['general_tip'])
+            self.assertEqual(parser.close(), ANSWER)
+
+    def test_day_is_reported_as_soon_as_it_closes(self):
+        days = []
+        parser = PlanStreamParser(on_day=lambda day, activities: days.append(day))
+
+        parser.feed('{"plan": {"Day 1": [{"activity": "Running"}], "Day 2": [{"activ')
+
+        self.assertEqual(days, ["Day 1"])
+        self.assertIsNotNone(parser.first_day_ms)
+
+    def test_text_around_the_object_is_skipped(self):
+        parser = PlanStreamParser()
+
+        feed_in_chunks(parser, "```json\n" + json.dumps(ANSWER, indent=2) + "\n```", 5)
+
+        self.assertEqual(parser.plan, ANSWER['plan'])
+        self.assertEqual(parser.close(), ANSWER)
+
+    def test_incomplete_answer_fails_on_close(self):
+        parser = PlanStreamParser()
+        parser.feed('{"plan": {"Day 1": [{"activity": "Running"}]')
+
+        self.assertEqual(list(parser.plan), ["Day 1"])
+        with self.assertRaises(json.JSONDecodeError):
+            parser.close()
+
+    def test_first_day_arrives_before_the_whole_plan_from_a_streaming_model(self):
+        gateway = LLMGateway(backend="fake")
+        gateway.model().latency = 0.5
+        arrivals = []
+        parser = PlanStreamParser(on_day=lambda day, activities: arrivals.append(time.perf_counter()))
+
+        for chunk in gateway.stream('Return JSON with "plan" and "general_tip"', label="planner"):
+            parser.feed(chunk)
+        total_ms = (time.perf_counter() - parser.started) * 1000
+
+        self.assertEqual(len(arrivals), 7)
+        self.assertLess(parser.first_day_ms, total_ms / 2)
+        self.assertIsNotNone(gateway.recent_calls("planner")[0]['first_chunk_ms'])
+
+
+class TestStreamMetrics(unittest.TestCase):
+
+    def test_percentiles(self):
+        metrics = StreamMetrics()
+        for ms in range(1, 101):
+            metrics.record(ms, ms * 10)
+
+        result = metrics.metrics()
+        self.assertEqual(result['plans'], 100)
+        self.assertEqual(result['first_day_p50_ms'], 51)
+        self.assertEqual(result['first_day_p95_ms'], 96)
+        self.assertEqual(result['total_p95_ms'], 960)
+
+
+if __name__ == "__main__":
+    unittest.main()
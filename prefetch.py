@@ -0,0 +1,63 @@
+#############################################################################
+# prefetch.py
+#
+# This file contains the prefetch stage used at the top of display_app_page.
+# The page's independent reads are started together on a bounded thread pool
+# so that page latency is the slowest fetch instead of the sum of all of them.
+#############################################################################
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Shared by every session in the process so reruns don't spawn new threads
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("PREFETCH_WORKERS", "8")),
+                               thread_name_prefix="prefetch")
+
+# Seconds a tab waits for its data before rendering without it
+DEFAULT_TIMEOUT = 10
+
+
+class PageData:
+    """The results of one prefetch, handed to the tabs of a single page run."""
+
+    def __init__(self, futures, deadlines):
+        self._futures = futures
+        self._deadlines = deadlines
+        self.errors = {}
+
+    def get(self, name, default=None):
+        """Returns the result of the fetch called name.
+
+        Waits at most until that fetch's own deadline. If it times out or
+        fails, the error is recorded in self.errors and default is returned,
+        so only the tab that needed it is degraded.
+        """
+        future = self._futures[name]
+        try:
+            return future.result(timeout=max(0, self._deadlines[name] - time.monotonic()))
+        except TimeoutError:
+            self.errors[name] = TimeoutError(f"{name} did not finish in time")
+        except Exception as e:
+            self.errors[name] = e
+        return default
+
+
+def prefetch(fetches, timeout=DEFAULT_TIMEOUT):
+    """Starts every fetch at once and returns a PageData to read them from.
+
+    Args:
+        fetches (dict): Maps a name to (function, args) or (function, args, timeout).
+        timeout (float): Seconds to wait for fetches that don't set their own timeout.
+
+    Returns:
+        PageData: The pending results, keyed by the same names.
+    """
+    started = time.monotonic()
+    futures = {}
+    deadlines = {}
+    for name, spec in fetches.items():
+        func, args = spec[0], spec[1]
+        futures[name] = _executor.submit(func, *args)
+        deadlines[name] = started + (spec[2] if len(spec) > 2 else timeout)
+    return PageData(futures, deadlines)
@@ -0,0 +1,50 @@
+#############################################################################
+# prefetch_test.py
+#
+# This file contains tests for prefetch.py.
+#############################################################################
+import time
+import unittest
+
+from prefetch import prefetch
+
+
+def slow(value, seconds):
+    time.sleep(seconds)
+    return value
+
+
+def broken():
+    raise RuntimeError("query failed")
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def test_fetches_run_concurrently(self):
+        start = time.monotonic()
+        data = prefetch({name: (slow, (name, 0.2)) for name in ('posts', 'workouts', 'profile')})
+
+        self.assertEqual([data.get(name) for name in ('posts', 'workouts', 'profile')],
+                         ['posts', 'workouts', 'profile'])
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_slow_fetch_only_degrades_itself(self):
+        data = prefetch({
+            'advice': (slow, ('advice', 1), 0.1),
+            'workouts': (slow, ([{'WorkoutId': 'workout1'}], 0)),
+        })
+
+        self.assertIsNone(data.get('advice'))
+        self.assertIn('advice', data.errors)
+        self.assertEqual(data.get('workouts'), [{'WorkoutId': 'workout1'}])
+        self.assertNotIn('workouts', data.errors)
+
+    def test_failed_fetch_returns_default(self):
+        data = prefetch({'posts': (broken, ())})
+
+        self.assertEqual(data.get('posts', []), [])
+        self.assertIsInstance(data.errors['posts'], RuntimeError)
+
+
+if __name__ == "__main__":
+    unittest.main()
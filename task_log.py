@@ -0,0 +1,169 @@
+#############################################################################
+# task_log.py
+#
+# This file contains the append-only log of plan task completions. Ticking
+# a task used to download the whole plan blob, flip one flag and upload it
+# again: two full round trips per click, and when two tabs did it at once
+# the later upload silently dropped the earlier change. Instead:
+#
+#   record_completion   - writes one small, create-only event blob per click
+#   read_completion_state - the snapshot blob with the newer events applied
+#   compact_completions - folds the events into the snapshot and deletes them
+#
+# Events live under task_completion/events/<user>_<task>/ and their names
+# carry the whole event (time, task index, state, day), so one listing
+# returns every pending change without downloading each one. The snapshot
+# is the plan blob ai_call_for_planner creates once per plan (create-only, so
+# it never replaces a snapshot compaction wrote); compaction rewrites it only
+# if its generation hasn't changed since it was read, so two compactions
+# never overwrite each other. Events are deleted oldest first, so any left
+# behind by a failed delete are the newest ones and replaying them on top
+# of the snapshot gives the same state.
+#############################################################################
+
+import datetime
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+from google.api_core.exceptions import PreconditionFailed
+
+from blob_store import get_blob_store
+
+# Pending events that make a read compact the log in the background
+COMPACT_AFTER = int(os.environ.get("TASK_LOG_COMPACT_AFTER", "20"))
+
+# Runs background compactions one at a time
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-log-compact")
+
+
+def snapshot_name(user_id, task_id):
+    return f'task_completion/completed_{user_id}_{task_id}.json'
+
+
+def _events_prefix(user_id, task_id):
+    return f'task_completion/events/{user_id}_{task_id}/'
+
+
+def _event_name(user_id, task_id, day_label, task_index, completed):
+    # Zero-padded nanoseconds first, so names sort in the order events happened
+    return (f"{_events_prefix(user_id, task_id)}{time.time_ns():020d}_{int(task_index)}_{int(bool(completed))}_"
+            f"{uuid.uuid4().hex[:8]}_{quote(day_label, safe='')}")
+
+
+def _parse_event_name(name):
+    """Returns (day_label, task_index, completed) from an event blob name."""
+    _, task_index, completed, _, day_label = name.rsplit('/', 1)[1].split('_', 4)
+    return unquote(day_label), int(task_index), completed == '1'
+
+
+def _apply(plan, day_label, task_index, completed):
+    tasks = plan.get(day_label)
+    if not isinstance(tasks, list) or not 0 <= task_index < len(tasks):
+        return
+    if isinstance(tasks[task_index], dict):
+        tasks[task_index]['completed'] = completed
+    else:
+        # Older snapshots store a bare flag per task
+        tasks[task_index] = completed
+
+
+def _read_snapshot(store, user_id, task_id):
+    """Returns (plan, generation) of the snapshot, or (None, None)."""
+    return store.read_json(snapshot_name(user_id, task_id))
+
+
+def _pending_events(store, user_id, task_id):
+    """Returns the names of the events not yet compacted, oldest first."""
+    return store.list(_events_prefix(user_id, task_id))
+
+
+def record_completion(user_id, task_id, day_label, task_index, completed, store=None):
+    """Records that a task was ticked or unticked, with one small write.
+
+    Args:
+        user_id (str): Owner of the plan.
+        task_id: The plan.
+        day_label (str): The plan day, e.g. "Day 1".
+        task_index (int): Position of the task within the day.
+        completed (bool): The task's new state.
+        store (BlobStore, optional): Store to write to. None uses the configured one.
+
+    Returns:
+        str: Name of the event blob.
+    """
+    if store is None:
+        store = get_blob_store()
+    name = _event_name(user_id, task_id, day_label, task_index, completed)
+    event = {
+        'user_id': user_id,
+        'task_id': str(task_id),
+        'day': day_label,
+        'index': int(task_index),
+        'state': bool(completed),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    # Create-only: an event is never overwritten
+    store.write_json(name, event, if_generation_match=0)
+    return name
+
+
+def read_completion_state(user_id, task_id, store=None):
+    """Returns the plan with every recorded completion applied, or None if there is no plan.
+
+    Costs one download and one listing. Once COMPACT_AFTER events are
+    pending, they are compacted in the background.
+    """
+    if store is None:
+        store = get_blob_store()
+    plan, _ = _read_snapshot(store, user_id, task_id)
+    if plan is None:
+        return None
+    events = _pending_events(store, user_id, task_id)
+    for name in events:
+        _apply(plan, *_parse_event_name(name))
+    if len(events) >= COMPACT_AFTER:
+        future = _compactor.submit(compact_completions, user_id, task_id, store)
+        future.add_done_callback(lambda done: _log_compaction_failure(done, user_id, task_id))
+    return plan
+
+
+def _log_compaction_failure(future, user_id, task_id):
+    # The events stay pending, so the next read that finds enough of them tries again
+    error = future.exception()
+    if error is not None:
+        print(f"Error compacting task events of {user_id}_{task_id}: {error}")
+
+
+def compact_completions(user_id, task_id, store=None):
+    """Folds the pending events into the snapshot and deletes them.
+
+    Returns:
+        int: Number of events compacted; 0 if there were none or another
+        writer changed the snapshot first.
+    """
+    if store is None:
+        store = get_blob_store()
+    plan, generation = _read_snapshot(store, user_id, task_id)
+    events = _pending_events(store, user_id, task_id)
+    if plan is None or not events:
+        return 0
+    for name in events:
+        _apply(plan, *_parse_event_name(name))
+
+    try:
+        store.write_json(snapshot_name(user_id, task_id), plan, if_generation_match=generation)
+    except PreconditionFailed:
+        # Someone else compacted (or replaced the plan) first; their snapshot stands
+        return 0
+
+    for name in events:
+        try:
+            store.delete(name)
+        except Exception as e:
+            # The rest stay pending and are replayed on top of the new snapshot
+            print(f"Error deleting compacted task event {name}: {e}")
+            break
+    return len(events)
@@ -0,0 +1,152 @@
+#############################################################################
+# task_log_test.py
+#
+# This file contains tests for task_log.py. They run against a
+# LocalBlobStore in a temporary directory.
+#############################################################################
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import task_log
+from blob_store import LocalBlobStore
+from task_log import compact_completions, read_completion_state, record_completion, snapshot_name
+
+PLAN = {
+    "Day 1": [{"activity": "Running", "completed": False}, {"activity": "Yoga", "completed": False}],
+    "Day 2": [{"activity": "Cycling", "completed": False}],
+}
+
+
+class TestTaskLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = LocalBlobStore(self.directory)
+        self.store.write_json(snapshot_name('user1', 42), PLAN)
+        self.store.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def blobs(self):
+        return self.store.list('task_completion/')
+
+    def completed(self, state):
+        return {day: [task['completed'] for task in tasks] for day, tasks in state.items()}
+
+    def test_click_is_one_small_write(self):
+        name = record_completion('user1', 42, "Day 1", 1, True, store=self.store)
+
+        metrics = self.store.metrics()
+        self.assertEqual((metrics['reads'], metrics['writes']), (0, 1))
+        event, _ = self.store.read_json(name)
+        self.assertEqual((event['day'], event['index'], event['state']), ("Day 1", 1, True))
+
+    def test_state_applies_events_in_order(self):
+        record_completion('user1', 42, "Day 1", 0, True, store=self.store)
+        record_completion('user1', 42, "Day 2", 0, True, store=self.store)
+        record_completion('user1', 42, "Day 1", 0, False, store=self.store)
+
+        state = read_completion_state('user1', 42, store=self.store)
+
+        self.assertEqual(self.completed(state), {"Day 1": [False, False], "Day 2": [True]})
+
+    def test_concurrent_clicks_are_all_kept(self):
+        threads = [threading.Thread(target=record_completion, args=('user1', 42, day, index, True),
+                                    kwargs={'store': self.store})
+                   for day, index in [("Day 1", 0), ("Day 1", 1), ("Day 2", 0)] * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        state = read_completion_state('user1', 42, store=self.store)
+        self.assertEqual(self.completed(state), {"Day 1": [True, True], "Day 2": [True]})
+
+    def test_compaction_folds_events_into_the_snapshot(self):
+        record_completion('user1', 42, "Day 1", 0, True, store=self.store)
+        record_completion('user1', 42, "Day 2", 0, True, store=self.store)
+
+        self.assertEqual(compact_completions('user1', 42, store=self.store), 2)
+
+        self.assertEqual(self.blobs(), [snapshot_name('user1', 42)])
+        snapshot, _ = LocalBlobStore(self.directory).read_json(snapshot_name('user1', 42))
+        self.assertEqual(self.completed(snapshot), {"Day 1": [True, False], "Day 2": [True]})
+        self.assertEqual(compact_completions('user1', 42, store=self.store), 0)
+
+    def test_compaction_does_not_overwrite_a_newer_snapshot(self):
+        record_completion('user1', 42, "Day 1", 0, True, store=self.store)
+        original = task_log._read_snapshot
+
+        def replaced_meanwhile(store, user_id, task_id):
+            result = original(store, user_id, task_id)
+            LocalBlobStore(self.directory).write_json(snapshot_name(user_id, task_id), {"Day 1": []})
+            return result
+
+        with patch.object(task_log, '_read_snapshot', replaced_meanwhile):
+            self.assertEqual(compact_completions('user1', 42, store=self.store), 0)
+
+        self.assertEqual(self.store.read_json(snapshot_name('user1', 42))[0], {"Day 1": []})
+        self.assertEqual(len(self.blobs()), 2)  # the event is still pending
+
+    def test_events_left_by_a_failed_delete_replay_to_the_same_state(self):
+        record_completion('user1', 42, "Day 1", 0, True, store=self.store)
+        record_completion('user1', 42, "Day 1", 0, False, store=self.store)
+        record_completion('user1', 42, "Day 1", 1, True, store=self.store)
+        before = read_completion_state('user1', 42, store=self.store)
+        delete = self.store.delete
+        deletes = []
+
+        def flaky_delete(name):
+            deletes.append(name)
+            if len(deletes) == 2:
+                raise OSError("network")
+            return delete(name)
+
+        with patch.object(self.store, 'delete', flaky_delete), patch('builtins.print'):
+            compact_completions('user1', 42, store=self.store)
+
+        self.assertEqual(len(self.blobs()), 3)  # snapshot and the two newest events
+        self.assertEqual(read_completion_state('user1', 42, store=self.store), before)
+
+    def test_reads_compact_in_the_background(self):
+        with patch.object(task_log, 'COMPACT_AFTER', 2):
+            record_completion('user1', 42, "Day 1", 0, True, store=self.store)
+            read_completion_state('user1', 42, store=self.store)
+            task_log._compactor.submit(lambda: None).result()
+            self.assertEqual(len(self.blobs()), 2)
+
+            record_completion('user1', 42, "Day 1", 1, True, store=self.store)
+            state = read_completion_state('user1', 42, store=self.store)
+            task_log._compactor.submit(lambda: None).result()
+
+        self.assertEqual(self.blobs(), [snapshot_name('user1', 42)])
+        self.assertEqual(read_completion_state('user1', 42, store=self.store), state)
+
+    def test_failed_background_compaction_is_logged(self):
+        with patch.object(task_log, 'COMPACT_AFTER', 1), \
+                patch.object(task_log, 'compact_completions', side_effect=RuntimeError("store is down")), \
+                patch('builtins.print') as mock_print:
+            record_completion('user1', 42, "Day 1", 0, True, store=self.store)
+            read_completion_state('user1', 42, store=self.store)
+            task_log._compactor.submit(lambda: None).result()
+
+        mock_print.assert_called_once_with("Error compacting task events of user1_42: store is down")
+        self.assertEqual(len(self.blobs()), 2)
+
+    def test_missing_plan(self):
+        self.assertIsNone(read_completion_state('user1', 7, store=self.store))
+
+    def test_day_labels_with_separators(self):
+        self.store.write_json(snapshot_name('user1', 42), {"Week_1 / Day 1": [False]})
+
+        record_completion('user1', 42, "Week_1 / Day 1", 0, True, store=self.store)
+
+        self.assertEqual(read_completion_state('user1', 42, store=self.store), {"Week_1 / Day 1": [True]})
+
+
+if __name__ == "__main__":
+    unittest.main()
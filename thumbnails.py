@@ -0,0 +1,324 @@
+#############################################################################
+# thumbnails.py
+#
+# This file contains the thumbnail proxy for profile and post images. The
+# pages used to hand the original image URLs to the browser, which then
+# downloaded full-size photos only to show them 50 to 200 pixels wide.
+# Instead, each source image is fetched once, resized with Pillow to every
+# width in SIZES, encoded as WebP (JPEG where Pillow lacks WebP), and kept
+# in a size-bounded on-disk LRU cache keyed by a hash of the URL. st.image
+# and the post HTML are then served those local bytes.
+#
+# When a source can't be fetched or decoded the callers fall back to the
+# original URL, so a broken thumbnail never hides an image. The page helpers
+# never wait for a thumbnail either: on a miss they show the original URL
+# while the thumbnail is built on a background pool, and later renders get it
+# from the cache.
+#############################################################################
+
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from PIL import Image, ImageOps, features
+
+from cache import TTLCache
+from image_validation import http_session
+
+# Widths in pixels the UI shows images at: post avatars, friend and community
+# profile pictures, feed images and the profile picture, full-width post images
+SIZES = (50, 100, 150, 200, 640)
+
+CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", ".image_cache")
+
+# Bytes of thumbnails kept on disk before the least recently used are evicted
+MAX_CACHE_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Source images larger than this are not thumbnailed
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+
+# Seconds a source that couldn't be fetched or decoded isn't tried again
+FAILED_TTL = 300
+
+# (connect, read) timeouts in seconds for fetching a source image
+TIMEOUT = (2, 10)
+
+# Thumbnails built in the background at once; kept apart from the prefetch
+# pool so a page full of new images doesn't hold up the page's reads
+WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", "4"))
+
+# Shared by every session in the process so reruns don't spawn new threads
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="thumbnails")
+
+if features.check("webp"):
+    FORMAT, MIME_TYPE, EXTENSION = "WEBP", "image/webp", "webp"
+else:
+    FORMAT, MIME_TYPE, EXTENSION = "JPEG", "image/jpeg", "jpg"
+
+
+def _key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def _encode(image, width):
+    """Resizes image to width (never enlarging it) and returns the encoded bytes."""
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if FORMAT == "JPEG":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(buffer, FORMAT, quality=85, optimize=True, progressive=True)
+    else:
+        image.save(buffer, FORMAT, quality=80, method=4)
+    return buffer.getvalue()
+
+
+class ThumbnailCache:
+    """Size-bounded on-disk LRU cache of thumbnails, keyed by source URL."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, sizes=SIZES, session=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sizes = tuple(sizes)
+        self.session = session or http_session
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.bytes_fetched = 0
+        self.bytes_served = 0
+        # file name -> size in bytes, least recently used first
+        self._files = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        # Coalesces concurrent misses on one URL into one fetch, and remembers failures
+        self._sources = TTLCache(maxsize=4096)
+        # URL -> future of its background generation
+        self._pending = {}
+        self._scan()
+
+    def _scan(self):
+        """Indexes the thumbnails already on disk, oldest first."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            self._files.clear()
+            self._total = 0
+            for _, name, size in sorted(entries):
+                self._files[name] = size
+                self._total += size
+
+    def _nearest_size(self, width):
+        """Returns the smallest size at least width wide, or the largest."""
+        for size in self.sizes:
+            if size >= width:
+                return size
+        return self.sizes[-1]
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _name(self, url, size):
+        return f"{_key(url)}_{size}.{EXTENSION}"
+
+    def _read(self, name):
+        """Returns the bytes of a cached thumbnail and marks it recently used, or None."""
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+            os.utime(self._path(name))
+        except OSError:
+            # Removed behind our back, e.g. by another process evicting it
+            with self._lock:
+                self._total -= self._files.pop(name, 0)
+            return None
+        return data
+
+    def _store(self, name, data):
+        """Writes one thumbnail and evicts the least recently used beyond max_bytes."""
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self._path(name + ".tmp")
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, self._path(name))
+
+        evicted = []
+        with self._lock:
+            self._total += len(data) - self._files.pop(name, 0)
+            self._files[name] = len(data)
+            while self._total > self.max_bytes and len(self._files) > 1:
+                old, old_size = self._files.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    def _fetch(self, url):
+        """Downloads a source image, or returns None if it isn't one."""
+        try:
+            with self.session.get(url, timeout=TIMEOUT, stream=True) as response:
+                if response.status_code != 200:
+                    return None
+                data = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    data.extend(chunk)
+                    if len(data) > MAX_SOURCE_BYTES:
+                        return None
+        except requests.RequestException as e:
+            print(f"Error fetching image {url}: {e}")
+            return None
+        with self._lock:
+            self.bytes_fetched += len(data)
+        return bytes(data)
+
+    def _generate(self, url):
+        """Fetches url once and stores its thumbnail at every size. Returns True on success."""
+        source = self._fetch(url)
+        if source is None:
+            return False
+        try:
+            with Image.open(io.BytesIO(source)) as image:
+                image = ImageOps.exif_transpose(image)
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+                for size in self.sizes:
+                    self._store(self._name(url, size), _encode(image, size))
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"Error creating thumbnails for {url}: {e}")
+            return False
+        return True
+
+    def _load(self, url):
+        """Generates the thumbnails of url unless another caller already is. Returns True on success."""
+        # Every session missing on url waits for one fetch; failures are kept
+        # for FAILED_TTL, successes aren't cached here because the disk is the cache
+        if self._sources.get_or_load(url, lambda: self._generate(url),
+                                     lambda ok: 0 if ok else FAILED_TTL):
+            return True
+        with self._lock:
+            self.failures += 1
+        return False
+
+    def _load_in_background(self, url):
+        """Queues the thumbnails of url to be generated, once per URL at a time."""
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending[url] = future = _executor.submit(self._load, url)
+        future.add_done_callback(lambda _: self._done(url))
+
+    def _done(self, url):
+        with self._lock:
+            self._pending.pop(url, None)
+
+    def wait(self, timeout=None):
+        """Waits for the thumbnails being generated in the background."""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures, timeout=timeout)
+
+    def get(self, url, width, block=True):
+        """Returns the thumbnail of url for an image shown width pixels wide.
+
+        Args:
+            url (str): Source image URL.
+            width (int): Display width; the nearest size in SIZES at least
+                that wide is used.
+            block (bool): On a miss, wait for the thumbnail to be generated.
+                If False, return None at once and generate it in the background.
+
+        Returns:
+            bytes: The encoded thumbnail, or None if the source couldn't be
+            used or, with block=False, isn't cached yet.
+        """
+        if not url or not url.startswith(("http://", "https://")):
+            return None
+        name = self._name(url, self._nearest_size(width))
+
+        data = self._read(name)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+                self.bytes_served += len(data)
+            return data
+
+        with self._lock:
+            self.misses += 1
+        if not block:
+            self._load_in_background(url)
+            return None
+        if not self._load(url):
+            return None
+
+        data = self._read(name)
+        if data is not None:
+            with self._lock:
+                self.bytes_served += len(data)
+        return data
+
+    def metrics(self):
+        """Returns cache hit ratio, disk usage and byte counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'pending': len(self._pending),
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'files': len(self._files),
+                'disk_bytes': self._total,
+                'bytes_fetched': self.bytes_fetched,
+                'bytes_served': self.bytes_served,
+            }
+
+    def clear(self):
+        """Deletes every cached thumbnail."""
+        with self._lock:
+            names, self._files, self._total = list(self._files), OrderedDict(), 0
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        self._sources.clear()
+
+
+# Shared by every session in this process
+thumbnail_cache = ThumbnailCache()
+
+
+def thumbnail(url, width):
+    """Returns what to pass to st.image for url shown width pixels wide.
+
+    That is the thumbnail bytes, or url itself if no thumbnail could be made
+    or it is still being generated.
+    """
+    data = thumbnail_cache.get(url, width, block=False)
+    return data if data is not None else url
+
+
+def thumbnail_src(url, width):
+    """Returns an <img> src for url shown width pixels wide: a data URI of the thumbnail, or url."""
+    data = thumbnail_cache.get(url, width, block=False)
+    if data is None:
+        return url
+    return f"data:{MIME_TYPE};base64,{base64.b64encode(data).decode('ascii')}"
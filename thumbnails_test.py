@@ -0,0 +1,195 @@
+#############################################################################
+# thumbnails_test.py
+#
+# This file contains tests for thumbnails.py. Source images are generated
+# with Pillow and served by a stub HTTP server on localhost; every test gets
+# its own cache directory.
+#############################################################################
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from PIL import Image
+
+import thumbnails
+from thumbnails import ThumbnailCache
+
+
+def make_photo(width=1200, height=800, mode="RGB"):
+    """Returns the bytes of a noisy JPEG (or PNG for other modes), which compresses like a photo."""
+    image = Image.effect_noise((width, height), 64).convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG" if mode == "RGB" else "PNG", quality=95)
+    return buffer.getvalue()
+
+
+class StubImageHost(BaseHTTPRequestHandler):
+    """Serves the images in `images` by path; GETs are counted per path."""
+
+    images = {}
+    requests = Counter()
+    delay = 0
+
+    def do_GET(self):
+        StubImageHost.requests[self.path] += 1
+        time.sleep(self.delay)
+        body = self.images.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestThumbnailCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        StubImageHost.images = {
+            '/photo.jpg': make_photo(),
+            '/other.jpg': make_photo(),
+            '/small.jpg': make_photo(40, 30),
+            '/logo.png': make_photo(300, 300, mode="RGBA"),
+            '/page.html': b'<html></html>',
+        }
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHost)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubImageHost.requests.clear()
+        StubImageHost.delay = 0
+        self.directory = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open(self, data):
+        return Image.open(io.BytesIO(data))
+
+    def test_thumbnail_has_display_width_and_keeps_aspect_ratio(self):
+        data = self.cache.get(f"{self.base}/photo.jpg", 200)
+
+        image = self.open(data)
+        self.assertEqual(image.format, thumbnails.FORMAT)
+        self.assertEqual(image.size, (200, 133))
+        self.assertLess(len(data), len(StubImageHost.images['/photo.jpg']) / 10)
+
+    def test_width_is_rounded_up_to_a_known_size(self):
+        self.assertEqual(self.open(self.cache.get(f"{self.base}/photo.jpg", 120)).width, 150)
+        self.assertEqual(self.open(self.cache.get(f"{self.base}/photo.jpg", 5000)).width, 640)
+
+    def test_small_sources_are_not_enlarged(self):
+        self.assertEqual(self.open(self.cache.get(f"{self.base}/small.jpg", 640)).size, (40, 30))
+
+    def test_transparent_sources_are_converted(self):
+        self.assertIsNotNone(self.cache.get(f"{self.base}/logo.png", 100))
+
+    def test_source_is_fetched_once_for_every_size(self):
+        for size in thumbnails.SIZES * 2:
+            self.assertIsNotNone(self.cache.get(f"{self.base}/photo.jpg", size))
+
+        self.assertEqual(StubImageHost.requests['/photo.jpg'], 1)
+        metrics = self.cache.metrics()
+        self.assertEqual(metrics['misses'], 1)
+        self.assertEqual(metrics['hits'], 2 * len(thumbnails.SIZES) - 1)
+        self.assertAlmostEqual(metrics['hit_ratio'], 0.9)
+        self.assertEqual(metrics['files'], len(thumbnails.SIZES))
+        self.assertEqual(metrics['bytes_fetched'], len(StubImageHost.images['/photo.jpg']))
+
+    def test_concurrent_misses_fetch_once(self):
+        StubImageHost.delay = 0.2
+        threads = [threading.Thread(target=self.cache.get, args=(f"{self.base}/photo.jpg", 100))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(StubImageHost.requests['/photo.jpg'], 1)
+
+    def test_thumbnails_survive_a_restart(self):
+        self.cache.get(f"{self.base}/photo.jpg", 100)
+
+        restarted = ThumbnailCache(self.directory)
+        self.assertIsNotNone(restarted.get(f"{self.base}/photo.jpg", 100))
+        self.assertEqual(StubImageHost.requests['/photo.jpg'], 1)
+        self.assertEqual(restarted.metrics()['hits'], 1)
+
+    def test_unusable_sources_return_none_and_are_not_retried(self):
+        self.assertIsNone(self.cache.get(f"{self.base}/page.html", 100))
+        self.assertIsNone(self.cache.get(f"{self.base}/missing.jpg", 100))
+        self.assertIsNone(self.cache.get(f"{self.base}/missing.jpg", 100))
+        self.assertIsNone(self.cache.get("not a url", 100))
+        self.assertIsNone(self.cache.get(None, 100))
+
+        self.assertEqual(StubImageHost.requests['/missing.jpg'], 1)
+        self.assertEqual(self.cache.metrics()['failures'], 3)
+
+    def test_least_recently_used_thumbnails_are_evicted(self):
+        self.cache.get(f"{self.base}/photo.jpg", 50)
+        one_source = self.cache.metrics()['disk_bytes']
+        self.cache.max_bytes = int(one_source * 1.5)
+
+        self.cache.get(f"{self.base}/other.jpg", 50)
+
+        metrics = self.cache.metrics()
+        self.assertLessEqual(metrics['disk_bytes'], self.cache.max_bytes)
+        self.assertEqual(len(os.listdir(self.directory)), metrics['files'])
+        files = os.listdir(self.directory)
+        # photo.jpg's unused sizes went first; the one just shown was kept
+        self.assertNotIn(self.cache._name(f"{self.base}/photo.jpg", 640), files)
+        self.assertIn(self.cache._name(f"{self.base}/photo.jpg", 50), files)
+        self.assertIn(self.cache._name(f"{self.base}/other.jpg", 640), files)
+
+    def test_non_blocking_miss_generates_in_the_background(self):
+        StubImageHost.delay = 0.2
+        url = f"{self.base}/photo.jpg"
+
+        started = time.monotonic()
+        for _ in range(3):
+            self.assertIsNone(self.cache.get(url, 100, block=False))
+        self.assertLess(time.monotonic() - started, 0.1)
+
+        self.cache.wait(timeout=5)
+        self.assertIsNotNone(self.cache.get(url, 100, block=False))
+        self.assertEqual(StubImageHost.requests['/photo.jpg'], 1)
+        self.assertEqual(self.cache.metrics()['pending'], 0)
+
+    def test_helpers_fall_back_to_the_url(self):
+        url = f"{self.base}/missing.jpg"
+        photo = f"{self.base}/photo.jpg"
+        with patch.object(thumbnails, 'thumbnail_cache', self.cache):
+            self.assertEqual(thumbnails.thumbnail(url, 100), url)
+            self.assertEqual(thumbnails.thumbnail_src(url, 100), url)
+            # Not generated yet: the page shows the original meanwhile
+            self.assertEqual(thumbnails.thumbnail(photo, 100), photo)
+            self.cache.wait(timeout=5)
+            self.assertIsInstance(thumbnails.thumbnail(photo, 100), bytes)
+            self.assertTrue(thumbnails.thumbnail_src(photo, 50)
+                            .startswith(f"data:{thumbnails.MIME_TYPE};base64,"))
+            self.assertEqual(self.cache.metrics()['failures'], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#############################################################################
+# username_index.py
+#
+# This file contains the in-process index from usernames to UserIds. The
+# friend search resolves usernames on every change of the search box, so
+# instead of scanning the Users table each time, the index loads every
+# (Username, UserId) pair once and answers from memory:
+#
+#   lookup(username) - exact match through a dict
+#   suggest(prefix)  - case-insensitive prefix match through a sorted list
+#
+# Suggestions for names that match nobody cost no queries. An explicit lookup
+# (a submitted search, sending a friend request) passes fallback=True to also
+# try a point query on a miss, so a user who signed up since the last load is
+# found right away and added to the index; a name that still matches nobody
+# isn't queried again for MISS_TTL seconds, so the reruns of one page don't
+# repeat the query. The whole index is reloaded every INDEX_TTL seconds to
+# pick up renames and deletions, since the Users table has no column to load
+# only the changes from.
+#############################################################################
+
+import bisect
+import threading
+import time
+
+from google.cloud import bigquery
+
+from backends import get_client
+
+# Seconds before the next lookup reloads the whole index
+INDEX_TTL = 600
+
+# Seconds a fallback point query that found nobody isn't repeated
+MISS_TTL = 30
+
+LOAD_QUERY = """
+    SELECT UserId, Username
+    FROM `keishlyanysanabriatechx25.bytemeproject.Users`
+    WHERE Username IS NOT NULL
+"""
+
+LOOKUP_QUERY = """
+    SELECT UserId FROM `keishlyanysanabriatechx25.bytemeproject.Users`
+    WHERE Username = @username
+    LIMIT 1
+"""
+
+
+def query_user_id(username, client):
+    """Looks up one username with a point query. Returns its UserId or None."""
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("username", "STRING", username)]
+    )
+    rows = list(client.query(LOOKUP_QUERY, job_config=job_config).result())
+    return rows[0]["UserId"] if rows else None
+
+
+class UsernameIndex:
+    """Maps usernames to UserIds and finds usernames by prefix."""
+
+    def __init__(self, ttl=INDEX_TTL, miss_ttl=MISS_TTL):
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._ids = {}
+        # username -> when a fallback query last found nobody with it
+        self._misses = {}
+        # (lowercased username, username) pairs, sorted for prefix search
+        self._sorted = []
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def load(self, client=None):
+        """Replaces the index with every username in the Users table."""
+        if client is None:
+            client = get_client()
+        rows = client.query(LOAD_QUERY).result()
+        ids = {row["Username"]: row["UserId"] for row in rows}
+        entries = sorted((username.lower(), username) for username in ids)
+        with self._lock:
+            self._ids = ids
+            self._sorted = entries
+            self._misses = {}
+            self._loaded_at = time.monotonic()
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        if self._stale():
+            # Only one thread reloads; the others wait for it instead of querying too
+            with self._load_lock:
+                if self._stale():
+                    self.load()
+
+    def lookup(self, username, client=None, fallback=False):
+        """Returns the UserId of username, or None if no user has it.
+
+        Args:
+            username (str): The exact username.
+            client (optional): Query this client directly instead of using the
+                index, like the fetchers' client parameter.
+            fallback (bool): On a miss, also try a point query and add the
+                user if found. For explicit searches and actions, not for
+                suggestions.
+        """
+        if client is not None:
+            return query_user_id(username, client)
+
+        self._ensure_loaded()
+        user_id = self._ids.get(username)
+        if user_id is not None or not fallback:
+            return user_id
+
+        with self._lock:
+            missed_at = self._misses.get(username)
+        if missed_at is not None and time.monotonic() - missed_at < self.miss_ttl:
+            return None
+
+        user_id = query_user_id(username, get_client())
+        if user_id is not None:
+            self.add(user_id, username)
+        else:
+            with self._lock:
+                self._misses[username] = time.monotonic()
+        return user_id
+
+    def suggest(self, prefix, limit=5):
+        """Returns up to limit usernames starting with prefix, ignoring case, in sorted order."""
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        prefix = prefix.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted, (prefix,))
+            matches = []
+            for key, username in self._sorted[start:start + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append(username)
+        return matches
+
+    def add(self, user_id, username):
+        """Adds or updates one user without reloading the index."""
+        with self._lock:
+            if username not in self._ids:
+                bisect.insort(self._sorted, (username.lower(), username))
+            self._ids[username] = user_id
+            self._misses.pop(username, None)
+
+
+# Shared by every session in this process
+username_index = UsernameIndex()
@@ -0,0 +1,91 @@
+#############################################################################
+# username_index_test.py
+#
+# This file contains tests for username_index.py.
+#############################################################################
+import unittest
+from unittest.mock import patch
+
+from backends import LocalClient
+from username_index import UsernameIndex
+
+
+class TestUsernameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.client = LocalClient(":memory:")
+        self.client.insert_rows_json("Users", [
+            {'UserId': 'user1', 'Username': 'remi_the_rems'},
+            {'UserId': 'user2', 'Username': 'blake'},
+            {'UserId': 'user3', 'Username': 'Blakely'},
+            {'UserId': 'user4', 'Username': 'jordan'},
+        ])
+        patcher = patch('username_index.get_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = UsernameIndex()
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup('blake'), 'user2')
+        self.assertEqual(self.index.lookup('Blakely'), 'user3')
+        self.assertIsNone(self.index.lookup('nobody'))
+
+    def test_lookups_are_answered_from_memory(self):
+        self.index.lookup('blake')
+        with patch.object(self.client, 'query', side_effect=AssertionError("queried")):
+            self.assertEqual(self.index.lookup('jordan'), 'user4')
+            self.assertEqual(self.index.suggest('j'), ['jordan'])
+
+    def test_suggest_by_prefix_ignoring_case(self):
+        self.assertEqual(self.index.suggest('bla'), ['blake', 'Blakely'])
+        self.assertEqual(self.index.suggest('BLAKEL'), ['Blakely'])
+        self.assertEqual(self.index.suggest('bla', limit=1), ['blake'])
+        self.assertEqual(self.index.suggest('x'), [])
+        self.assertEqual(self.index.suggest(''), [])
+
+    def test_new_user_is_found_with_fallback_and_added(self):
+        self.index.lookup('blake')
+        self.client.insert_rows_json("Users", [{'UserId': 'user5', 'Username': 'gems'}])
+
+        self.assertIsNone(self.index.lookup('gems'))
+        self.assertEqual(self.index.lookup('gems', fallback=True), 'user5')
+        self.assertEqual(self.index.lookup('gems'), 'user5')
+        self.assertEqual(self.index.suggest('ge'), ['gems'])
+
+    def test_misses_are_answered_from_memory(self):
+        self.index.load()
+        with patch.object(self.client, 'query', side_effect=AssertionError("queried")):
+            for typed in ['n', 'no', 'nob', 'nobo', 'nobod', 'nobody']:
+                self.assertIsNone(self.index.lookup(typed))
+
+    def test_fallback_misses_are_not_queried_again_within_miss_ttl(self):
+        self.index.load()
+        with patch('username_index.query_user_id', return_value=None) as mock_query:
+            for _ in range(3):
+                self.assertIsNone(self.index.lookup('gems', fallback=True))
+        self.assertEqual(mock_query.call_count, 1)
+
+        self.index.miss_ttl = 0
+        self.client.insert_rows_json("Users", [{'UserId': 'user5', 'Username': 'gems'}])
+        self.assertEqual(self.index.lookup('gems', fallback=True), 'user5')
+
+    def test_add(self):
+        self.index.load()
+        self.index.add('user6', 'blade')
+        self.assertEqual(self.index.suggest('bla'), ['blade', 'blake', 'Blakely'])
+        self.assertEqual(self.index.lookup('blade'), 'user6')
+
+    def test_injected_client_bypasses_index(self):
+        other = LocalClient(":memory:")
+        other.insert_rows_json("Users", [{'UserId': 'other1', 'Username': 'blake'}])
+
+        self.assertEqual(self.index.lookup('blake', client=other), 'other1')
+        self.assertEqual(self.index.lookup('blake'), 'user2')
+        other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#############################################################################
+# workout_summary.py
+#
+# This file contains the workout-history summarizer used for the model
+# prompts. The planner used to paste every workout dict (ids, timestamps,
+# coordinates) into its prompt, so prompts grew with the user's history.
+# summarize_workouts reduces any number of workouts to a fixed-size profile:
+#
+#   volume    - workouts, distance and calories per week
+#   duration  - median and 90th percentile minutes per workout
+#   distance  - 25th/50th/90th percentile distance per workout
+#   pace      - 25th/50th/75th percentile minutes per distance unit
+#   trend     - distance of the last 4 weeks against the 4 before
+#   mix       - share of walks, runs and rides
+#
+# The Workouts table has no activity type, so the mix is inferred from each
+# workout's average speed. Everything is computed with whole-column pandas
+# and NumPy operations.
+#############################################################################
+
+import numpy as np
+import pandas as pd
+
+# Average speeds (distance units per hour) separating walks, runs and rides
+RUN_SPEED = 6.0
+RIDE_SPEED = 20.0
+
+# Weeks compared by the trend
+TREND_WEEKS = 4
+
+
+def _numeric(frame, column):
+    if column not in frame:
+        return np.full(len(frame), np.nan)
+    return pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _timestamps(frame, column):
+    if column not in frame:
+        return pd.Series(pd.NaT, index=frame.index, dtype="datetime64[ns, UTC]")
+    return pd.to_datetime(frame[column].astype(object), utc=True, errors="coerce", format="mixed")
+
+
+def _percentiles(values, qs):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return None
+    return [round(float(v), 1) for v in np.percentile(values, qs)]
+
+
+def summarize_workouts(workouts, now=None):
+    """Reduces a user's workouts to a compact statistical profile.
+
+    Args:
+        workouts: What get_user_workouts_frame or get_user_workouts return.
+        now (pd.Timestamp, optional): The reference time for the weekly
+            volume, trend and recency. Defaults to the current time.
+
+    Returns:
+        dict: The profile; see the module comment. Statistics that can't be
+        computed (e.g. pace without distances) are None.
+    """
+    frame = workouts if isinstance(workouts, pd.DataFrame) else pd.DataFrame.from_records(list(workouts))
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    if now.tzinfo is None:
+        now = now.tz_localize("UTC")
+
+    summary = {'workouts': len(frame)}
+    if frame.empty:
+        return summary
+
+    start = _timestamps(frame, "StartTimestamp")
+    end = _timestamps(frame, "end_timestamp")
+    distance = _numeric(frame, "distance")
+    calories = _numeric(frame, "calories_burned")
+    minutes = ((end - start).dt.total_seconds() / 60).to_numpy(dtype=np.float64, na_value=np.nan)
+    minutes = np.where(minutes > 0, minutes, np.nan)
+
+    dated = start.notna().to_numpy()
+    if dated.any():
+        first, last = start[dated].min(), start[dated].max()
+        weeks = max(1.0, (now - first).total_seconds() / (7 * 86400))
+        summary['days_since_last'] = max(0, (now - last).days)
+        summary['per_week'] = {
+            'workouts': round(float(dated.sum()) / weeks, 1),
+            'distance': round(float(np.nansum(distance[dated])) / weeks, 1),
+            'calories': round(float(np.nansum(calories[dated])) / weeks),
+        }
+        age_weeks = ((now - start[dated]).dt.total_seconds() / (7 * 86400)).to_numpy()
+        recent = float(np.nansum(distance[dated][age_weeks < TREND_WEEKS]))
+        previous = float(np.nansum(distance[dated][(age_weeks >= TREND_WEEKS) & (age_weeks < 2 * TREND_WEEKS)]))
+        summary['trend_pct'] = int(round((recent - previous) / previous * 100)) if previous else None
+
+    summary['duration_min'] = _percentiles(minutes, [50, 90])
+    summary['distance'] = _percentiles(distance, [25, 50, 90])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pace = minutes / distance
+    pace[~np.isfinite(pace) | (distance <= 0)] = np.nan
+    summary['pace_min_per_unit'] = _percentiles(pace, [25, 50, 75])
+
+    speed = 60 / pace
+    known = np.isfinite(speed)
+    if known.any():
+        kinds = np.select([speed[known] >= RIDE_SPEED, speed[known] >= RUN_SPEED], ["rides", "runs"], "walks")
+        names, counts = np.unique(kinds, return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        summary['mix'] = {str(names[i]): int(round(counts[i] / known.sum() * 100)) for i in order}
+    else:
+        summary['mix'] = None
+    return summary
+
+
+def format_summary(summary):
+    """Renders a summary as the few lines of text the prompts include."""
+    if not summary.get('workouts'):
+        return "No workouts recorded yet."
+
+    lines = [f"{summary['workouts']} workouts"
+             + (f", last one {summary['days_since_last']} days ago" if 'days_since_last' in summary else "")]
+    per_week = summary.get('per_week')
+    if per_week:
+        lines.append(f"Per week: {per_week['workouts']} workouts, {per_week['distance']} distance, "
+                     f"{per_week['calories']} calories")
+    if summary.get('duration_min'):
+        lines.append("Duration minutes (median/p90): " + "/".join(map(str, summary['duration_min'])))
+    if summary.get('distance'):
+        lines.append("Distance (p25/median/p90): " + "/".join(map(str, summary['distance'])))
+    if summary.get('pace_min_per_unit'):
+        lines.append("Pace minutes per distance unit (p25/median/p75): "
+                     + "/".join(map(str, summary['pace_min_per_unit'])))
+    if summary.get('trend_pct') is not None:
+        lines.append(f"Distance last {TREND_WEEKS} weeks vs the {TREND_WEEKS} before: {summary['trend_pct']:+d}%")
+    if summary.get('mix'):
+        lines.append("Mix: " + ", ".join(f"{share}% {kind}" for kind, share in summary['mix'].items()))
+    return "\n".join(lines)
@@ -0,0 +1,73 @@
+#############################################################################
+# workout_summary_test.py
+#
+# This file contains tests for workout_summary.py.
+#############################################################################
+import unittest
+
+import pandas as pd
+
+from workout_summary import format_summary, summarize_workouts
+
+NOW = pd.Timestamp("2025-04-30 00:00:00", tz="UTC")
+
+
+def workout(days_ago, minutes, distance, calories=300):
+    start = NOW - pd.Timedelta(days=days_ago)
+    return {
+        'WorkoutId': f"workout{days_ago}",
+        'StartTimestamp': start.isoformat(),
+        'end_timestamp': (start + pd.Timedelta(minutes=minutes)).isoformat(),
+        'start_lat_lng': (1.0, 2.0),
+        'distance': distance,
+        'steps': 5000,
+        'calories_burned': calories,
+    }
+
+
+class TestSummarizeWorkouts(unittest.TestCase):
+
+    def test_profile_of_a_history(self):
+        # Two runs (6 min/unit), a walk (15 min/unit) and a ride (2 min/unit) in the last four
+        # weeks, and one run in the four weeks before
+        workouts = [workout(1, 30, 5), workout(8, 60, 10), workout(15, 45, 3), workout(22, 40, 20),
+                    workout(40, 30, 5)]
+
+        summary = summarize_workouts(workouts, now=NOW)
+
+        self.assertEqual(summary['workouts'], 5)
+        self.assertEqual(summary['days_since_last'], 1)
+        self.assertEqual(summary['per_week'], {'workouts': 0.9, 'distance': 7.5, 'calories': 262})
+        self.assertEqual(summary['duration_min'], [40.0, 54.0])
+        self.assertEqual(summary['distance'], [5.0, 5.0, 16.0])
+        self.assertEqual(summary['pace_min_per_unit'], [6.0, 6.0, 6.0])
+        self.assertEqual(summary['trend_pct'], 660)
+        self.assertEqual(summary['mix'], {'runs': 60, 'rides': 20, 'walks': 20})
+
+    def test_frame_and_records_give_the_same_summary(self):
+        workouts = [workout(day, 30 + day, 4 + day % 3) for day in range(0, 60, 3)]
+
+        self.assertEqual(summarize_workouts(pd.DataFrame(workouts), now=NOW), summarize_workouts(workouts, now=NOW))
+
+    def test_missing_columns_and_values(self):
+        summary = summarize_workouts([{'WorkoutId': 'workout1', 'distance': None}], now=NOW)
+
+        self.assertEqual(summary['workouts'], 1)
+        self.assertIsNone(summary['pace_min_per_unit'])
+        self.assertIsNone(summary['mix'])
+        self.assertEqual(format_summary(summary), "1 workouts")
+
+    def test_no_workouts(self):
+        self.assertEqual(summarize_workouts([], now=NOW), {'workouts': 0})
+        self.assertEqual(format_summary({'workouts': 0}), "No workouts recorded yet.")
+
+    def test_summary_size_does_not_grow_with_history(self):
+        short = format_summary(summarize_workouts([workout(day, 30, 5) for day in range(0, 60, 6)], now=NOW))
+        long = format_summary(summarize_workouts([workout(day / 10, 30, 5) for day in range(5000)], now=NOW))
+
+        self.assertLess(abs(len(long) - len(short)), 20)
+        self.assertLess(len(long), 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
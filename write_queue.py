@@ -0,0 +1,233 @@
+#############################################################################
+# write_queue.py
+#
+# This file contains the write-behind queue for the app's streaming inserts.
+# add_post_to_database and save_plan hand their row to the queue and return
+# right away; a background thread coalesces the rows of each table into one
+# insert_rows_json call once enough rows are waiting or the oldest one has
+# waited long enough, retries failed rows with backoff, and the queue is
+# flushed when the process exits.
+#############################################################################
+
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from backends import get_client
+
+# Rows of one table that trigger a flush without waiting for MAX_DELAY
+BATCH_SIZE = int(os.environ.get("WRITE_QUEUE_BATCH_SIZE", "200"))
+
+# Seconds the oldest queued row waits before its batch is flushed anyway
+MAX_DELAY = float(os.environ.get("WRITE_QUEUE_MAX_DELAY", "1.0"))
+
+# Attempts per row before it is given up on, and the first retry delay in seconds
+MAX_ATTEMPTS = 5
+BACKOFF = 0.5
+
+# Seconds an idempotency key is remembered, so a rerun that fires the same
+# handler again doesn't write a second copy of the row
+DEDUPE_WINDOW = 600
+
+
+class _PendingRow:
+    """A row waiting to be written, with what to do once it has been."""
+
+    __slots__ = ("table", "row", "row_id", "client", "on_written", "attempts", "queued_at")
+
+    def __init__(self, table, row, row_id, client, on_written):
+        self.table = table
+        self.row = row
+        self.row_id = row_id
+        self.client = client
+        self.on_written = on_written
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class WriteQueue:
+    """Buffers streaming inserts and writes them per table in batches."""
+
+    def __init__(self, batch_size=BATCH_SIZE, max_delay=MAX_DELAY, max_attempts=MAX_ATTEMPTS,
+                 backoff=BACKOFF, dedupe_window=DEDUPE_WINDOW):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.dedupe_window = dedupe_window
+
+        self._pending = []
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # Held while rows are being written, so flush() and the worker never
+        # write the same rows twice or out of order
+        self._write_lock = threading.Lock()
+        self._worker = None
+        self._in_flight = 0
+
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def submit(self, table, row, row_id, idempotency_key=None, client=None, on_written=None):
+        """Queues one row and returns immediately.
+
+        Args:
+            table (str): Fully qualified table to insert into.
+            row (dict): The row, as for insert_rows_json.
+            row_id (str): Unique id of the row. It is also sent as the
+                streaming insert id, so BigQuery drops retried duplicates.
+            idempotency_key (str, optional): Rows submitted again with the same
+                key within the dedupe window are ignored.
+            client (optional): Client to write with. None uses the configured backend.
+            on_written (callable, optional): Called with the row once it is written.
+
+        Returns:
+            str: row_id, or the row id of the row first queued under idempotency_key.
+        """
+        with self._lock:
+            if idempotency_key is not None:
+                now = time.monotonic()
+                while self._keys and next(iter(self._keys.values()))[1] < now - self.dedupe_window:
+                    self._keys.popitem(last=False)
+                if idempotency_key in self._keys:
+                    return self._keys[idempotency_key][0]
+                self._keys[idempotency_key] = (row_id, now)
+
+            self._pending.append(_PendingRow(table, row, row_id, client, on_written))
+            self._start_worker()
+            self._wakeup.notify()
+        return row_id
+
+    def flush(self):
+        """Writes every queued row now, retrying failures, and waits for it to finish."""
+        while True:
+            with self._lock:
+                if not self._pending and not self._in_flight:
+                    return
+            rows = self._take_all()
+            if rows:
+                self._write(rows)
+            else:
+                # Wait for the batch the worker is writing, which may requeue retries
+                with self._write_lock:
+                    pass
+
+    def metrics(self):
+        """Returns the queue depth and write counters."""
+        with self._lock:
+            return {
+                'depth': len(self._pending) + self._in_flight,
+                'written': self.written,
+                'failed': self.failed,
+                'retries': self.retries,
+                'batches': self.batches,
+                'last_flush_ms': self.last_flush_ms,
+                'max_flush_ms': self.max_flush_ms,
+            }
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="write-queue", daemon=True)
+            self._worker.start()
+
+    def _due(self):
+        """True when a table has a full batch or the oldest row has waited max_delay."""
+        if not self._pending:
+            return False
+        if time.monotonic() - self._pending[0].queued_at >= self.max_delay:
+            return True
+        counts = {}
+        for pending in self._pending:
+            counts[pending.table] = counts.get(pending.table, 0) + 1
+            if counts[pending.table] >= self.batch_size:
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._due():
+                    timeout = None
+                    if self._pending:
+                        timeout = max(0, self._pending[0].queued_at + self.max_delay - time.monotonic())
+                    self._wakeup.wait(timeout)
+            self._write(self._take_all())
+
+    def _take_all(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._in_flight += len(rows)
+            return rows
+
+    def _write(self, rows):
+        """Inserts rows grouped by client and table, requeueing failures with backoff."""
+        with self._write_lock:
+            started = time.perf_counter()
+            groups = OrderedDict()
+            for pending in rows:
+                groups.setdefault((id(pending.client), pending.table), []).append(pending)
+
+            retry = []
+            try:
+                for batch in groups.values():
+                    for start in range(0, len(batch), self.batch_size):
+                        retry.extend(self._insert(batch[start:start + self.batch_size]))
+            finally:
+                # Even if a batch raised, so flush() never waits on rows nobody is writing
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self._in_flight -= len(rows)
+                    self.batches += len(groups)
+                    self.last_flush_ms = elapsed_ms
+                    self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                    self._pending[:0] = retry
+
+            if retry:
+                # Back off before the next attempt, doubling per attempt
+                time.sleep(self.backoff * 2 ** (min(p.attempts for p in retry) - 1))
+
+    def _insert(self, batch):
+        """Writes one batch and returns the rows that should be tried again."""
+        for pending in batch:
+            pending.attempts += 1
+        try:
+            # Inside the try so a client that can't be created fails the batch like any write error
+            client = batch[0].client or get_client()
+            errors = client.insert_rows_json(batch[0].table, [p.row for p in batch],
+                                             row_ids=[p.row_id for p in batch])
+        except Exception as e:
+            print(f"Error writing {len(batch)} rows to {batch[0].table}: {e}")
+            errors = [{'index': index, 'errors': [{'message': str(e)}]} for index in range(len(batch))]
+
+        failed_indexes = {error['index'] for error in errors}
+        retry = []
+        for index, pending in enumerate(batch):
+            if index not in failed_indexes:
+                with self._lock:
+                    self.written += 1
+                if pending.on_written is not None:
+                    try:
+                        pending.on_written(pending.row)
+                    except Exception as e:
+                        print(f"Error in on_written callback for row {pending.row_id} of {pending.table}: {e}")
+            elif pending.attempts < self.max_attempts:
+                with self._lock:
+                    self.retries += 1
+                retry.append(pending)
+            else:
+                with self._lock:
+                    self.failed += 1
+                print(f"Giving up on row {pending.row_id} of {pending.table} after {pending.attempts} attempts: {errors}")
+        return retry
+
+
+# Shared by every session in this process
+write_queue = WriteQueue()
+atexit.register(write_queue.flush)
@@ -0,0 +1,150 @@
+#############################################################################
+# write_queue_test.py
+#
+# This file contains tests for write_queue.py.
+#############################################################################
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from write_queue import WriteQueue
+
+
+class RecordingClient:
+    """Collects insert_rows_json calls, failing the first `failures` of them."""
+
+    def __init__(self, failures=0, latency=0):
+        self.failures = failures
+        self.latency = latency
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def insert_rows_json(self, table, rows, row_ids=None):
+        time.sleep(self.latency)
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                return [{'index': i, 'errors': [{'message': 'backendError'}]} for i in range(len(rows))]
+            self.calls.append((table, list(rows), list(row_ids)))
+            return []
+
+
+class TestWriteQueue(unittest.TestCase):
+
+    def test_submit_returns_before_the_write(self):
+        client = RecordingClient(latency=0.2)
+        queue = WriteQueue(max_delay=0, backoff=0)
+
+        started = time.perf_counter()
+        self.assertEqual(queue.submit('Posts', {'PostId': 'p1'}, 'p1', client=client), 'p1')
+        self.assertLess(time.perf_counter() - started, 0.1)
+
+        queue.flush()
+        self.assertEqual(client.calls, [('Posts', [{'PostId': 'p1'}], ['p1'])])
+
+    def test_rows_are_coalesced_per_table(self):
+        client = RecordingClient()
+        queue = WriteQueue(max_delay=60)
+
+        for i in range(5):
+            queue.submit('Posts', {'PostId': f'p{i}'}, f'p{i}', client=client)
+        queue.submit('UserTaskPlans', {'task_id': 't1'}, 't1', client=client)
+        self.assertEqual(queue.metrics()['depth'], 6)
+        queue.flush()
+
+        self.assertEqual([(table, len(rows)) for table, rows, _ in client.calls], [('Posts', 5), ('UserTaskPlans', 1)])
+        self.assertEqual(queue.metrics()['depth'], 0)
+        self.assertEqual(queue.metrics()['written'], 6)
+
+    def test_full_batch_is_written_without_waiting(self):
+        client = RecordingClient()
+        queue = WriteQueue(batch_size=3, max_delay=60)
+
+        for i in range(3):
+            queue.submit('Posts', {'PostId': f'p{i}'}, f'p{i}', client=client)
+
+        deadline = time.monotonic() + 2
+        while not client.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(client.calls[0][1]), 3)
+
+    def test_idempotency_key_drops_duplicates(self):
+        client = RecordingClient()
+        queue = WriteQueue(max_delay=60)
+
+        first = queue.submit('Posts', {'PostId': 'p1'}, 'p1', idempotency_key='post:user1:hi', client=client)
+        second = queue.submit('Posts', {'PostId': 'p2'}, 'p2', idempotency_key='post:user1:hi', client=client)
+        queue.flush()
+
+        self.assertEqual((first, second), ('p1', 'p1'))
+        self.assertEqual(client.calls, [('Posts', [{'PostId': 'p1'}], ['p1'])])
+
+    def test_failed_rows_are_retried(self):
+        client = RecordingClient(failures=2)
+        written = MagicMock()
+        queue = WriteQueue(max_delay=60, backoff=0.01)
+
+        queue.submit('Posts', {'PostId': 'p1'}, 'p1', client=client, on_written=written)
+        queue.flush()
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(queue.metrics()['retries'], 2)
+        written.assert_called_once_with({'PostId': 'p1'})
+
+    def test_rows_are_given_up_after_max_attempts(self):
+        client = RecordingClient(failures=10)
+        queue = WriteQueue(max_delay=60, max_attempts=3, backoff=0.01)
+
+        queue.submit('Posts', {'PostId': 'p1'}, 'p1', client=client)
+        queue.flush()
+
+        self.assertEqual(client.calls, [])
+        self.assertEqual(queue.metrics()['failed'], 1)
+        self.assertEqual(queue.metrics()['depth'], 0)
+
+    def test_failing_client_creation_is_retried(self):
+        client = RecordingClient()
+        queue = WriteQueue(max_delay=0, backoff=0.01)
+
+        with patch('builtins.print'), \
+                patch('write_queue.get_client', side_effect=[RuntimeError("no credentials"), client]):
+            queue.submit('Posts', {'PostId': 'p1'}, 'p1')
+            queue.flush()
+
+        self.assertEqual(client.calls, [('Posts', [{'PostId': 'p1'}], ['p1'])])
+        self.assertEqual(queue.metrics()['retries'], 1)
+        self.assertEqual(queue.metrics()['written'], 1)
+        self.assertTrue(queue._worker.is_alive())
+
+    def test_rows_are_given_up_when_no_client_can_be_created(self):
+        queue = WriteQueue(max_delay=60, max_attempts=2, backoff=0.01)
+
+        with patch('builtins.print'), \
+                patch('write_queue.get_client', side_effect=RuntimeError("no credentials")):
+            queue.submit('Posts', {'PostId': 'p1'}, 'p1')
+            queue.flush()
+
+        self.assertEqual(queue.metrics()['failed'], 1)
+        self.assertEqual(queue.metrics()['depth'], 0)
+
+    def test_raising_callback_does_not_block_flush(self):
+        client = RecordingClient()
+        written = MagicMock(side_effect=[RuntimeError("cache is down"), None])
+        queue = WriteQueue(max_delay=0, backoff=0)
+
+        with patch('builtins.print'):
+            queue.submit('Posts', {'PostId': 'p1'}, 'p1', client=client, on_written=written)
+            queue.submit('Posts', {'PostId': 'p2'}, 'p2', client=client, on_written=written)
+            flusher = threading.Thread(target=queue.flush, daemon=True)
+            flusher.start()
+            flusher.join(timeout=2)
+
+        self.assertFalse(flusher.is_alive())
+        self.assertEqual(written.call_count, 2)
+        self.assertEqual(queue.metrics()['depth'], 0)
+        self.assertEqual(queue.metrics()['written'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()